@@ -0,0 +1,91 @@
+import os
+import re
+import string
+import sys
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from string_cleaner import complex_cleaner
+from writers_and_readers import fb2reader, txt_reader, epub_reader
+
+
+"""
+Benchmark of string_cleaner.complex_cleaner() (+ lowercasing, as in corpus_processing.text_normalisation()).
+The output is checked to be byte-identical to the reference character-by-character chain.
+
+Usage:
+    python benchmarks/bench_cleaner.py [path to a book or a folder with books ...]
+Without arguments a synthetic text with all kinds of characters the cleaner deals with is used.
+"""
+
+
+READERS = {'.fb2': fb2reader, '.txt': txt_reader, '.epub': epub_reader}
+
+
+def reference_cleaner(sentence: str) -> str:
+    cleaned = []
+    for char in sentence:
+        if char.isspace():
+            cleaned.append(' ')
+        elif unicodedata.category(char).startswith(('P', 'S')):
+            continue
+        elif char in {'\u200b', '\ufeff'}:
+            cleaned.append(' ')
+        else:
+            cleaned.append(char)
+    sentence = ' '.join(''.join(cleaned).split())
+
+    sentence = sentence.translate(str.maketrans("", "", string.digits))
+    roman_pattern = r'\bM{0,4}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})\b'
+    sentence = re.sub(roman_pattern, '', sentence, flags=re.IGNORECASE)
+    return sentence.lower()
+
+
+def synthetic_text(size: int = 2_000_000) -> str:
+    piece = ('Глава XIV.\tВ 1812 году — «Ура!», — закричал он… Всё было   как прежде.\r\n'
+             'Chapter iv: 3 $ and 5 € ; zero\u200bwidth\ufeffspaces, ™ © ½ ² ٣ and İstanbul.\n')
+    return piece * (size // len(piece))
+
+
+def texts(paths: list) -> dict:
+    if not paths:
+        return {'synthetic': synthetic_text()}
+
+    books = {}
+    for path in paths:
+        files = [os.path.join(root, file) for root, _, names in os.walk(path) for file in names] \
+            if os.path.isdir(path) else [path]
+        for file in files:
+            reader = READERS.get(os.path.splitext(file)[1])
+            if reader is not None:
+                books[file] = reader(file)
+    return books
+
+
+def timed(function, books: dict) -> tuple:
+    start = time.perf_counter()
+    outputs = [function(text) for text in books.values()]
+    return time.perf_counter() - start, outputs
+
+
+def main(paths: list) -> None:
+    books = texts(paths)
+    size = sum(len(text) for text in books.values())
+    print(f'[bench_cleaner] /// {len(books)} text(s), {size} characters')
+
+    reference_time, reference = timed(reference_cleaner, books)
+    current_time, current = timed(lambda text: complex_cleaner(text).lower(), books)
+
+    mismatches = [name for name, a, b in zip(books, reference, current) if a.encode() != b.encode()]
+    print(f'[bench_cleaner] /// reference: {reference_time:.3f}s')
+    print(f'[bench_cleaner] /// current:   {current_time:.3f}s ({reference_time / current_time:.1f}x)')
+    if mismatches:
+        print(f'[bench_cleaner] /// OUTPUT DIFFERS for: {", ".join(mismatches)}')
+        sys.exit(1)
+    print('[bench_cleaner] /// outputs are byte-identical')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,62 @@
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+"""
+Benchmark of the startup: wall time of importing the entry points in a fresh interpreter
+and the heavy dependencies the import loads (they are imported lazily, on first use).
+
+Usage:
+    python benchmarks/bench_import.py [--repeats 5]
+"""
+
+
+STATEMENTS = (
+    'import main',
+    'from main import compare_authors',
+    'import service',
+    'import corpus_processing',
+    'import ml',
+)
+HEAVY_MODULES = ('nltk', 'pymorphy2', 'sklearn', 'xgboost', 'scipy', 'matplotlib', 'seaborn', 'pandas',
+                 'bs4', 'ebooklib', 'lxml')
+
+PROBE = '''
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(' '.join(name for name in {heavy!r} if name in sys.modules))
+'''
+
+
+def import_time(statement: str) -> tuple:
+    """
+    :return: (seconds the statement takes in a fresh interpreter, list of the heavy modules it has loaded)
+    """
+    probe = PROBE.format(statement=statement, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', probe], cwd=ROOT, capture_output=True, text=True, check=True)
+    elapsed, loaded = output.stdout.splitlines()[-2:]
+    return float(elapsed), loaded.split()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    for statement in STATEMENTS:
+        timings = [import_time(statement) for _ in range(args.repeats)]
+        best = min(elapsed for elapsed, _ in timings)
+        loaded = timings[-1][1]
+        print(f'[bench_import] /// {statement}: {best * 1000:.0f} ms, '
+              f'heavy modules: {", ".join(loaded) if loaded else "none"}')
+
+
+if __name__ == '__main__':
+    main()
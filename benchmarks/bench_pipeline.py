@@ -0,0 +1,311 @@
+import argparse
+import contextlib
+import gc
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import corpus_processing
+from corpus_processing import (text_normalisation, text_lemmatisation, similarity_measurer, ENGINES, EXACT_ENGINES,
+                               wholesale_processing_auth1_auth1, wholesale_processing_auth1_auth2)
+from n_grams import n_grams_main
+from statistical_methods import jaccard, tanimoto, jaccard_sorted, tanimoto_sorted
+from profiles import clear_profiles
+from feature_store import set_store
+from tokenisation import TOKENIZERS, set_tokenizer
+from metrics import peak_rss
+from main import compare_authors
+from synthetic_corpus import synthetic_corpus, write_corpus
+
+
+"""
+Benchmark suite of the corpus pipeline on a synthetic Russian-like corpus (see synthetic_corpus.py),
+so it runs offline without the literature folder. For every benchmark it reports the throughput
+(the best of the repeats; MB/s of text or pairs/s) and the peak memory allocated by Python (tracemalloc,
+measured in a separate run). Results are saved as baselines and later runs are compared against them.
+    Benchmarks:
+        text_normalisation, text_lemmatisation (with an empty lemma cache): the books as they are read
+        n_grams_main, n_grams_main[compact]: the normalised books
+        jaccard, tanimoto, jaccard_sorted, tanimoto_sorted: all the pairs of the profiled books
+        similarity_measurer[<engine>]: all the pairs of the normalised books, profiling included
+        compare_authors: a pair of books, with the model trained beforehand on the values of the corpus
+        compare_authors[cold]: the first call, when the model is trained
+Results are only comparable between runs on the same machine with the same corpus parameters and tokenizer.
+Before the benchmarks, the exact engines are checked to give the same values for every N of CHECK_ORDERS
+(the compact profiles of N > 2 hash n-grams, see n_grams.encode_n_grams()); the exit code is 1 if they do not.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--authors 4 --books 3 --words 5000] [--only n_grams] [--repeats 3]
+        [--save NAME] [--compare NAME --tolerance 0.1] [--skip-check]
+Baselines are kept in benchmarks/baselines/NAME.json; with --compare the exit code is 1 if any benchmark
+is slower than the baseline by more than the tolerance.
+"""
+
+
+BASELINES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+MB = 1e6
+# a timed run calls a fast benchmark as many times as it takes to last at least that long (as timeit does)
+MIN_RUN_TIME = 0.2
+CHECK_ORDERS = (2, 3, 4)
+
+
+def default_tokenizer() -> str:
+    # the Punkt models may be missing on an offline box, the regex tokenizer needs nothing
+    import nltk
+    try:
+        nltk.data.find('tokenizers/punkt_tab')
+        return 'punkt'
+    except LookupError:
+        return 'regex'
+
+
+def measure(function, repeats: int, warmup: bool = True) -> dict:
+    """
+    :param function: benchmark without arguments
+    :param repeats: number of timed runs
+    :param warmup: whether the function is run once before the timed runs (lazy imports, models, caches)
+    :return: {'seconds': the best time of a call, 'median_seconds': float, 'peak_memory': bytes allocated at the peak}
+    """
+    number = 1
+    if warmup:
+        start = time.perf_counter()
+        function()
+        number = max(1, math.ceil(MIN_RUN_TIME / max(time.perf_counter() - start, 1e-9)))
+    times = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+
+    # memory is measured in a run of its own, tracemalloc slows the code down
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(times), 'median_seconds': statistics.median(times), 'peak_memory': peak}
+
+
+def quietly(function):
+    # progress bars and reports of the pipeline are not a part of the output of the benchmark
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function()
+    return run
+
+
+class Suite:
+    """
+    The synthetic corpus, its derived data and the benchmarks run over them.
+    """
+
+    def __init__(self, args: argparse.Namespace, workdir: str):
+        self.args = args
+        self.workdir = workdir
+        self.corpus = synthetic_corpus(args.authors, args.books, args.words, args.vocabulary, args.seed)
+        self.texts = {name: text for books in self.corpus.values() for name, text in books.items()}
+        self.size = sum(len(text.encode('utf-8')) for text in self.texts.values()) / MB
+        self.normalised = {name: text_normalisation(text) for name, text in self.texts.items()}
+        self.normalised_size = sum(len(text.encode('utf-8')) for text in self.normalised.values()) / MB
+        self.pairs = list(itertools.combinations(self.normalised, 2))
+        self.counter_profiles = [n_grams_main(text, args.n) for text in self.normalised.values()]
+        self.compact_profiles = [n_grams_main(text, args.n, compact=True) for text in self.normalised.values()]
+        self.profile_pairs = list(itertools.combinations(range(len(self.normalised)), 2))
+
+    def benchmarks(self) -> dict:
+        """
+        :return: dictionary {name: (function, amount of work, unit of the throughput)}
+        """
+        n = self.args.n
+        counter, compact = self.counter_profiles, self.compact_profiles
+        benchmarks = {
+            'text_normalisation': (lambda: [text_normalisation(text) for text in self.texts.values()],
+                                   self.size, 'MB/s'),
+            'text_lemmatisation': (self.lemmatisation, self.size, 'MB/s'),
+            'n_grams_main': (lambda: [n_grams_main(text, n) for text in self.normalised.values()],
+                             self.normalised_size, 'MB/s'),
+            'n_grams_main[compact]': (lambda: [n_grams_main(text, n, compact=True)
+                                               for text in self.normalised.values()], self.normalised_size, 'MB/s'),
+            'jaccard': (lambda: [jaccard(counter[i][2], counter[j][2]) for i, j in self.profile_pairs],
+                        len(self.profile_pairs), 'pairs/s'),
+            'tanimoto': (lambda: [tanimoto(counter[i][0], counter[j][0]) for i, j in self.profile_pairs],
+                         len(self.profile_pairs), 'pairs/s'),
+            'jaccard_sorted': (lambda: [jaccard_sorted(compact[i].ngram_keys, compact[j].ngram_keys)
+                                        for i, j in self.profile_pairs], len(self.profile_pairs), 'pairs/s'),
+            'tanimoto_sorted': (lambda: [tanimoto_sorted(compact[i].ngram_keys, compact[i].ngram_counts,
+                                                         compact[j].ngram_keys, compact[j].ngram_counts)
+                                         for i, j in self.profile_pairs], len(self.profile_pairs), 'pairs/s'),
+        }
+        for engine in ENGINES:
+            benchmarks[f'similarity_measurer[{engine}]'] = (quietly(lambda engine=engine: self.measurer(engine)),
+                                                            len(self.pairs), 'pairs/s')
+        benchmarks['compare_authors[cold]'] = (quietly(self.compare_cold), 1, 'calls/s')
+        benchmarks['compare_authors'] = (quietly(self.compare), 1, 'calls/s')
+        return benchmarks
+
+    def lemmatisation(self):
+        corpus_processing._lemmas.clear()
+        corpus_processing.take_new_lemmas()
+        return [text_lemmatisation(text) for text in self.texts.values()]
+
+    def measurer(self, engine: str):
+        clear_profiles()
+        return similarity_measurer(self.normalised, self.normalised, self.args.n, engine)
+
+    def setup(self, name: str) -> None:
+        # the values of the corpus the model of compare_authors() is trained on (not lemmatised, N of the suite)
+        if not name.startswith('compare_authors') or os.path.isdir(os.path.join(self.workdir, 'values')):
+            return
+        write_corpus(self.corpus, os.path.join(self.workdir, 'literature'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            wholesale_processing_auth1_auth1(self.workdir, 'literature', self.args.n, lemmatised=False)
+            wholesale_processing_auth1_auth2(self.workdir, 'literature', self.args.n, lemmatised=False)
+
+    def compare_cold(self):
+        shutil.rmtree(os.path.join(self.workdir, 'models'), ignore_errors=True)
+        import model_registry
+        model_registry._models.clear()
+        return self.compare()
+
+    def compare(self):
+        author1, author2 = list(self.corpus)[:2]
+        clear_profiles()
+        return compare_authors(os.path.join(self.workdir, 'literature', author1, next(iter(self.corpus[author1]))),
+                               os.path.join(self.workdir, 'literature', author2, next(iter(self.corpus[author2]))),
+                               self.workdir, n=self.args.n, feature_store=False)
+
+
+def check_engines(normalised: dict) -> list:
+    """
+    Measures all the pairs of the books with every exact engine for every N of CHECK_ORDERS.
+
+    :param normalised: dictionary {name of the book: normalised text}
+    :return: list of (N, engine) which values differ from the ones of the 'python' engine
+    """
+    mismatches = []
+    for n in CHECK_ORDERS:
+        values = {}
+        for engine in EXACT_ENGINES:
+            clear_profiles()
+            with contextlib.redirect_stdout(io.StringIO()):
+                values[engine] = similarity_measurer(normalised, normalised, n, engine)
+        mismatches.extend((n, engine) for engine in EXACT_ENGINES if values[engine] != values['python'])
+    clear_profiles()
+    return mismatches
+
+
+def compare_results(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    :return: names of the benchmarks slower than the baseline by more than the tolerance
+    """
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        reference = baseline['benchmarks'].get(name)
+        if reference is None:
+            print(f'[bench_pipeline] /// {name}: not in the baseline')
+            continue
+        change = result['throughput'] / reference['throughput'] - 1
+        memory_change = result['peak_memory'] / reference['peak_memory'] - 1 if reference['peak_memory'] else 0.0
+        regressed = change < -tolerance
+        if regressed:
+            regressions.append(name)
+        print(f'[bench_pipeline] /// {name}: {reference["throughput"]:.4g} -> {result["throughput"]:.4g} '
+              f'{result["unit"]} ({change:+.1%}), peak memory {memory_change:+.1%}'
+              + (' REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite of the corpus pipeline on a synthetic corpus')
+    parser.add_argument('--authors', type=int, default=4)
+    parser.add_argument('--books', type=int, default=3, help='books of every author')
+    parser.add_argument('--words', type=int, default=5_000, help='words of every book')
+    parser.add_argument('--vocabulary', type=int, default=20_000, help='pseudo-words of the corpus')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--n', type=int, default=3)
+    parser.add_argument('--tokenizer', choices=tuple(TOKENIZERS), help='punkt if its models are installed, '
+                                                                        'regex otherwise')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--only', nargs='+', help='run the benchmarks which names contain any of these')
+    parser.add_argument('--save', metavar='NAME', help='save the results as the baseline NAME')
+    parser.add_argument('--compare', metavar='NAME', help='compare the results with the baseline NAME')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='slowdown that is a regression')
+    parser.add_argument('--skip-check', action='store_true', help='do not check that the exact engines agree')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINES_FOLDER, f'{args.compare}.json'), encoding='utf-8') as f:
+            baseline = json.load(f)
+    tokenizer = args.tokenizer or (baseline['parameters']['tokenizer'] if baseline else default_tokenizer())
+
+    parameters = {'authors': args.authors, 'books': args.books, 'words': args.words, 'vocabulary': args.vocabulary,
+                  'seed': args.seed, 'n': args.n, 'tokenizer': tokenizer}
+    if baseline is not None and baseline['parameters'] != parameters:
+        parser.error(f'the baseline {args.compare} is measured with other parameters: {baseline["parameters"]}')
+
+    set_tokenizer(tokenizer)
+    set_store(None)
+    workdir = tempfile.mkdtemp(prefix='litsim_bench_')
+    try:
+        suite = Suite(args, workdir)
+        print(f'[bench_pipeline] /// {len(suite.texts)} book(s), {suite.size:.1f} MB, {len(suite.pairs)} pair(s), '
+              f'tokenizer {tokenizer}')
+        mismatches = [] if args.skip_check else check_engines(suite.normalised)
+        if mismatches:
+            print(f'[bench_pipeline] /// The values differ from the ones of the python engine: '
+                  f'{", ".join(f"{engine} (N={n})" for n, engine in mismatches)}')
+        elif not args.skip_check:
+            print(f'[bench_pipeline] /// The exact engines give the same values for N in {CHECK_ORDERS}')
+        results = {'parameters': parameters,
+                   'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                                   'processor': platform.processor(), 'cpus': os.cpu_count()},
+                   'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'benchmarks': {}}
+        for name, (function, work, unit) in suite.benchmarks().items():
+            if args.only and not any(part in name for part in args.only):
+                continue
+            suite.setup(name)
+            cold = name.endswith('[cold]')
+            result = measure(function, 1 if cold else args.repeats, warmup=not cold)
+            result.update(throughput=work / result['seconds'], unit=unit)
+            results['benchmarks'][name] = result
+            print(f'[bench_pipeline] /// {name}: {result["throughput"]:.4g} {unit} '
+                  f'(best {result["seconds"] * 1000:.1f} ms, median {result["median_seconds"] * 1000:.1f} ms), '
+                  f'peak memory {result["peak_memory"] / 2 ** 20:.1f} MB')
+        results['peak_rss'] = peak_rss()
+    finally:
+        set_tokenizer()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        os.makedirs(BASELINES_FOLDER, exist_ok=True)
+        with open(os.path.join(BASELINES_FOLDER, f'{args.save}.json'), 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f'[bench_pipeline] /// Baseline {args.save} saved')
+    regressions = []
+    if baseline is not None:
+        regressions = compare_results(results, baseline, args.tolerance)
+        if regressions:
+            print(f'[bench_pipeline] /// {len(regressions)} regression(s): {", ".join(regressions)}')
+    if regressions or mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import library_books
+from service import SimilarityService, ServiceClient, make_server
+
+
+"""
+Benchmark of the similarity service: throughput and latency percentiles of /compare requests
+sent by concurrent clients (the service is started in this process, requests go over HTTP).
+
+Usage:
+    python benchmarks/bench_service.py --stats-path path/to/project/root/ --books path/to/literature/
+"""
+
+
+def percentile(values: list, share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stats-path', required=True)
+    parser.add_argument('--books', required=True, help='folder with books the pairs are taken from')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--n', type=int, default=3)
+    args = parser.parse_args()
+
+    books = list(library_books(args.books))
+    pairs = [(books[i % len(books)], books[(i * 7 + 1) % len(books)]) for i in range(args.requests)]
+
+    service = SimilarityService(args.stats_path, workers=args.workers, max_pending=args.requests, n=args.n)
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = ServiceClient(port=server.server_address[1])
+
+    # the first requests profile the books, the measured ones find them in memory
+    for book1, book2 in pairs[:len(books)]:
+        client.compare(book1, book2, n=args.n)
+
+    def timed_request(pair):
+        start = time.perf_counter()
+        client.compare(*pair, n=args.n)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as clients:
+        latencies = list(clients.map(timed_request, pairs))
+    elapsed = time.perf_counter() - start
+
+    print(f'[bench_service] /// {len(pairs)} requests, {args.clients} clients, {args.workers} workers')
+    print(f'[bench_service] /// throughput: {len(pairs) / elapsed:.1f} requests/s')
+    print(f'[bench_service] /// latency p50: {percentile(latencies, 0.5) * 1000:.1f} ms, '
+          f'p99: {percentile(latencies, 0.99) * 1000:.1f} ms')
+
+    server.shutdown()
+    service.shutdown()
+
+
+if __name__ == '__main__':
+    main()
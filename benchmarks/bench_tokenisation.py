@@ -0,0 +1,119 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus_processing import READERS, book_files, book_pairs, pair_similarity, text_lemmatisation, text_normalisation
+from profiles import book_profile, clear_profiles
+from tokenisation import TOKENIZERS, get_tokenizer, set_tokenizer
+
+
+"""
+Benchmark of the tokenizers (see tokenisation.py): throughput of splitting the books into sentences and words
+(as corpus_processing.lemmatised_sentences() does), agreement of the sentences and words with the 'punkt' ones,
+and the differences of the features measured on the books lemmatised with each tokenizer.
+
+Usage:
+    python benchmarks/bench_tokenisation.py [path to a book or a folder with books ...] [--chars 200000] [--n 3]
+Without paths synthetic books are used.
+"""
+
+
+def synthetic_books(amount: int = 4, sentences: int = 4000) -> dict:
+    pool = ['Глава XIV.', 'В 1812 г. Москва горела три дня.', 'А. С. Пушкин написал «Евгения Онегина».',
+            'Он сказал: «Пойдём!» — и вышел.', 'Что же делать?', 'Так и было… Никто не спорил.',
+            'Т. е. всё осталось как прежде, и т. д.', 'Она молчала; он ждал ответа.',
+            '— Кто-то стучит, — прошептала она.', 'Ул. Гороховая, дом 5.', 'Было 3 ч. утра.',
+            'Ветер выл, снег шёл (как всегда в декабре).', 'Mr. Smith came at 5 p.m. yesterday.']
+    books = {}
+    for idx in range(amount):
+        rng = random.Random(idx)
+        books[f'synthetic_{idx}.txt'] = ' '.join(rng.choice(pool) for _ in range(sentences))
+    return books
+
+
+def read_books(paths: list, chars: int) -> dict:
+    books = {}
+    for path in paths:
+        files = [(os.path.basename(path), path)] if os.path.isfile(path) else book_files(path)
+        for name, full_path in files:
+            text = READERS[os.path.splitext(full_path)[1]](full_path)
+            books[name] = text[:chars]
+    return books
+
+
+def tokenize(books: dict) -> tuple:
+    tokenizer = get_tokenizer()
+    start = time.perf_counter()
+    sentences = {name: tokenizer.sentences(text, 'russian') for name, text in books.items()}
+    words = {name: [tokenizer.words(sentence, 'russian') for sentence in book_sentences]
+             for name, book_sentences in sentences.items()}
+    return time.perf_counter() - start, sentences, words
+
+
+def agreement(reference: dict, other: dict) -> float:
+    # share of the reference items (sentences or words) found in the other tokenization, book by book
+    matched = total = 0
+    for name, items in reference.items():
+        other_items = {}
+        for item in other[name]:
+            other_items[item] = other_items.get(item, 0) + 1
+        for item in items:
+            total += 1
+            if other_items.get(item, 0):
+                other_items[item] -= 1
+                matched += 1
+    return matched / total if total else 1.0
+
+
+def features(books: dict, n: int) -> dict:
+    clear_profiles()
+    texts = {name: text_normalisation(text_lemmatisation(text)) for name, text in books.items()}
+    profiles = {name: book_profile(text, n) for name, text in texts.items()}
+    return {(name1, name2): pair_similarity(profiles[name1], profiles[name2])
+            for name1, name2 in book_pairs(texts, texts)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('paths', nargs='*')
+    parser.add_argument('--chars', type=int, default=200_000, help='characters of every book to take')
+    parser.add_argument('--n', type=int, default=3)
+    args = parser.parse_args()
+
+    books = read_books(args.paths, args.chars) if args.paths else synthetic_books()
+    size = sum(len(text.encode('utf-8')) for text in books.values()) / 1e6
+    print(f'[bench_tokenisation] /// {len(books)} book(s), {size:.1f} MB')
+
+    results = {}
+    for name in TOKENIZERS:
+        set_tokenizer(name)
+        tokenize(books)  # the models are loaded and the patterns are compiled before the timing
+        elapsed, sentences, words = min((tokenize(books) for _ in range(3)), key=lambda result: result[0])
+        results[name] = (sentences, words, features(books, args.n))
+        print(f'[bench_tokenisation] /// {name}: {size / elapsed:.2f} MB/s, '
+              f'{sum(map(len, sentences.values()))} sentences')
+    set_tokenizer()
+
+    reference_sentences, reference_words, reference_features = results['punkt']
+    for name, (sentences, words, measured) in results.items():
+        if name == 'punkt':
+            continue
+        flat_reference = {book: [word for sentence in reference_words[book] for word in sentence]
+                          for book in reference_words}
+        flat_words = {book: [word for sentence in words[book] for word in sentence] for book in words}
+        print(f'[bench_tokenisation] /// {name} vs punkt: '
+              f'{agreement(reference_sentences, sentences):.1%} of the sentences, '
+              f'{agreement(flat_reference, flat_words):.1%} of the words are the same')
+        for measure in next(iter(reference_features.values()), {}):
+            differences = [abs(measured[pair][measure] - values[measure])
+                           for pair, values in reference_features.items()]
+            print(f'[bench_tokenisation] /// {name} vs punkt: {measure} '
+                  f'max abs difference {max(differences):.6f}, mean {sum(differences) / len(differences):.6f}')
+
+
+if __name__ == '__main__':
+    main()
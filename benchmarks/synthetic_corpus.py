@@ -0,0 +1,131 @@
+import os
+import random
+
+
+"""
+Synthetic Russian-like corpora for the benchmarks, so that they run offline without the literature folder.
+Books are made of frequent Russian words and pseudo-words (Cyrillic syllables with Russian endings, so that
+pymorphy2 has to guess their lemmas, as it does for rare words) drawn from a Zipfian distribution.
+Every author has a vocabulary ranking, sentence lengths and punctuation of their own, so the books of an author
+are more alike than the books of different authors (and a classifier can be trained on them).
+The same seed always gives the same corpus.
+"""
+
+
+COMMON_WORDS = (
+    'и в не он на я что с а как она по но они к у ты из мы за вы так же от это все его было только уже '
+    'когда вот кто да еще бы сказал был нет о ни для до даже если или теперь там ну под где есть раз чтобы '
+    'себя тогда ведь свою человек время жизнь глаза руки день дом слово место лицо друг голова дело '
+    'сторону работу дверь ночь город отец мать земля вода окно дорогу книгу утро вечер года минуту '
+    'сказала спросил ответил подумал знал видел хотел стал могу может надо нужно очень сразу почти вдруг '
+    'потом опять снова всегда никогда здесь тут совсем просто тоже хорошо долго тихо большой старый новый '
+    'молодой последний первый белый черный маленький русский другой каждый который такой этот тот свой '
+    'наш ваш мой твой один два три несколько много всех всем ему ей им нам вам меня тебя нас вас'
+).split()
+SYLLABLES = ('ба', 'ве', 'ви', 'го', 'да', 'де', 'жи', 'за', 'зо', 'ка', 'ко', 'ла', 'ли', 'ло', 'ма', 'ме', 'ми',
+             'на', 'не', 'но', 'пе', 'по', 'пра', 'ре', 'ро', 'ру', 'са', 'се', 'ско', 'сте', 'та', 'то', 'ту',
+             'фе', 'хо', 'ча', 'че', 'ша', 'що', 'бре', 'гра', 'дво', 'кру', 'мля', 'сви', 'тве', 'чу', 'ю')
+ENDINGS = ('', 'а', 'ы', 'у', 'ой', 'ом', 'е', 'ами', 'ах', 'ий', 'ая', 'ое', 'ые', 'ого', 'ому', 'ть', 'ет',
+           'ют', 'ил', 'ила', 'или', 'ость', 'ение', 'ения', 'ски')
+ROMAN = ('I', 'II', 'III', 'IV', 'V', 'VI', 'VII', 'VIII', 'IX', 'X', 'XI', 'XII', 'XIV', 'XX')
+
+
+def pseudo_words(amount: int, seed: int) -> list:
+    """
+    :return: list of distinct Russian-like words
+    """
+    rng = random.Random(f'pseudo-words-{seed}')
+    words = []
+    seen = set(COMMON_WORDS)
+    while len(words) < amount:
+        word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3))) + rng.choice(ENDINGS)
+        if len(word) > 1 and word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+class AuthorStyle:
+    """
+    The vocabulary ranking (shared words in an order of the author's own), sentence lengths and punctuation
+    of a synthetic author.
+    """
+
+    def __init__(self, author: int, vocabulary: list, seed: int):
+        rng = random.Random(f'author-{seed}-{author}')
+        ranking = list(vocabulary)
+        # the head of the distribution is shuffled a little, the tail of it a lot
+        for start, end, swaps in ((0, 60, 15), (60, len(ranking), len(ranking) // 2)):
+            for _ in range(swaps):
+                i, j = rng.randrange(start, end), rng.randrange(start, end)
+                ranking[i], ranking[j] = ranking[j], ranking[i]
+        self.words = ranking
+        self.weights = [1 / (rank + 1) ** rng.uniform(1.0, 1.2) for rank in range(len(ranking))]
+        self.sentence_length = rng.randint(7, 16)
+        self.comma = rng.uniform(0.05, 0.15)
+        self.endings = rng.choices(['.', '.', '.', '!', '?', '…'], k=8)
+        self.dialogues = rng.uniform(0.0, 0.3)
+
+
+def synthetic_book(style: AuthorStyle, words: int, seed) -> str:
+    """
+    :param style: the author of the book
+    :param words: number of words of the book (roughly)
+    :param seed: seed of the book
+    :return: text of the book; paragraphs are lines
+    """
+    rng = random.Random(seed)
+    paragraphs = []
+    written = 0
+    chapter = 0
+    while written < words:
+        if rng.random() < 0.02:
+            paragraphs.append(f'Глава {ROMAN[chapter % len(ROMAN)]}.')
+            chapter += 1
+        sentences = []
+        for _ in range(rng.randint(2, 7)):
+            length = max(2, int(rng.gauss(style.sentence_length, style.sentence_length / 3)))
+            tokens = rng.choices(style.words, style.weights, k=length)
+            if rng.random() < 0.03:
+                tokens.insert(rng.randrange(length), f'в {rng.randint(1700, 1990)} году')
+            sentence = []
+            for idx, token in enumerate(tokens):
+                sentence.append(token + (',' if idx < length - 1 and rng.random() < style.comma else ''))
+            sentences.append(' '.join(sentence).capitalize() + rng.choice(style.endings))
+            written += length
+        paragraph = ' '.join(sentences)
+        if rng.random() < style.dialogues:
+            paragraph = f'— {paragraph[:-1]}, — {rng.choice(("сказал", "ответила", "спросил"))} он.'
+        paragraphs.append(paragraph)
+    return '\n'.join(paragraphs) + '\n'
+
+
+def synthetic_corpus(authors: int = 4, books: int = 3, words: int = 20_000, vocabulary: int = 20_000,
+                     seed: int = 42) -> dict:
+    """
+    :param authors: number of authors
+    :param books: number of books of every author
+    :param words: number of words of every book
+    :param vocabulary: number of pseudo-words (besides COMMON_WORDS)
+    :param seed: seed of the corpus
+    :return: dictionary {name of the author's folder: {name of the book: text}}
+    """
+    shared = COMMON_WORDS + pseudo_words(vocabulary, seed)
+    corpus = {}
+    for author in range(authors):
+        style = AuthorStyle(author, shared, seed)
+        corpus[f'author{author}'] = {f'book_{author}_{book}.txt': synthetic_book(style, words,
+                                                                                 f'book-{seed}-{author}-{book}')
+                                     for book in range(books)}
+    return corpus
+
+
+def write_corpus(corpus: dict, path: str) -> None:
+    """
+    Writes the corpus as the literature folder: a folder per author with .txt books.
+    """
+    for folder, books in corpus.items():
+        os.makedirs(os.path.join(path, folder), exist_ok=True)
+        for name, text in books.items():
+            with open(os.path.join(path, folder, name), 'w', encoding='utf-8') as f:
+                f.write(text)
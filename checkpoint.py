@@ -0,0 +1,132 @@
+import json
+import os
+import time
+
+from metrics import stage, count
+
+
+"""
+This module implements checkpoints of the output files being measured, so that an interrupted build
+(a crash, Ctrl-C) resumes from the last checkpointed pair instead of measuring the whole output file again.
+A checkpoint is an append-only log next to the output file (<output file>.partial.jsonl):
+    the first line: {"books": {author's folder: {name of the book: digest of its text}}}
+        i.e. the versions of the books the logged values are measured on
+    every other line: [name of the first book, name of the second book, {name of the measure: value}]
+Values are appended in batches (every CHECKPOINT_PAIRS pairs or CHECKPOINT_INTERVAL seconds) and the batch is
+flushed to the disk, so a crash loses at most one batch; a torn last line is ignored when the log is loaded.
+The log is removed once the output file is written (see corpus_processing.write_values()).
+Values are JSON numbers, so the resumed values are exactly the measured ones.
+"""
+
+
+CHECKPOINT_SUFFIX = '.partial.jsonl'
+CHECKPOINT_PAIRS = 256
+CHECKPOINT_INTERVAL = 10.0
+
+
+def checkpoint_path(output_path: str) -> str:
+    return output_path + CHECKPOINT_SUFFIX
+
+
+def load_checkpoint(filepath: str, books: dict, folder1: str, folder2: str) -> dict:
+    """
+    Loads the values of the checkpoint that are measured on the current versions of the books.
+
+    :param filepath: path to the checkpoint
+    :param books: current digests of the books {author's folder: {name of the book: digest}}
+    :param folder1: name of the first author's folder
+    :param folder2: name of the second author's folder
+    :return: dictionary of the form {(name of the first book, name of the second book): {name of the measure: value}};
+    empty if there is no checkpoint
+    """
+    if not os.path.exists(filepath):
+        return {}
+
+    values = {}
+    with open(filepath, encoding='utf-8') as f:
+        try:
+            logged_books = json.loads(f.readline())['books']
+        except (ValueError, KeyError, TypeError):
+            return {}
+        books1 = logged_books.get(folder1, {})
+        books2 = logged_books.get(folder2, {})
+        for line in f:
+            try:
+                text1, text2, pair_values = json.loads(line)
+            except ValueError:
+                # the last line of an interrupted write
+                break
+            digest1 = books[folder1].get(text1)
+            digest2 = books[folder2].get(text2)
+            if digest1 is not None and digest2 is not None \
+                    and books1.get(text1) == digest1 and books2.get(text2) == digest2:
+                values[text1, text2] = pair_values
+    return values
+
+
+def remove_checkpoint(output_path: str) -> None:
+    filepath = checkpoint_path(output_path)
+    if os.path.exists(filepath):
+        os.remove(filepath)
+
+
+class CheckpointLog:
+    """
+    Append-only log of the measured pairs of an output file; use it as a context manager (or close() it),
+    so that the pairs measured before an interruption are flushed as well.
+    The log is opened only to append a batch, so any number of logs can be kept at once.
+
+    :param output_path: path to the output file
+    :param books: current digests of the books {author's folder: {name of the book: digest}}
+    :param resumed: values loaded with load_checkpoint(); they are kept in the log
+    """
+
+    def __init__(self, output_path: str, books: dict, resumed: dict = None):
+        self.filepath = checkpoint_path(output_path)
+        self.books = books
+        self.resumed = resumed or {}
+        self._started = False
+        self._pending = []
+        self._flushed_at = time.monotonic()
+
+    def add(self, text1: str, text2: str, pair_values: dict) -> None:
+        self._pending.append(json.dumps([text1, text2, pair_values], ensure_ascii=False) + '\n')
+        if len(self._pending) >= CHECKPOINT_PAIRS or time.monotonic() - self._flushed_at >= CHECKPOINT_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        self._flushed_at = time.monotonic()
+        if not self._pending:
+            return
+
+        with stage('write', self.filepath):
+            if self._started:
+                with open(self.filepath, 'a', encoding='utf-8') as f:
+                    start = f.tell()
+                    f.write(''.join(self._pending))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    count('write', bytes=f.tell() - start)
+            else:
+                # the log is started anew with the current versions of the books and the resumed values
+                tmp_path = f'{self.filepath}.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(json.dumps({'books': self.books}, ensure_ascii=False) + '\n')
+                    for (text1, text2), pair_values in self.resumed.items():
+                        f.write(json.dumps([text1, text2, pair_values], ensure_ascii=False) + '\n')
+                    f.write(''.join(self._pending))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    count('write', bytes=f.tell())
+                os.replace(tmp_path, self.filepath)
+                self._started = True
+        self._pending = []
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
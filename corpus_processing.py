@@ -1,66 +1,149 @@
-from writers_and_readers import txt_writer, fb2reader, txt_reader, epub_reader
-from string_cleaner import complex_cleaner
-from statistical_methods import jaccard, tanimoto
-from n_grams import n_grams_main
-
-import nltk
-import pymorphy2
+from writers_and_readers import txt_stream_writer, fb2reader, txt_reader, epub_reader, book_pieces
+from string_cleaner import complex_cleaner, stream_cleaner
+from statistical_methods import jaccard, tanimoto, jaccard_sorted, tanimoto_sorted
+from profiles import book_profile, corpus_profiles, clear_profiles, profile_by_digest, text_digest, set_sweep
+from n_grams import CompactProfile
+from similarity_matrix import similarity_matrices, pairs_stats
+from minhash import MinHashProfile, approximate_similarity, error_bound, NUM_PERM
+from feature_store import set_store, get_store, file_digest, load_text, save_text
+from feature_table import save_feature_table, load_feature_table, FEATURE_TABLE_EXT
+from manifest import manifest_path, load_manifest, save_manifest, recorded_book, valid_values, record_output
+from pair_scheduler import PairSchedule, unordered_pairs, chunked
+from checkpoint import CheckpointLog, checkpoint_path, load_checkpoint, remove_checkpoint
+from tokenisation import get_tokenizer, set_tokenizer, DEFAULT_TOKENIZER, TOKENIZERS
+from metrics import recording, stage, timed, count, is_recording, start_worker_metrics, take_metrics, merge_metrics
 
 import os
+import re
 import itertools
-import math
-
-from progress_monitor import progress_bar
-
-
-morph = pymorphy2.MorphAnalyzer()
+import json
+import gzip
+import shutil
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from progress_monitor import Progress, start_shared_progress, stop_shared_progress, set_progress_counter, \
+    report_progress, flush_progress
+
+
+# pymorphy2.MorphAnalyzer, created by get_morph() when the first word is lemmatised (loading its dictionaries is slow)
+morph = None
+
+# word form -> lemma from the least to the most recently used; Russian prose is Zipfian, so most of the tokens
+# are parsed only once; the least recently used word forms are evicted beyond LEMMA_CACHE_SIZE
+_lemmas = OrderedDict()
+# word forms parsed since the last take_new_lemmas() call; None unless they are collected (see record_new_lemmas())
+_new_lemmas = None
+LEMMA_CACHE_SIZE = 2_000_000
+LEMMA_CACHE_FILENAME = 'lemma_cache.json.gz'
+# the name of the tokenizer the lemmatised corpus is made with (a hidden file, so it is never taken for a book)
+TOKENIZER_FILENAME = '.tokenizer'
+
+# 'python' scores the pairs over Counters and sets, 'numpy' over n_grams.CompactProfile arrays,
+# 'matrix' scores all the pairs at once with sparse matrix products (see similarity_matrix.py);
+# all of them give the same values (for N > 2 the compact profiles hash n-grams into 64-bit keys, so the values
+# of 'numpy' and 'matrix' could differ if two n-grams of the corpus shared a key, see n_grams.encode_n_grams()).
+# 'minhash' estimates the values with MinHash signatures (see minhash.py), it is for large corpora only:
+# candidate search and approximate comparisons, never the values the classifier is trained on.
+# values: the profile form (see profiles.PROFILE_FORMS) the engine works with
+ENGINE_FORMS = {'python': 'counter', 'numpy': 'compact', 'matrix': 'compact', 'minhash': 'minhash'}
+ENGINES = tuple(ENGINE_FORMS)
+# the engines the values/ folders (the training data of ml.py) are measured with
+EXACT_ENGINES = ('python', 'numpy', 'matrix')
+
+READERS = {'.fb2': fb2reader, '.txt': txt_reader, '.epub': epub_reader}
+
+# a piece of a book that ends like this most likely ends a sentence as well (ellipses often do not)
+SENTENCE_END = re.compile(r"(?<![.…])[.!?][\"'»”)\]]*\s*$")
+
+# number of book pairs scored by a worker process at once
+PAIRS_CHUNK_SIZE = 64
+
+N_GRAMS_CONFIGURATION = (2, 3, 4)
+LEMMATISATION_CONFIGURATION = (True, False)
+
+# normalised texts kept in memory while all the N of a lemmatisation setting are processed
+# (see _configurations_processing()); None when they are not kept
+_texts = None
+
+
+def check_exact_engine(engine: str) -> None:
+    """
+    Raises ValueError unless the engine gives exact values, so approximate ones never end up in the training data.
+    """
+    if engine not in EXACT_ENGINES:
+        raise ValueError(f'The values are measured with one of {EXACT_ENGINES}, not {engine!r} '
+                         f'(approximate values are not written to the training data)')
 
 
-def text_fetcher(repo_path: str) -> dict:
+def book_files(repo_path: str):
     """
-    This function reads and formats texts, normalises them and puts into a dictionary,
-    so that it would be easily accessible.
+    Yields the books of the folder (subfolders are walked as well) that can be read with READERS.
 
     :param repo_path: path to the folder with books
-    :return: dictionary of the form {name of the book: text}
+    :return: generator of (name of the book, full path to the book)
     """
-
-    litcorpus = {}
     for root, _, files in os.walk(repo_path):
         for file in files:
             if file.startswith('.'):
                 continue
+            if os.path.splitext(file)[1] not in READERS:
+                continue
+            yield file, os.path.join(root, file)
 
-            full_path = os.path.join(root, file)
-            if file.endswith('.fb2'):
-                try:
-                    text = fb2reader(full_path)
-                    text = text_normalisation(text)
-                    litcorpus.update({file: text})
 
-                except Exception as e:
-                    print(f'An error {e} occurred!')
-                    continue
+def fetch_text(full_path: str) -> str:
+    """
+    Reads and normalises the book.
+    If the feature store is set, normalised texts are taken from it and only new or changed books are processed.
+
+    :param full_path: path to the book
+    :return: normalised text
+    """
+    if _texts is None:
+        return _fetch_text(full_path)
+
+    stat = os.stat(full_path)
+    key = (full_path, stat.st_size, stat.st_mtime_ns)
+    text = _texts.get(key)
+    if text is None:
+        text = _texts[key] = _fetch_text(full_path)
+    return text
 
-            elif file.endswith('.txt'):
-                try:
-                    text = txt_reader(full_path)
-                    text = text_normalisation(text)
-                    litcorpus.update({file: text})
 
-                except Exception as e:
-                    print(f'An error {e} occurred!')
-                    continue
+def _fetch_text(full_path: str) -> str:
+    store_path = get_store()
+    if store_path is None:
+        return book_normalisation(full_path)
 
-            elif file.endswith('.epub'):
-                try:
-                    text = epub_reader(full_path)
-                    text = text_normalisation(text)
-                    litcorpus.update({file: text})
+    digest = file_digest(full_path)
+    with stage('read', full_path):
+        text = load_text(store_path, digest)
+    if text is None:
+        text = book_normalisation(full_path)
+        save_text(store_path, digest, text)
+    return text
+
+
+def text_fetcher(repo_path: str) -> dict:
+    """
+    This function reads and formats texts, normalises them and puts into a dictionary,
+    so that it would be easily accessible (all the normalised texts are kept in memory at once).
+
+    :param repo_path: path to the folder with books
+    :return: dictionary of the form {name of the book: text}
+    """
 
-                except Exception as e:
-                    print(f'An error {e} occurred!')
-                    continue
+    litcorpus = {}
+    for file, full_path in book_files(repo_path):
+        try:
+            text = fetch_text(full_path)
+            litcorpus.update({file: text})
+
+        except Exception as e:
+            print(f'An error {e} occurred!')
+            continue
 
     return litcorpus
 
@@ -74,16 +157,128 @@ def text_lemmatisation(text: str) -> str:
     if not isinstance(text, str):
         return ''
 
-    lemmatised_text = ''
-    sentences = nltk.tokenize.sent_tokenize(text, "russian")
+    with stage('lemmatise'):
+        return ''.join(lemmatised_sentences(text))
+
+
+def lemmatised_sentences(text: str):
+    """
+    Yields lemmatised sentences of the text (see text_lemmatisation()).
+    """
+    tokenizer = get_tokenizer()
+    sentences = tokenizer.sentences(text, 'russian')
     for sentence in sentences:
-        sentence = nltk.tokenize.word_tokenize(sentence, "russian")
+        sentence = tokenizer.words(sentence, 'russian')
         if len(sentence) == 0:
             continue
-        lemmatised_sentence = [morph.parse(i)[0].normal_form for i in sentence]
-        lemmatised_text += ' '.join(lemmatised_sentence)
+        count('lemmatise', tokens=len(sentence))
+        yield ' '.join(lemmatise_word(i) for i in sentence)
+
+
+def sentence_chunks(pieces):
+    """
+    Groups the pieces of a book (see writers_and_readers.book_pieces()) into chunks that end sentences,
+    so that the chunks could be split into sentences one by one instead of the whole text.
+    """
+    chunk = []
+    for piece in pieces:
+        chunk.append(piece)
+        if SENTENCE_END.search(piece):
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def get_morph():
+    global morph
+    if morph is None:
+        import pymorphy2
+        morph = pymorphy2.MorphAnalyzer()
+    return morph
+
+
+def lemmatise_word(word: str) -> str:
+    """
+    Returns the normal form of the word, parsing it with pymorphy2 only if it is not in the cache.
+    """
+    lemma = _lemmas.get(word)
+    if lemma is not None:
+        try:
+            _lemmas.move_to_end(word)
+        except KeyError:
+            pass  # evicted by another thread in the meantime
+        return lemma
+
+    lemma = get_morph().parse(word)[0].normal_form
+    remember_lemma(word, lemma)
+    if _new_lemmas is not None:
+        _new_lemmas[word] = lemma
+    return lemma
+
+
+def remember_lemma(word: str, lemma: str) -> None:
+    """
+    Puts the lemma of the word form into the cache, evicting the least recently used one if the cache is full.
+    """
+    _lemmas[word] = lemma
+    _lemmas.move_to_end(word)
+    while len(_lemmas) > LEMMA_CACHE_SIZE:
+        try:
+            _lemmas.popitem(last=False)
+        except KeyError:
+            break
+
+
+def load_lemma_cache(cache_path: str) -> None:
+    """
+    Loads word form -> lemma pairs saved by save_lemma_cache() (if there are any).
+
+    :param cache_path: path to the cache file
+    :return: None
+    """
+    if not os.path.exists(cache_path):
+        return
+    with gzip.open(cache_path, 'rt', encoding='utf-8') as f:
+        # the pairs are saved from the least to the most recently used
+        for word, lemma in json.load(f).items():
+            remember_lemma(word, lemma)
+
+
+def save_lemma_cache(cache_path: str) -> None:
+    """
+    Saves word form -> lemma pairs, so that the next runs would not parse the same word forms again.
+
+    :param cache_path: path to the cache file
+    :return: None
+    """
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with stage('write', cache_path):
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=1) as f:
+            json.dump(_lemmas, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+        count('write', bytes=os.path.getsize(cache_path))
+
+
+def record_new_lemmas() -> None:
+    """
+    Starts collecting the word forms parsed in this process (e.g. in a worker process that sends them back,
+    see _lemmatise_file_task()); they are not collected by default, so they never pile up uncollected.
+    """
+    global _new_lemmas
+    if _new_lemmas is None:
+        _new_lemmas = {}
+
 
-    return lemmatised_text
+def take_new_lemmas() -> dict:
+    """
+    :return: word form -> lemma pairs parsed since the last call (empty unless record_new_lemmas() is called)
+    """
+    if _new_lemmas is None:
+        return {}
+    new_lemmas = dict(_new_lemmas)
+    _new_lemmas.clear()
+    return new_lemmas
 
 
 def text_normalisation(text: str) -> str:
@@ -95,18 +290,47 @@ def text_normalisation(text: str) -> str:
     :return: normalised book text
     """
 
-    text = complex_cleaner(text)
-    text = text.lower()
+    with stage('clean'):
+        text = complex_cleaner(text)
+        text = text.lower()
     return text
 
 
-def corpus_lemmatisation(base_path: str, lit_folder_name: str) -> None:
+def book_normalisation(full_path: str) -> str:
+    """
+    text_normalisation() of the book that is read and cleaned piece by piece,
+    so that the raw text of the book is never kept in memory as a whole.
+    Only reading and cleaning are streamed: the normalised text is joined into one string, since it is digested,
+    stored and profiled as a whole (see profiles.text_digest()), so the peak memory is still about
+    the size of the normalised book.
+
+    :param full_path: path to the book
+    :return: normalised book text
+    """
+    def normalised_book():
+        return ' '.join(piece.lower() for piece in stream_cleaner(timed('read', book_pieces(full_path), full_path)))
+
+    with stage('clean', full_path):
+        count('read', bytes=os.path.getsize(full_path), item=full_path)
+        try:
+            return normalised_book()
+        except UnicodeDecodeError:
+            # the encoding sniffed by the beginning of the book was wrong; the right one is known now
+            return normalised_book()
+
+
+def corpus_lemmatisation(base_path: str, lit_folder_name: str, workers: int = 1) -> None:
     """
     This function applies text_lemmatisation() to the user's literature corpus while also
-    monitoring that the elements that had already been lemmatised would not be processed once again.
+    monitoring that the elements that had already been lemmatised would not be processed once again
+    (unless they have changed since); lemmatised versions of removed books are removed.
+    Lemmas of word forms are cached in LEMMA_CACHE_FILENAME and reused between runs.
+    The tokenizer the corpus is lemmatised with is recorded in TOKENIZER_FILENAME,
+    the whole corpus is lemmatised anew if another tokenizer is set (see tokenisation.py).
 
     :param base_path: path to the directory (without the folder that stores literature)
     :param lit_folder_name: name of the folder that stores literature
+    :param workers: number of worker processes; 1 means serial processing
     :return: None
     """
 
@@ -115,7 +339,15 @@ def corpus_lemmatisation(base_path: str, lit_folder_name: str) -> None:
     output_dir = os.path.join(base_path, f"{lit_folder_name}_lemmatised")
     os.makedirs(output_dir, exist_ok=True)
 
+    tokenizer = get_tokenizer().name
+    tokenizer_path = os.path.join(output_dir, TOKENIZER_FILENAME)
+    recorded_tokenizer = DEFAULT_TOKENIZER
+    if os.path.exists(tokenizer_path):
+        with open(tokenizer_path, encoding='utf-8') as f:
+            recorded_tokenizer = f.read().strip()
+
     files_to_lemmatise = []
+    expected_paths = set()
     for root, _, files in os.walk(input_dir):
         for file in files:
             if file.startswith('.'):
@@ -131,126 +363,439 @@ def corpus_lemmatisation(base_path: str, lit_folder_name: str) -> None:
             # Ensure the output has a .txt extension
             lemmatised_path = os.path.join(output_dir, os.path.splitext(rel_path)[0] + '.txt')
 
-            # Only add to the processing list if not already lemmatised
-            if not os.path.exists(lemmatised_path):
+            expected_paths.add(lemmatised_path)
+
+            # Only add to the processing list if not already lemmatised (or changed since)
+            if not os.path.exists(lemmatised_path) or recorded_tokenizer != tokenizer \
+                    or os.path.getmtime(full_input_path) > os.path.getmtime(lemmatised_path):
                 files_to_lemmatise.append((full_input_path, lemmatised_path))
 
+    # lemmatised versions of the books that have been removed from the corpus are removed as well
+    for root, _, files in os.walk(output_dir):
+        for file in files:
+            lemmatised_path = os.path.join(root, file)
+            if file.endswith('.txt') and lemmatised_path not in expected_paths:
+                os.remove(lemmatised_path)
+
     if not files_to_lemmatise:
+        _record_tokenizer(tokenizer_path, recorded_tokenizer, tokenizer)
         print("[corpus_lemmatisation] /// All the texts have already been lemmatised, so we're good to go!")
         return
 
     print(f"[corpus_lemmatisation] /// Looks like we need to lemmatise {len(files_to_lemmatise)} text(s)")
 
-    # Process each file that needs to be lemmatised
-    for idx, (src, dest) in enumerate(files_to_lemmatise, start=1):
-        progress_bar(len(files_to_lemmatise), idx)
+    cache_path = os.path.join(base_path, LEMMA_CACHE_FILENAME)
+    load_lemma_cache(cache_path)
+
+    if workers > 1:
+        # every worker process has its own MorphAnalyzer and sends back the word forms it has learned
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_lemmatisation_worker,
+                                 initargs=(cache_path, tokenizer, is_recording())) as executor:
+            futures = [executor.submit(_lemmatise_file_task, src, dest) for src, dest in files_to_lemmatise]
+            with Progress(len(files_to_lemmatise), 'corpus_lemmatisation') as progress:
+                for future in as_completed(futures):
+                    new_lemmas, worker_metrics = future.result()
+                    merge_metrics(worker_metrics)
+                    for word, lemma in new_lemmas.items():
+                        remember_lemma(word, lemma)
+                    progress.update()
+    else:
+        # Process each file that needs to be lemmatised
+        with Progress(len(files_to_lemmatise), 'corpus_lemmatisation') as progress:
+            for src, dest in files_to_lemmatise:
+                lemmatise_file(src, dest)
+                progress.update()
 
-        try:
-            # Choose the appropriate reader based on file type
-            if src.endswith('.fb2'):
-                text = fb2reader(src)
-            elif src.endswith('.epub'):
-                text = epub_reader(src)
-            elif src.endswith('.txt'):
-                text = txt_reader(src)
-            else:
-                continue  # Skip unsupported file types
-        except Exception:
-            continue
+    save_lemma_cache(cache_path)
+    _record_tokenizer(tokenizer_path, recorded_tokenizer, tokenizer)
+
+
+def _record_tokenizer(tokenizer_path: str, recorded_tokenizer: str, tokenizer: str) -> None:
+    # the default tokenizer is assumed if nothing is recorded
+    if recorded_tokenizer != tokenizer:
+        with open(tokenizer_path, 'w', encoding='utf-8') as f:
+            f.write(tokenizer)
+
+
+def lemmatise_file(src: str, dest: str) -> None:
+    """
+    Reads the book, lemmatises it and writes the lemmatised text (see corpus_lemmatisation()).
+    The book is streamed: it is read, lemmatised and written chunk by chunk (see sentence_chunks()).
+
+    :param src: path to the book
+    :param dest: path to the lemmatised text
+    :return: None
+    """
+    # Make sure the output directory exists before writing
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
 
-        # Lemmatise the text content
-        lemmatised_text = text_lemmatisation(text)
+    def lemmatised_book():
+        pieces = timed('read', book_pieces(src), src)
+        return timed('lemmatise', (sentence for chunk in sentence_chunks(pieces)
+                                   for sentence in lemmatised_sentences(chunk)), src)
 
-        # Make sure the output directory exists before writing
-        os.makedirs(os.path.dirname(dest), exist_ok=True)
+    try:
+        # the output file appears only if the whole book has been read and lemmatised
+        with stage('write', dest):
+            try:
+                txt_stream_writer(lemmatised_book(), dest)
+            except UnicodeDecodeError:
+                # the encoding sniffed by the beginning of the book was wrong; the right one is known now
+                txt_stream_writer(lemmatised_book(), dest)
+        count('read', bytes=os.path.getsize(src), item=src)
+        count('write', bytes=os.path.getsize(dest), item=dest)
+    except Exception:
+        return  # Skip unreadable books and unsupported file types
+
+
+def _init_lemmatisation_worker(cache_path: str, tokenizer: str = DEFAULT_TOKENIZER, metrics: bool = False) -> None:
+    set_tokenizer(tokenizer)
+    start_worker_metrics(metrics)
+    load_lemma_cache(cache_path)
+    record_new_lemmas()
+
+
+def _lemmatise_file_task(src: str, dest: str) -> tuple:
+    """
+    Worker task: lemmatise_file() in a worker process.
+
+    :return: (word form -> lemma pairs learned while lemmatising the file, metrics of the task (see metrics.py))
+    """
+    lemmatise_file(src, dest)
+    return take_new_lemmas(), take_metrics()
+
+
+def pair_similarity(profile1, profile2) -> dict:
+    """
+    Jaccard ngrams, Jaccard vocabulary and Tanimoto ngrams counters of two book profiles.
 
-        # Write the lemmatised content to the output file
-        txt_writer(lemmatised_text, dest)
+    :param profile1: [ngram counter, vocabulary, ngram set], n_grams.CompactProfile or minhash.MinHashProfile
+    :param profile2: profile of the same kind as profile1
+    :return: dict with measured similarity parameters
+    """
+    if isinstance(profile1, MinHashProfile):
+        return approximate_similarity(profile1, profile2)
+
+    if isinstance(profile1, CompactProfile):
+        return {'jaccard_ngram': jaccard_sorted(profile1.ngram_keys, profile2.ngram_keys),
+                'jaccard_vocab': jaccard_sorted(profile1.vocab_ids, profile2.vocab_ids),
+                'tanimoto_ngram_counter': tanimoto_sorted(profile1.ngram_keys, profile1.ngram_counts,
+                                                          profile2.ngram_keys, profile2.ngram_counts)}
+
+    ngram_counter_1, vocab_1, n_gram_1 = profile1
+    ngram_counter_2, vocab_2, n_gram_2 = profile2
+
+    # jaccard ngram similarity measures unique ngrams
+    jaccard_ngram_similarity = jaccard(n_gram_1, n_gram_2)
+    # jaccard vocabulary similarity measures unique words
+    jaccard_vocab_similarity = jaccard(vocab_1, vocab_2)
+    # tanimoto ngram_counter similarity measures weighted vectors i.e. ngram counters
+    tanimoto_ngram_counter_similarity = tanimoto(ngram_counter_1, ngram_counter_2)
 
+    return {'jaccard_ngram': jaccard_ngram_similarity,
+            'jaccard_vocab': jaccard_vocab_similarity,
+            'tanimoto_ngram_counter': tanimoto_ngram_counter_similarity}
+
+
+def book_pairs(litcorpus1: dict, litcorpus2: dict):
+    """
+    Yields the pairs of books of two corpora that are to be compared:
+    a book is never compared to itself and every pair is compared only once (see pair_scheduler.py).
 
-def similarity_measurer(litcorpus1: dict, litcorpus2: dict, N) -> dict:
+    :param litcorpus1: the output dict of text_fetcher()
+    :param litcorpus2: the output dict of text_fetcher()
+    :return: generator of (name of the first book, name of the second book)
+    """
+    return unordered_pairs(litcorpus1, litcorpus2)
+
+
+def similarity_measurer(litcorpus1: dict, litcorpus2: dict, N, engine: str = 'python', pairs: list = None,
+                        checkpoint: CheckpointLog = None) -> dict:
     """
     Jaccard ngrams, Jaccard vocabulary and Tanimoto ngrams counters measuring in order to compute text similarity.
 
     :param litcorpus1: the output dict of text_fetcher() i.e. a processed literature piece
     :param litcorpus2: the output dict of text_fetcher() i.e. a processed literature piece
     :param N: parameter for N-grams; in this project (N = 2; N = 3; N = 4) are conventionally used
+    :param engine: one of ENGINES; the way the pairs are scored
+    :param pairs: list of (name of the first book, name of the second book) to measure; all the pairs by default
+    :param checkpoint: log every measured pair is appended to (see checkpoint.py); the 'matrix' engine
+    measures all the pairs at once, so it has nothing to checkpoint
     :return: dict with measured similarity parameters for two literature pieces
     """
-
-    k = 2
-    all_combinations = list(itertools.product(litcorpus1, litcorpus2))
-    unique_combinations = len([(a, b) for a, b in all_combinations if a != b])
-
-    if litcorpus1 == litcorpus2:
-        unique_combinations_condensed = int(unique_combinations / k)
+    if engine not in ENGINES:
+        raise ValueError(f'Unknown engine {engine!r}, expected one of {ENGINES}')
+    form = ENGINE_FORMS[engine]
+
+    if engine == 'matrix':
+        if litcorpus1 is litcorpus2:
+            return matrix_similarity_measurer({'1': litcorpus1}, [('1', '1')], N,
+                                              None if pairs is None else {('1', '1'): pairs})['1', '1']
+        return matrix_similarity_measurer({'1': litcorpus1, '2': litcorpus2}, [('1', '2')], N,
+                                          None if pairs is None else {('1', '2'): pairs})['1', '2']
+
+    if pairs is None:
+        pairs = PairSchedule(litcorpus1, litcorpus2)
+        names1, names2 = litcorpus1, litcorpus2
+    else:
+        # only the books of the pairs are profiled
+        names1 = {text1 for text1, _ in pairs}
+        names2 = {text2 for _, text2 in pairs}
+
+    # every book is profiled only once and then reused for all the pairs it takes part in
+    if litcorpus1 is litcorpus2:
+        profiles1 = profiles2 = corpus_profiles({name: text for name, text in litcorpus1.items()
+                                                 if name in names1 or name in names2}, N, form)
     else:
-        unique_combinations_condensed = int(unique_combinations)
+        profiles1 = corpus_profiles({name: text for name, text in litcorpus1.items() if name in names1}, N, form)
+        profiles2 = corpus_profiles({name: text for name, text in litcorpus2.items() if name in names2}, N, form)
 
-    iteration_counter = 0
     stats_dict = {}
-    analysed_books_pairs = []
-    for text1 in litcorpus1:
-        for text2 in litcorpus2:
-            if text1 == text2:
-                continue
-            if sorted([text1, text2]) in analysed_books_pairs:
-                continue
-
-            # progress bar updating
-            iteration_counter += 1
-            progress_bar(unique_combinations_condensed, iteration_counter)
-
-            ngram_counter_1, vocab_1, n_gram_1 = n_grams_main(litcorpus1.get(text1), N)
-            ngram_counter_2, vocab_2, n_gram_2 = n_grams_main(litcorpus2.get(text2), N)
-
-            # jaccard ngram similarity measures unique ngrams
-            jaccard_ngram_similarity = jaccard(n_gram_1, n_gram_2)
-            # jaccard vocabulary similarity measures unique words
-            jaccard_vocab_similarity = jaccard(vocab_1, vocab_2)
-            # tanimoto ngram_counter similarity measures weighted vectors i.e. ngram counters
-            tanimoto_ngram_counter_similarity = tanimoto(ngram_counter_1, ngram_counter_2)
-
-            texts_similarity = {f'{text1} – {text2}': {'jaccard_ngram': jaccard_ngram_similarity,
-                                                       'jaccard_vocab': jaccard_vocab_similarity,
-                                                       'tanimoto_ngram_counter': tanimoto_ngram_counter_similarity}}
-            stats_dict.update(texts_similarity)
-            analysed_books_pairs.append(sorted([text1, text2]))
+    with Progress(len(pairs), 'similarity_measurer') as progress:
+        for text1, text2 in pairs:
+            pair = f'{text1} – {text2}'
+            with stage('score', pair):
+                stats_dict[pair] = pair_similarity(profiles1[text1], profiles2[text2])
+            if checkpoint is not None:
+                checkpoint.add(text1, text2, stats_dict[pair])
+            progress.update()
     return stats_dict
 
 
-def auth1_auth1(author_folder_filepath: str, N: int) -> dict:
+def matrix_similarity_measurer(litcorpora: dict, corpora_pairs: list, N, pairs: dict = None) -> dict:
+    """
+    The batch version of similarity_measurer(): all the books of all the corpora are put into one
+    document × n-gram matrix and every requested pair of corpora is a slice of the resulting similarity matrices.
+
+    :param litcorpora: dictionary of the form {name of the corpus: the output dict of text_fetcher()}
+    :param corpora_pairs: list of (name of the first corpus, name of the second corpus)
+    :param N: parameter for N-grams; in this project (N = 2; N = 3; N = 4) are conventionally used
+    :param pairs: dictionary of the form {(name of the first corpus, name of the second corpus):
+    list of (name of the first book, name of the second book)} to measure only these pairs of books
+    :return: dictionary of the form {(name of the first corpus, name of the second corpus): the same dict
+    that similarity_measurer() returns for these corpora}
+    """
+    rows = {}
+    profiles = []
+    for corpus_name, litcorpus in litcorpora.items():
+        for name, text in litcorpus.items():
+            rows[corpus_name, name] = len(profiles)
+            with stage('ngram', name):
+                profiles.append(book_profile(text, N, 'compact'))
+
+    print(f'[matrix_similarity_measurer] /// Measuring all pairs of {len(profiles)} book(s) at once')
+    with stage('score'):
+        matrices = similarity_matrices(profiles)
+
+    stats = {}
+    for corpus_name1, corpus_name2 in corpora_pairs:
+        if pairs is None:
+            corpora_book_pairs = book_pairs(litcorpora[corpus_name1], litcorpora[corpus_name2])
+        else:
+            corpora_book_pairs = pairs[corpus_name1, corpus_name2]
+        rows_pairs = ((text1, rows[corpus_name1, text1], text2, rows[corpus_name2, text2])
+                      for text1, text2 in corpora_book_pairs)
+        with stage('score'):
+            stats[corpus_name1, corpus_name2] = pairs_stats(matrices, rows_pairs)
+    return stats
+
+
+def auth1_auth1(author_folder_filepath: str, N: int, engine: str = 'python') -> dict:
     """
     This function measures similarity of literature pieces written by the same author.
 
     :param author_folder_filepath: path to the folder with author's books
     :param N: parameter for N-grams; in this project (N = 2; N = 3; N = 4) are conventionally used
+    :param engine: one of ENGINES; the way the pairs are scored
     :return: dictionary of dictionaries;
     {name of the book: {ngrams jaccard value: float, vocabulary jaccard value: float, ngrams tanimoto value: float}}
     """
     corpus1 = text_fetcher(author_folder_filepath)
     corpus2 = corpus1
-    stats = similarity_measurer(corpus1, corpus2, N)
+    stats = similarity_measurer(corpus1, corpus2, N, engine)
     return stats
 
 
-def auth1_auth2(author_folder_filepath1: str, author_folder_filepath2: str, N: int) -> dict:
+def auth1_auth2(author_folder_filepath1: str, author_folder_filepath2: str, N: int, engine: str = 'python') -> dict:
     """
     This function measures similarity of literature pieces written by two different author.
 
     :param author_folder_filepath1: path to the folder with the first author's books
     :param author_folder_filepath2: path to the folder with the second author's books
     :param N: parameter for N-grams; in this project (N = 2; N = 3; N = 4) are conventionally used
+    :param engine: one of ENGINES; the way the pairs are scored
     :return: dictionary of dictionaries;
     {name of the book: {ngrams jaccard value: float, vocabulary jaccard value: float, ngrams tanimoto value: float}}
     """
     corpus1 = text_fetcher(author_folder_filepath1)
     corpus2 = text_fetcher(author_folder_filepath2)
-    stats = similarity_measurer(corpus1, corpus2, N)
+    stats = similarity_measurer(corpus1, corpus2, N, engine)
     return stats
 
 
-def wholesale_processing_auth1_auth1(base_path: str, lit_folder_name: str, N: int, lemmatised: bool = True) -> None:
+def stats_output_path(base_path: str, N: int, lemmatised: bool, author1: str, author2: str) -> str:
+    """
+    Builds the path of the file with measured values for the pair of authors (and creates its folder).
+    The file is written with feature_table.save_feature_table().
+
+    :param base_path: path to the directory (without the folder that stores literature)
+    :param N: parameter for N-grams; in this project (N = 2; N = 3; N = 4) are conventionally used
+    :param lemmatised: True/False depending on whether lemmatisation is needed or not
+    :param author1: name of the first author's folder
+    :param author2: name of the second author's folder
+    :return: path to the output file
+    """
+    values_folder = 'values_lemmatised' if lemmatised else 'values'
+    pair_type = 'auth1–auth1' if author1 == author2 else 'auth1–auth2'
+    output_path = os.path.join(base_path, values_folder, f'N={N}', pair_type)
+    os.makedirs(output_path, exist_ok=True)
+    return os.path.join(output_path, f'{author1}–{author2}{FEATURE_TABLE_EXT}')
+
+
+def scan_author_books(folder_path: str, folder: str, manifest: dict) -> tuple:
+    """
+    Lists the books of the author's folder. Digests of the books that have not changed since they were recorded
+    in the manifest are taken from it, the rest of the books are to be read (see read_author_books()).
+
+    :param folder_path: path to the author's folder
+    :param folder: name of the author's folder
+    :param manifest: the manifest of the configuration (see manifest.py)
+    :return: (dictionary {name of the book: full path}, dictionary {name of the book: [size, mtime, digest]},
+    list of names of the books which digests are unknown)
+    """
+    paths, entries, unknown = {}, {}, []
+    for file, full_path in book_files(folder_path):
+        stat = os.stat(full_path)
+        entry = recorded_book(manifest, folder, file, stat)
+        if entry is None:
+            entry = [stat.st_size, stat.st_mtime_ns, None]
+            unknown.append(file)
+        paths[file] = full_path
+        entries[file] = entry
+    return paths, entries, unknown
+
+
+def read_author_books(folder_path: str, folder: str, manifest: dict, texts: dict) -> tuple:
+    """
+    Finds out the digests of all the books of the author's folder reading only new and changed books,
+    and records them in the manifest.
+
+    :param folder_path: path to the author's folder
+    :param folder: name of the author's folder
+    :param manifest: the manifest of the configuration
+    :param texts: dictionary the texts of the read books are put in ({name of the book: text})
+    :return: (dictionary {name of the book: digest} of the readable books, dictionary {name of the book: full path})
+    """
+    paths, entries, unknown = scan_author_books(folder_path, folder, manifest)
+    for file in unknown:
+        try:
+            text = fetch_text(paths[file])
+        except Exception as e:
+            print(f'An error {e} occurred!')
+            continue
+        texts[file] = text
+        entries[file][2] = text_digest(text)
+
+    # unreadable books are not recorded, so they are read again on the next run
+    entries = {file: entry for file, entry in entries.items() if entry[2] is not None}
+    manifest['books'][folder] = entries
+    return {file: entry[2] for file, entry in entries.items()}, paths
+
+
+def author_texts(paths: dict, names, texts: dict) -> dict:
+    """
+    :return: dictionary {name of the book: text} of the named books (the books that have not been read are read);
+    the texts of the author's books are kept in memory together until they are profiled
+    """
+    for name in names:
+        if name not in texts:
+            texts[name] = fetch_text(paths[name])
+    return {name: texts[name] for name in names}
+
+
+def values_update(manifest: dict, output_path: str, books: dict, folder1: str, folder2: str):
+    """
+    Finds out which pairs of books of two authors' folders are to be measured, given the values already stored.
+
+    :param manifest: the manifest of the configuration
+    :param output_path: path to the output file (see stats_output_path())
+    :param books: current digests of the books {author's folder: {name of the book: digest}}
+    :param folder1: name of the first author's folder
+    :param folder2: name of the second author's folder
+    :return: None if the stored values are up to date, else (list of all the pairs of books in the output order,
+    dictionary of the stored and checkpointed values that are still valid, list of (name of the first book,
+    name of the second book) to measure, dictionary of the checkpointed values (see checkpoint.load_checkpoint()))
+    """
+    output_name = os.path.basename(output_path)
+    pairs = [(folder1, text1, folder2, text2) for text1, text2 in book_pairs(books[folder1], books[folder2])]
+    stored = load_feature_table(output_path) if os.path.exists(output_path) else {}
+    valid = valid_values(manifest, output_name, stored, pairs, books)
+
+    missing = [(text1, text2) for _, text1, _, text2 in pairs if f'{text1} – {text2}' not in valid]
+    if os.path.exists(output_path) and not missing and len(valid) == len(stored):
+        record_output(manifest, output_name, books)
+        # the checkpoint of an interrupted run that has written the output file is not needed anymore
+        remove_checkpoint(output_path)
+        return None
+
+    # the pairs measured before an interruption are resumed from the checkpoint
+    checkpointed = load_checkpoint(checkpoint_path(output_path), books, folder1, folder2)
+    resumed = {pair: checkpointed[pair] for pair in missing if pair in checkpointed}
+    if resumed:
+        print(f'[values_update] /// {output_name}: {len(resumed)} pair(s) resumed from the checkpoint')
+        valid.update((f'{text1} – {text2}', pair_values) for (text1, text2), pair_values in resumed.items())
+        missing = [pair for pair in missing if pair not in resumed]
+    return pairs, valid, missing, resumed
+
+
+def write_values(manifest: dict, output_path: str, update: tuple, measured: dict, books: dict) -> None:
+    """
+    Writes the stored values patched with the measured ones (in the same order as if all of them were measured).
+
+    :param manifest: the manifest of the configuration
+    :param output_path: path to the output file
+    :param update: the output of values_update()
+    :param measured: values of the pairs to measure
+    :param books: current digests of the books {author's folder: {name of the book: digest}}
+    :return: None
+    """
+    pairs, valid, missing, _ = update
+    stats = {}
+    for _, text1, _, text2 in pairs:
+        key = f'{text1} – {text2}'
+        stats[key] = valid[key] if key in valid else measured[key]
+
+    folders = list(books)
+    save_feature_table(stats, output_path, folders[0], folders[-1])
+    remove_checkpoint(output_path)
+    record_output(manifest, os.path.basename(output_path), books)
+    if valid:
+        print(f'[write_values] /// {os.path.basename(output_path)}: {len(missing)} pair(s) measured, '
+              f'{len(valid)} kept')
+
+
+def drop_removed_authors(manifest: dict, base_path: str, N: int, lemmatised: bool, author_directories) -> None:
+    """
+    Removes the output files of the authors' folders that are not in the corpus anymore.
+    """
+    author_directories = set(author_directories)
+    for output_name, record in list(manifest['outputs'].items()):
+        folders = list(record)
+        if all(folder in author_directories for folder in folders):
+            continue
+        output_path = stats_output_path(base_path, N, lemmatised, folders[0], folders[-1])
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        remove_checkpoint(output_path)
+        del manifest['outputs'][output_name]
+        manifest['exact'].pop(output_name, None)
+    for folder in list(manifest['books']):
+        if folder not in author_directories:
+            del manifest['books'][folder]
+
+
+def wholesale_processing_auth1_auth1(base_path: str, lit_folder_name: str, N: int, lemmatised: bool = True,
+                                     engine: str = 'python') -> None:
     """
     This function processes all the author's folders in the needed directory and measures author1-author1 similarity.
 
@@ -258,43 +803,50 @@ def wholesale_processing_auth1_auth1(base_path: str, lit_folder_name: str, N: in
     :param lit_folder_name: name of the folder that stores literature
     :param N: parameter for N-grams; in this project (N = 2; N = 3; N = 4) are conventionally used
     :param lemmatised: True/False depending on whether lemmatisation is needed or not
+    :param engine: one of EXACT_ENGINES; the way the pairs are scored
     :return: None
     """
 
+    check_exact_engine(engine)
     inp_path = str(os.path.join(base_path, lit_folder_name))
     if lemmatised:
         corpus_lemmatisation(base_path, lit_folder_name)
         inp_path = str(os.path.join(base_path, f'{lit_folder_name}_lemmatised'))
 
-    author_directories = os.listdir(inp_path)
+    # hidden files (.DS_Store, the .tokenizer of the lemmatised corpus) are not authors
+    author_directories = [folder for folder in os.listdir(inp_path) if not folder.startswith('.')]
     n = len(author_directories)
-    if '.DS_Store' in author_directories:
-        n -= 1
     print(f'[wholesale_processing_auth1_auth1] /// '
           f'There are {n} author directories => {n} possible non-repeated combination(s)')
 
-    for folder in author_directories:
-        if folder.startswith('.'):
-            continue
+    # only the pairs of new and changed books are measured, the values of the rest are kept (see manifest.py)
+    manifest_file = manifest_path(base_path, N, lemmatised)
+    manifest = load_manifest(manifest_file)
+    drop_removed_authors(manifest, base_path, N, lemmatised, author_directories)
 
+    for folder in author_directories:
         folder_full_path = os.path.join(inp_path, folder)
         basename = os.path.basename(folder_full_path)
 
-        if lemmatised:
-            output_path = os.path.join(base_path, 'values_lemmatised', f'N={N}', 'auth1–auth1')
-        else:
-            output_path = os.path.join(base_path, 'values', f'N={N}', 'auth1–auth1')
-
-        os.makedirs(output_path, exist_ok=True)
+        output_path = stats_output_path(base_path, N, lemmatised, basename, basename)
 
-        output_path = os.path.join(output_path, f'{basename}–{basename}.txt')
+        texts = {}
+        digests, paths = read_author_books(folder_full_path, basename, manifest, texts)
+        books = {basename: digests}
+        update = values_update(manifest, output_path, books, basename, basename)
+        if update is not None:
+            missing = update[2]
+            needed = {name for pair in missing for name in pair}
+            corpus = author_texts(paths, [name for name in digests if name in needed], texts)
+            with CheckpointLog(output_path, books, update[3]) as checkpoint:
+                stats = similarity_measurer(corpus, corpus, N, engine, missing, checkpoint)
+            write_values(manifest, output_path, update, stats, books)
 
-        if not os.path.exists(output_path):
-            stats = auth1_auth1(folder_full_path, N)
-            txt_writer(stats, output_path)
+    save_manifest(manifest_file, manifest)
 
 
-def wholesale_processing_auth1_auth2(base_path: str, lit_folder_name: str, N: int, lemmatised: bool = True) -> None:
+def wholesale_processing_auth1_auth2(base_path: str, lit_folder_name: str, N: int, lemmatised: bool = True,
+                                     engine: str = 'python') -> None:
     """
      This function processes all the author's folders in the needed directory and measures author1-author2 similarity.
 
@@ -302,9 +854,11 @@ def wholesale_processing_auth1_auth2(base_path: str, lit_folder_name: str, N: in
      :param lit_folder_name: name of the folder that stores literature
      :param N: parameter for N-grams; in this project (N = 2; N = 3; N = 4) are conventionally used
      :param lemmatised: True/False depending on whether lemmatisation is needed or not
+     :param engine: one of EXACT_ENGINES; the way the pairs are scored
      :return: None
      """
 
+    check_exact_engine(engine)
     inp_path = str(os.path.join(base_path, lit_folder_name))
 
     if lemmatised:
@@ -312,49 +866,338 @@ def wholesale_processing_auth1_auth2(base_path: str, lit_folder_name: str, N: in
         inp_path = str(os.path.join(base_path, f'{lit_folder_name}_lemmatised'))
 
     author_directories = os.listdir(inp_path)
-    n = len(author_directories)
-    if '.DS_Store' in author_directories:
-        n -= 1
-    k = 2
-    combinations_amount = int(math.factorial(n) / (math.factorial(n - k) * math.factorial(k)))
+    authors = [folder for folder in author_directories if not folder.startswith('.')]
+    # every unordered pair of authors once (auth1–auth2, but not auth2–auth1 afterwards)
+    author_pairs = PairSchedule(authors, authors)
     print(f'[wholesale_processing_auth1_auth2] /// '
-          f'There are {n} author directories => {combinations_amount} possible non-repeated combination(s)')
+          f'There are {len(authors)} author directories => {len(author_pairs)} possible non-repeated combination(s)')
+
+    manifest_file = manifest_path(base_path, N, lemmatised)
+    manifest = load_manifest(manifest_file)
+    drop_removed_authors(manifest, base_path, N, lemmatised, authors)
+    # {author's folder: (digests of the books, paths to the books, texts of the books read)}
+    authors_books = {}
+
+    for folder1, folder2 in author_pairs:
+        folder1_full_path = os.path.join(inp_path, folder1)
+        folder2_full_path = os.path.join(inp_path, folder2)
+        basename1 = os.path.basename(folder1_full_path)
+        basename2 = os.path.basename(folder2_full_path)
+
+        output_path = stats_output_path(base_path, N, lemmatised, basename1, basename2)
+
+        for folder, folder_full_path in ((basename1, folder1_full_path), (basename2, folder2_full_path)):
+            if folder not in authors_books:
+                texts = {}
+                authors_books[folder] = read_author_books(folder_full_path, folder, manifest, texts) + (texts,)
+        digests1, paths1, texts1 = authors_books[basename1]
+        digests2, paths2, texts2 = authors_books[basename2]
+        books = {basename1: digests1, basename2: digests2}
+
+        update = values_update(manifest, output_path, books, basename1, basename2)
+        if update is not None:
+            missing = update[2]
+            corpus1 = author_texts(paths1, list(dict.fromkeys(text1 for text1, _ in missing)), texts1)
+            corpus2 = author_texts(paths2, list(dict.fromkeys(text2 for _, text2 in missing)), texts2)
+            with CheckpointLog(output_path, books, update[3]) as checkpoint:
+                stats = similarity_measurer(corpus1, corpus2, N, engine, missing, checkpoint)
+            write_values(manifest, output_path, update, stats, books)
+
+    save_manifest(manifest_file, manifest)
+
+
+def minhash_estimation_report(repo_path: str, N: int) -> dict:
+    """
+    Measures all the pairs of books in the folder both exactly and with the 'minhash' engine
+    and reports the estimation errors.
 
-    analysed_author_pairs = []
-    for folder1 in author_directories:
-        if folder1.startswith('.'):
-            continue
-        for folder2 in author_directories:
-            if folder2.startswith('.'):
-                continue
-            if folder1 == folder2:
-                continue
-            # checking the (auth1–auth2, auth2–auth1) situations
-            # i.e. when the combination appears two times but with different element placements
-            if sorted([folder1, folder2]) in analysed_author_pairs:
-                continue
+    :param repo_path: path to the folder with books (e.g. the whole literature folder)
+    :param N: parameter for N-grams; in this project (N = 2; N = 3; N = 4) are conventionally used
+    :return: dictionary of the form {name of the measure: {'mean_abs_error': float, 'max_abs_error': float}}
+    """
+    litcorpus = text_fetcher(repo_path)
+    exact = matrix_similarity_measurer({'corpus': litcorpus}, [('corpus', 'corpus')], N)['corpus', 'corpus']
+    approximate = similarity_measurer(litcorpus, litcorpus, N, engine='minhash')
+
+    report = {}
+    for measure in ('jaccard_ngram', 'jaccard_vocab', 'tanimoto_ngram_counter'):
+        errors = [abs(exact[pair][measure] - approximate[pair][measure]) for pair in exact]
+        report[measure] = {'mean_abs_error': sum(errors) / len(errors) if errors else 0.0,
+                           'max_abs_error': max(errors, default=0.0)}
+        print(f'[minhash_estimation_report] /// {measure}: '
+              f'mean abs error {report[measure]["mean_abs_error"]:.4f}, '
+              f'max abs error {report[measure]["max_abs_error"]:.4f} over {len(errors)} pair(s)')
+    print(f'[minhash_estimation_report] /// standard error bound with {NUM_PERM} hash functions: {error_bound():.4f}')
+    return report
+
+
+def wholesale_processing_matrix(base_path: str, lit_folder_name: str, N: int, lemmatised: bool = True) -> None:
+    """
+    This function does the work of both wholesale_processing_auth1_auth1() and wholesale_processing_auth1_auth2()
+    at once: every author's folder is fetched only once and all the values are slices of corpus-wide
+    similarity matrices (see matrix_similarity_measurer()).
 
-            folder1_full_path = os.path.join(inp_path, folder1)
-            folder2_full_path = os.path.join(inp_path, folder2)
-            basename1 = os.path.basename(folder1_full_path)
-            basename2 = os.path.basename(folder2_full_path)
+    :param base_path: path to the directory (without the folder that stores literature)
+    :param lit_folder_name: name of the folder that stores literature
+    :param N: parameter for N-grams; in this project (N = 2; N = 3; N = 4) are conventionally used
+    :param lemmatised: True/False depending on whether lemmatisation is needed or not
+    :return: None
+    """
 
-            if lemmatised:
-                output_path = os.path.join(base_path, 'values_lemmatised', f'N={N}', 'auth1–auth2')
-            else:
-                output_path = os.path.join(base_path, 'values', f'N={N}', 'auth1–auth2')
+    inp_path = str(os.path.join(base_path, lit_folder_name))
+    if lemmatised:
+        corpus_lemmatisation(base_path, lit_folder_name)
+        inp_path = str(os.path.join(base_path, f'{lit_folder_name}_lemmatised'))
+
+    author_directories = [folder for folder in os.listdir(inp_path) if not folder.startswith('.')]
+    author_pairs = [(folder, folder) for folder in author_directories]
+    author_pairs.extend(itertools.combinations(author_directories, 2))
+
+    manifest_file = manifest_path(base_path, N, lemmatised)
+    manifest = load_manifest(manifest_file)
+    drop_removed_authors(manifest, base_path, N, lemmatised, author_directories)
+
+    texts = {folder: {} for folder in author_directories}
+    authors_books = {folder: read_author_books(os.path.join(inp_path, folder), folder, manifest, texts[folder])
+                     for folder in author_directories}
+
+    updates = {}
+    for folder1, folder2 in author_pairs:
+        output_path = stats_output_path(base_path, N, lemmatised, folder1, folder2)
+        books = {folder1: authors_books[folder1][0], folder2: authors_books[folder2][0]}
+        update = values_update(manifest, output_path, books, folder1, folder2)
+        if update is not None:
+            updates[folder1, folder2] = (output_path, books, update)
+
+    print(f'[wholesale_processing_matrix] /// '
+          f'There are {len(author_directories)} author directories => {len(updates)} combination(s) to measure')
+
+    if updates:
+        needed = {folder: set() for folder in author_directories}
+        for (folder1, folder2), (_, _, update) in updates.items():
+            for text1, text2 in update[2]:
+                needed[folder1].add(text1)
+                needed[folder2].add(text2)
+        litcorpora = {folder: author_texts(authors_books[folder][1],
+                                           [name for name in authors_books[folder][0] if name in needed[folder]],
+                                           texts[folder])
+                      for folder in author_directories if needed[folder]}
+
+        stats = matrix_similarity_measurer(litcorpora, list(updates), N,
+                                           {pair: update[2] for pair, (_, _, update) in updates.items()})
+        for pair, (output_path, books, update) in updates.items():
+            write_values(manifest, output_path, update, stats[pair], books)
+
+    save_manifest(manifest_file, manifest)
+
+
+def _init_worker(store_path: str, sweep: tuple = (), tokenizer: str = DEFAULT_TOKENIZER, metrics: bool = False,
+                 progress_counter=None) -> None:
+    # worker processes read only new and changed books, they do not keep the texts
+    global _texts
+    _texts = None
+    set_store(store_path)
+    set_sweep(sweep)
+    set_tokenizer(tokenizer)
+    start_worker_metrics(metrics)
+    # scored pairs are counted in the shared counter of the main process (see progress_monitor.py)
+    set_progress_counter(progress_counter)
+
+
+_worker_N = None
+
+
+def _switch_worker_configuration(N: int) -> None:
+    # worker processes live through all the configurations, profiles of the previous one are not needed anymore
+    global _worker_N
+    if _worker_N != N:
+        clear_profiles()
+        _worker_N = N
+
+
+def _profile_book_task(full_path: str, N: int) -> tuple:
+    """
+    Worker task: reads and profiles the book, the profile is persisted in the feature store.
+
+    :return: (digest of the book text or None if the book could not be read, metrics of the task (see metrics.py))
+    """
+    _switch_worker_configuration(N)
+    try:
+        text = fetch_text(full_path)
+    except Exception as e:
+        print(f'An error {e} occurred!')
+        return None, take_metrics()
+    with stage('ngram', full_path):
+        book_profile(text, N)
+    return text_digest(text), take_metrics()
 
-            os.makedirs(output_path, exist_ok=True)
 
-            output_path = os.path.join(output_path, f'{basename1}–{basename2}.txt')
+def _score_pairs_task(pairs: list, N: int, form: str) -> tuple:
+    """
+    Worker task: scores the chunk of pairs of books profiled by _profile_book_task().
 
-            if not os.path.exists(output_path):
-                stats = auth1_auth2(folder1_full_path, folder2_full_path, N)
-                txt_writer(stats, output_path)
-                analysed_author_pairs.append(sorted([folder1, folder2]))
+    :param pairs: list of (name of the first book, its digest, name of the second book, its digest)
+    :return: (list of ('book1 – book2', dict with measured similarity parameters), metrics of the task)
+    """
+    _switch_worker_configuration(N)
+    scored = []
+    for name1, digest1, name2, digest2 in pairs:
+        pair = f'{name1} – {name2}'
+        with stage('score', pair):
+            scored.append((pair, pair_similarity(profile_by_digest(digest1, N, form),
+                                                 profile_by_digest(digest2, N, form))))
+        report_progress()
+    flush_progress()
+    return scored, take_metrics()
+
+
+def _profile_books(executor: ProcessPoolExecutor, N: int, books: dict) -> dict:
+    """
+    Profiles the books in the worker processes (see _profile_book_task()).
+
+    :param books: dictionary {(author's folder, name of the book): full path}
+    :return: dictionary {(author's folder, name of the book): digest of the text or None if it is unreadable}
+    """
+    futures = {book: executor.submit(_profile_book_task, full_path, N) for book, full_path in books.items()}
+    with Progress(len(futures), '_profile_books') as progress:
+        for future in as_completed(futures.values()):
+            merge_metrics(future.result()[1])
+            progress.update()
+    return {book: future.result()[0] for book, future in futures.items()}
 
 
-def main_processing(base_path: str, lit_folder_name: str) -> None:
+def wholesale_processing_parallel(base_path: str, lit_folder_name: str, N: int, lemmatised: bool,
+                                  engine: str, executor: ProcessPoolExecutor) -> None:
+    """
+    The parallel version of wholesale_processing_auth1_auth1() and wholesale_processing_auth1_auth2():
+    books are profiled and pairs of books are scored by the worker processes of the executor.
+    The output files are the same as the ones of the serial processing.
+    Worker processes share the profiles through the feature store (see _init_worker()).
+
+    :param base_path: path to the directory (without the folder that stores literature)
+    :param lit_folder_name: name of the folder that stores literature
+    :param N: parameter for N-grams; in this project (N = 2; N = 3; N = 4) are conventionally used
+    :param lemmatised: True/False depending on whether lemmatisation is needed or not
+    :param engine: one of EXACT_ENGINES; the way the pairs are scored
+    :param executor: process pool which workers were initialised with _init_worker()
+    :return: None
+    """
+
+    check_exact_engine(engine)
+    inp_path = str(os.path.join(base_path, lit_folder_name))
+    if lemmatised:
+        corpus_lemmatisation(base_path, lit_folder_name)
+        inp_path = str(os.path.join(base_path, f'{lit_folder_name}_lemmatised'))
+
+    author_directories = [folder for folder in os.listdir(inp_path) if not folder.startswith('.')]
+    author_pairs = [(folder, folder) for folder in author_directories]
+    author_pairs.extend(itertools.combinations(author_directories, 2))
+
+    manifest_file = manifest_path(base_path, N, lemmatised)
+    manifest = load_manifest(manifest_file)
+    drop_removed_authors(manifest, base_path, N, lemmatised, author_directories)
+
+    # new and changed books are read and profiled by the workers, digests of the rest are known from the manifest
+    scanned = {folder: scan_author_books(os.path.join(inp_path, folder), folder, manifest)
+               for folder in author_directories}
+    profiled = _profile_books(executor, N, {(folder, file): paths[file]
+                                            for folder, (paths, _, unknown) in scanned.items() for file in unknown})
+
+    digests = {}
+    for folder, (_, entries, _) in scanned.items():
+        for file, entry in entries.items():
+            if (folder, file) in profiled:
+                entry[2] = profiled[folder, file]
+        # unreadable books are not recorded, so they are read again on the next run
+        entries = {file: entry for file, entry in entries.items() if entry[2] is not None}
+        manifest['books'][folder] = entries
+        digests[folder] = {file: entry[2] for file, entry in entries.items()}
+
+    updates = {}
+    for folder1, folder2 in author_pairs:
+        output_path = stats_output_path(base_path, N, lemmatised, folder1, folder2)
+        books = {folder1: digests[folder1], folder2: digests[folder2]}
+        update = values_update(manifest, output_path, books, folder1, folder2)
+        if update is not None:
+            updates[folder1, folder2] = (output_path, books, update)
+
+    print(f'[wholesale_processing_parallel] /// '
+          f'There are {len(author_directories)} author directories => {len(updates)} combination(s) to measure')
+    if not updates:
+        save_manifest(manifest_file, manifest)
+        return
+
+    # unchanged books of the pairs to measure are profiled as well (their profiles are usually in the store)
+    needed = {}
+    for (folder1, folder2), (_, _, update) in updates.items():
+        for text1, text2 in update[2]:
+            needed[folder1, text1] = scanned[folder1][0][text1]
+            needed[folder2, text2] = scanned[folder2][0][text2]
+    _profile_books(executor, N, {book: path for book, path in needed.items() if book not in profiled})
+
+    # scoring the pairs; the results are put together in the same order as in the serial processing
+    form = ENGINE_FORMS[engine]
+    if engine == 'matrix':
+        rows = {}
+        profiles = []
+        for folder, file in needed:
+            rows[folder, file] = len(profiles)
+            with stage('ngram', file):
+                profiles.append(profile_by_digest(digests[folder][file], N, form))
+        with stage('score'):
+            matrices = similarity_matrices(profiles)
+        for (folder1, folder2), (output_path, books, update) in updates.items():
+            pairs = ((text1, rows[folder1, text1], text2, rows[folder2, text2]) for text1, text2 in update[2])
+            with stage('score'):
+                measured = pairs_stats(matrices, pairs)
+            write_values(manifest, output_path, update, measured, books)
+        save_manifest(manifest_file, manifest)
+        return
+
+    authors_pairs = {}
+    for (folder1, folder2), (_, _, update) in updates.items():
+        books1, books2 = digests[folder1], digests[folder2]
+        authors_pairs[folder1, folder2] = [(text1, books1[text1], text2, books2[text2]) for text1, text2 in update[2]]
+
+    # the workers count the scored pairs as they go (if they share the counter, see _init_worker())
+    progress = Progress(sum(map(len, authors_pairs.values())), 'wholesale_processing_parallel', shared=True)
+    scoring_futures = {}
+    chunks = {}
+    for (folder1, folder2), pairs in authors_pairs.items():
+        scoring_futures[folder1, folder2] = []
+        for chunk in chunked(pairs, PAIRS_CHUNK_SIZE):
+            future = executor.submit(_score_pairs_task, chunk, N, form)
+            scoring_futures[folder1, folder2].append(future)
+            chunks[future] = ((folder1, folder2), chunk)
+
+    # scored chunks are checkpointed as they come, so an interrupted run resumes from them
+    checkpoints = {pair: CheckpointLog(output_path, books, update[3])
+                   for pair, (output_path, books, update) in updates.items()}
+    try:
+        for future in as_completed(chunks):
+            pair, chunk = chunks[future]
+            scored, worker_metrics = future.result()
+            merge_metrics(worker_metrics)
+            for (text1, _, text2, _), (_, pair_values) in zip(chunk, scored):
+                checkpoints[pair].add(text1, text2, pair_values)
+            if not progress.shared:
+                progress.update(len(chunk))
+    finally:
+        progress.close()
+        for checkpoint in checkpoints.values():
+            checkpoint.close()
+
+    for pair, (output_path, books, update) in updates.items():
+        stats = {}
+        for future in scoring_futures[pair]:
+            stats.update(future.result()[0])
+        write_values(manifest, output_path, update, stats, books)
+    save_manifest(manifest_file, manifest)
+
+
+def main_processing(base_path: str, lit_folder_name: str, feature_store: bool = True, engine: str = 'python',
+                    workers: int = 1, sweep: bool = True, tokenizer: str = DEFAULT_TOKENIZER,
+                    metrics_path: str = None, profile: str = None) -> None:
     """
     This function is the main one that calls wholesale_processing_auth1_auth1() and wholesale_processing_auth1_auth2().
     It configures all possible combinations of N (2, 3, 4) and lemmatisation (True, False)
@@ -362,24 +1205,91 @@ def main_processing(base_path: str, lit_folder_name: str) -> None:
 
     :param base_path: path to the directory (without the folder that stores literature)
     :param lit_folder_name: name of the folder that stores literature
+    :param feature_store: True/False depending on whether processed books should be persisted
+    in the 'feature_store' folder and reused between runs
+    :param engine: one of EXACT_ENGINES; the way the pairs are scored
+    :param workers: number of worker processes; 1 means serial processing
+    :param sweep: True/False depending on whether each book is read and tokenized once per lemmatisation setting
+    and profiled with all the N in the same pass (profiles of the next N are kept in memory until they are needed)
+    :param tokenizer: one of tokenisation.TOKENIZERS; the way texts are split into sentences and words
+    :param metrics_path: path to the JSON report of the time, CPU, bytes, tokens and memory spent on every stage
+    and every book and pair (see metrics.py); nothing is recorded by default
+    :param profile: 'cprofile' or 'tracemalloc' to add the top functions or allocations to the report
     :return: None
     """
+    check_exact_engine(engine)
+    if tokenizer not in TOKENIZERS:
+        raise ValueError(f'Unknown tokenizer {tokenizer!r}, expected one of {tuple(TOKENIZERS)}')
+    if tokenizer == 'punkt':
+        import nltk
+        try:
+            nltk.data.find('tokenizers/punkt_tab')
+        except LookupError:
+            nltk.download('punkt_tab')
+
+    store_path = os.path.join(base_path, 'feature_store') if feature_store else None
+    temporary_store = None
+    if workers > 1 and store_path is None:
+        # worker processes exchange profiles through the store, so a temporary one is used if it is switched off
+        temporary_store = tempfile.mkdtemp(prefix='litsim_store_')
+        store_path = temporary_store
+
+    set_store(store_path)
+    set_tokenizer(tokenizer)
+    try:
+        with recording('main_processing', metrics_path, profile):
+            # the lemmatised corpus is prepared once for all the lemmatised configurations
+            corpus_lemmatisation(base_path, lit_folder_name, workers)
+            if workers > 1:
+                progress_counter = start_shared_progress()
+                try:
+                    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                             initargs=(store_path, N_GRAMS_CONFIGURATION if sweep else (),
+                                                       tokenizer, is_recording(), progress_counter)) as executor:
+                        _configurations_processing(base_path, lit_folder_name, engine, executor, sweep)
+                finally:
+                    stop_shared_progress()
+            else:
+                _configurations_processing(base_path, lit_folder_name, engine, None, sweep)
+    finally:
+        set_tokenizer()
+        if temporary_store is not None:
+            set_store(None)
+            shutil.rmtree(temporary_store, ignore_errors=True)
+
+
+def _configurations_processing(base_path: str, lit_folder_name: str, engine: str, executor, sweep: bool) -> None:
+    """
+    Processes all the configurations of N and lemmatisation (see main_processing()),
+    in the worker processes of the executor if it is given.
+    """
+    global _texts
+
+    # all the N of a lemmatisation setting go one after another, so that a sweep shares the tokenization between them
+    set_sweep(N_GRAMS_CONFIGURATION if sweep else ())
     try:
-        nltk.data.find('tokenizers/punkt_tab')
-    except LookupError:
-        nltk.download('punkt_tab')
-
-    n_grams_configuration = [2, 3, 4]
-    lemmatisation_configuration = [True, False]
-    config_combinations = itertools.product(n_grams_configuration, lemmatisation_configuration)
-
-    for congfig in config_combinations:
-        n_grams_config = congfig[0]
-        lemmatisation_config = congfig[1]
-        print(f'[corpus_processing] /// CONFIGURATION /// '
-              f'N={n_grams_config}, lemmatisation={lemmatisation_config}')
-        wholesale_processing_auth1_auth1(base_path, lit_folder_name, n_grams_config, lemmatisation_config)
-        wholesale_processing_auth1_auth2(base_path, lit_folder_name, n_grams_config, lemmatisation_config)
+        for lemmatisation_config in LEMMATISATION_CONFIGURATION:
+            _texts = {} if sweep else None
+            clear_profiles()
+            for n_grams_config in N_GRAMS_CONFIGURATION:
+                print(f'[corpus_processing] /// CONFIGURATION /// '
+                      f'N={n_grams_config}, lemmatisation={lemmatisation_config}')
+                if executor is not None:
+                    wholesale_processing_parallel(base_path, lit_folder_name, n_grams_config, lemmatisation_config,
+                                                  engine, executor)
+                elif engine == 'matrix':
+                    wholesale_processing_matrix(base_path, lit_folder_name, n_grams_config, lemmatisation_config)
+                else:
+                    wholesale_processing_auth1_auth1(base_path, lit_folder_name, n_grams_config,
+                                                     lemmatisation_config, engine)
+                    wholesale_processing_auth1_auth2(base_path, lit_folder_name, n_grams_config,
+                                                     lemmatisation_config, engine)
+                # profiles of this configuration are not needed anymore (the ones of the next N of the sweep are)
+                clear_profiles([n_grams_config])
+    finally:
+        _texts = None
+        clear_profiles()
+        set_sweep()
 
 
 # path = os.path.join("/Users", "ivanguseff", "PycharmProjects", "LitSim")
@@ -0,0 +1,232 @@
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+from sklearn.model_selection import ParameterGrid, ParameterSampler, StratifiedKFold
+
+from ml import load_training_data, training_set, fit_model, SAME_AUTHOR, XGBOOST_PARAMS
+from progress_monitor import Progress
+
+
+"""
+This module evaluates the classifier of ml.py: repeated stratified k-fold cross-validation of every
+configuration (N, normalised values or not) and a grid or random search over the parameters of XGBoost.
+The values of each configuration are loaded once and handed to the worker processes once;
+a task is one repeat of k-fold CV of one configuration with one set of parameters.
+Results do not depend on the number of workers: the folds of repeat r are split with the seed + r
+and every model is trained with the same random_state.
+    Metrics (mean and std over all the folds of all the repeats):
+        accuracy
+        precision, recall, f1: macro averages over the two classes
+        roc_auc: of the probability of the same authorship
+
+Usage:
+    python evaluation.py --stats-path path/to/project/root/ --search grid --repeats 10 --workers 8
+"""
+
+
+VALUES_FOLDERS = ('values', 'values_lemmatised', 'values_normalised')
+N_CONFIGURATIONS = (2, 3, 4)
+METRICS = ('accuracy', 'precision', 'recall', 'f1', 'roc_auc')
+
+PARAM_GRID = {
+    'n_estimators': [100, 300],
+    'learning_rate': [0.01, 0.1],
+    'max_depth': [4, 8],
+    'subsample': [0.8, 1.0],
+}
+
+
+def find_configurations(stats_path: str, folders=VALUES_FOLDERS, n_values=N_CONFIGURATIONS) -> list:
+    """
+    :param stats_path: path to the directory with the folders of values
+    :param folders: names of the folders of values to look for
+    :param n_values: N to look for
+    :return: list of (name of the folder of values, N) that exist in stats_path
+    """
+    return [(folder, N) for folder in folders for N in n_values
+            if os.path.isdir(os.path.join(stats_path, folder, f'N={N}'))]
+
+
+def param_candidates(grid: dict = None, n_iter: int = None, seed: int = 42) -> list:
+    """
+    :param grid: dictionary {name of the parameter: list of values} overriding XGBOOST_PARAMS; None means no search
+    :param n_iter: number of random candidates; all the candidates of the grid if None
+    :param seed: seed of the random search
+    :return: list of dictionaries of the parameters of XGBClassifier
+    """
+    if not grid:
+        return [dict(XGBOOST_PARAMS)]
+    overrides = list(ParameterGrid(grid)) if n_iter is None else list(ParameterSampler(grid, n_iter, random_state=seed))
+    return [{**XGBOOST_PARAMS, **override} for override in overrides]
+
+
+_datasets = {}
+
+
+def _init_evaluation_worker(datasets: dict) -> None:
+    _datasets.update(datasets)
+
+
+def _fold_metrics(labels, predictions, probabilities) -> dict:
+    return {'accuracy': accuracy_score(labels, predictions),
+            'precision': precision_score(labels, predictions, average='macro', zero_division=0),
+            'recall': recall_score(labels, predictions, average='macro', zero_division=0),
+            'f1': f1_score(labels, predictions, average='macro', zero_division=0),
+            'roc_auc': roc_auc_score(labels == SAME_AUTHOR, probabilities)}
+
+
+def _evaluate_task(configuration: tuple, params: dict, n_splits: int, repeat: int, seed: int) -> list:
+    """
+    Worker task: one repeat of stratified k-fold CV of the configuration with the parameters.
+
+    :return: list of dictionaries {name of the metric: value}, one per fold
+    """
+    values, labels = _datasets[configuration]
+    folds = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed + repeat)
+    results = []
+    for train_idx, test_idx in folds.split(values, labels):
+        scaler, model = fit_model(values[train_idx], labels[train_idx], params)
+        test_values = scaler.transform(values[test_idx])
+        probabilities = model.predict_proba(test_values)[:, list(model.classes_).index(SAME_AUTHOR)]
+        results.append(_fold_metrics(labels[test_idx], model.predict(test_values), probabilities))
+    return results
+
+
+def evaluate(stats_path: str, configurations: list = None, grid: dict = None, n_iter: int = None,
+             n_splits: int = 5, n_repeats: int = 10, workers: int = None, seed: int = 42) -> list:
+    """
+    Cross-validates every configuration with every candidate set of parameters.
+
+    :param stats_path: path to the directory with the folders of values
+    :param configurations: list of (name of the folder of values, N); all the ones found by default
+    :param grid: parameters to search over (see param_candidates())
+    :param n_iter: number of random candidates of the grid; the whole grid if None
+    :param n_splits: number of folds
+    :param n_repeats: number of repeats of k-fold CV
+    :param workers: number of worker processes; all the cores by default
+    :param seed: seed of the splits and of the random search
+    :return: list of results, one per configuration and candidate: dictionaries with 'folder', 'N', 'params',
+    'folds' and '<metric>_mean', '<metric>_std' for all METRICS
+    """
+    if configurations is None:
+        configurations = find_configurations(stats_path)
+    candidates = param_candidates(grid, n_iter, seed)
+    # every worker trains one model at a time, the cores are shared by the tasks
+    candidates = [{**params, 'n_jobs': 1} for params in candidates]
+
+    datasets = {}
+    for folder, N in configurations:
+        auth1_data, auth2_data = load_training_data(os.path.join(stats_path, folder, f'N={N}'))
+        datasets[folder, N] = training_set(auth1_data, auth2_data)
+    print(f'[evaluate] /// {len(configurations)} configuration(s) × {len(candidates)} candidate(s) × '
+          f'{n_repeats} repeat(s) of {n_splits}-fold CV')
+
+    folds = {(configuration, idx): [] for configuration in configurations for idx in range(len(candidates))}
+    tasks = [(configuration, idx, repeat) for configuration in configurations
+             for idx in range(len(candidates)) for repeat in range(n_repeats)]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_evaluation_worker,
+                             initargs=(datasets,)) as executor:
+        futures = {executor.submit(_evaluate_task, configuration, candidates[idx], n_splits, repeat, seed):
+                   (configuration, idx, repeat) for configuration, idx, repeat in tasks}
+        fold_results = {}
+        with Progress(len(futures), 'evaluate') as progress:
+            for future in as_completed(futures):
+                fold_results[futures[future]] = future.result()
+                progress.update()
+    # folds are put together in the order of the repeats, whatever order the tasks have finished in
+    for configuration, idx, repeat in tasks:
+        folds[configuration, idx].extend(fold_results[configuration, idx, repeat])
+
+    results = []
+    for (configuration, idx), metrics in folds.items():
+        result = {'folder': configuration[0], 'N': configuration[1],
+                  'params': {name: value for name, value in candidates[idx].items() if name != 'n_jobs'},
+                  'folds': len(metrics)}
+        for metric in METRICS:
+            scores = np.array([fold[metric] for fold in metrics])
+            result[f'{metric}_mean'] = float(scores.mean())
+            result[f'{metric}_std'] = float(scores.std())
+        results.append(result)
+    return results
+
+
+def best_results(results: list, metric: str = 'f1') -> dict:
+    """
+    :return: dictionary {(name of the folder of values, N): the result of the best candidate by the metric}
+    """
+    best = {}
+    for result in results:
+        key = result['folder'], result['N']
+        if key not in best or result[f'{metric}_mean'] > best[key][f'{metric}_mean']:
+            best[key] = result
+    return best
+
+
+def save_results(results: list, filepath: str) -> None:
+    """
+    Writes all the results (one row per configuration and candidate, the best ones first) as CSV.
+    """
+    searched = sorted({name for result in results for name, value in result['params'].items()
+                       if any(other['params'].get(name) != value for other in results)})
+    with open(filepath, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['folder', 'N', *searched, 'folds', *(f'{metric}_{stat}' for metric in METRICS
+                                                               for stat in ('mean', 'std'))])
+        for result in sorted(results, key=lambda item: (item['folder'], item['N'], -item['f1_mean'])):
+            writer.writerow([result['folder'], result['N'], *(result['params'].get(name) for name in searched),
+                             result['folds'], *(f"{result[f'{metric}_{stat}']:.6f}" for metric in METRICS
+                                                for stat in ('mean', 'std'))])
+
+
+def save_comparison(results: list, filepath: str, metric: str = 'f1') -> None:
+    """
+    Writes the table of the best candidates in the layout of Configuration_comparison.xlsx as CSV:
+    rows are N × metric, columns are normalised (any folder but 'values') or not.
+    """
+    best = best_results(results, metric)
+    folders = sorted({folder for folder, _ in best}, key=lambda folder: folder == 'values')
+    with open(filepath, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['', '', *(f'Normalized={folder != "values"} ({folder})' for folder in folders)])
+        for N in sorted({N for _, N in best}):
+            for idx, name in enumerate(('Accuracy', 'Precision', 'Recall', 'F1', 'ROC AUC')):
+                row = [f'N={N}' if idx == 0 else '', name]
+                for folder in folders:
+                    result = best.get((folder, N))
+                    row.append('' if result is None else f"{result[f'{METRICS[idx]}_mean']:.6f}")
+                writer.writerow(row)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cross-validation and parameter search of the classifier')
+    parser.add_argument('--stats-path', default='.')
+    parser.add_argument('--folders', nargs='+', default=list(VALUES_FOLDERS))
+    parser.add_argument('--n', nargs='+', type=int, default=list(N_CONFIGURATIONS))
+    parser.add_argument('--search', choices=('none', 'grid', 'random'), default='none')
+    parser.add_argument('--n-iter', type=int, default=8, help='number of candidates of the random search')
+    parser.add_argument('--splits', type=int, default=5)
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--metric', choices=METRICS, default='f1', help='metric the best candidates are chosen by')
+    parser.add_argument('--output', default='evaluation_results.csv')
+    parser.add_argument('--comparison', default='configuration_comparison.csv')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    evaluation_results = evaluate(args.stats_path, find_configurations(args.stats_path, args.folders, args.n),
+                                  grid=None if args.search == 'none' else PARAM_GRID,
+                                  n_iter=args.n_iter if args.search == 'random' else None,
+                                  n_splits=args.splits, n_repeats=args.repeats, workers=args.workers, seed=args.seed)
+    save_results(evaluation_results, args.output)
+    save_comparison(evaluation_results, args.comparison, args.metric)
+    print(f'\n[evaluation] /// Done in {time.perf_counter() - start:.1f} s; '
+          f'results: {args.output}, comparison: {args.comparison}')
+    for (folder, N), result in sorted(best_results(evaluation_results, args.metric).items()):
+        print(f'[evaluation] /// {folder}, N={N}: ' + ', '.join(f"{metric} {result[f'{metric}_mean']:.3f}"
+                                                           for metric in METRICS))
@@ -0,0 +1,117 @@
+import gzip
+import hashlib
+import os
+from collections import Counter
+
+from metrics import stage, count
+
+
+"""
+This module implements an on-disk store of processed books that persists between runs.
+Everything in the store is keyed by content digests, so an entry becomes stale (and is simply not found anymore)
+as soon as the source file changes.
+    Included:
+        normalised texts (keyed by the digest of the source file)
+        n-gram profiles (keyed by the digest of the processed text and N)
+"""
+
+
+STORE_VERSION = 1
+
+_store_path = None
+
+
+def set_store(store_path) -> None:
+    """
+    Sets the folder that is used as the feature store; None switches the store off.
+
+    :param store_path: path to the folder of the store
+    :return: None
+    """
+    global _store_path
+    _store_path = store_path
+
+
+def get_store():
+    return _store_path
+
+
+def file_digest(filepath: str) -> str:
+    """
+    Computes a digest of the file contents.
+
+    :param filepath: path to the file
+    :return: hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _entry_path(store_path: str, kind: str, digest: str) -> str:
+    return os.path.join(store_path, f'v{STORE_VERSION}', kind, digest[:2], f'{digest}.gz')
+
+
+def _write_atomically(filepath: str, lines) -> None:
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp_path = f'{filepath}.{os.getpid()}.tmp'
+    with stage('write'):
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=1) as f:
+            f.writelines(lines)
+        count('write', bytes=os.path.getsize(tmp_path))
+        os.replace(tmp_path, filepath)
+
+
+def load_text(store_path: str, digest: str):
+    """
+    :param store_path: path to the folder of the store
+    :param digest: digest of the source file
+    :return: normalised text or None if it is not in the store
+    """
+    filepath = _entry_path(store_path, 'texts', digest)
+    if not os.path.exists(filepath):
+        return None
+    with gzip.open(filepath, 'rt', encoding='utf-8') as f:
+        return f.read()
+
+
+def save_text(store_path: str, digest: str, text: str) -> None:
+    _write_atomically(_entry_path(store_path, 'texts', digest), [text])
+
+
+def load_profile(store_path: str, digest: str, N: int):
+    """
+    :param store_path: path to the folder of the store
+    :param digest: digest of the processed text (see profiles.text_digest())
+    :param N: parameter for N-grams
+    :return: [ngram counter, vocabulary, ngram set] or None if it is not in the store
+    """
+    filepath = _entry_path(store_path, f'N={N}', digest)
+    if not os.path.exists(filepath):
+        return None
+
+    ngram_counter = Counter()
+    with gzip.open(filepath, 'rt', encoding='utf-8') as f:
+        vocab = set(f.readline().split())
+        for line in f:
+            count, ngram = line.rstrip('\n').split('\t')
+            ngram_counter[tuple(ngram.split(' '))] = int(count)
+
+    return [ngram_counter, vocab, set(ngram_counter)]
+
+
+def has_profile(store_path: str, digest: str, N: int) -> bool:
+    return os.path.exists(_entry_path(store_path, f'N={N}', digest))
+
+
+def save_profile(store_path: str, digest: str, N: int, profile: list) -> None:
+    """
+    Tokens never contain whitespace (they are produced by str.split()), so they are stored space-separated:
+    the first line holds the vocabulary, the rest hold "count<TAB>ngram" entries.
+    """
+    ngram_counter, vocab, _ = profile
+    lines = [' '.join(vocab) + '\n']
+    lines.extend(f'{count}\t{" ".join(ngram)}\n' for ngram, count in ngram_counter.items())
+    _write_atomically(_entry_path(store_path, f'N={N}', digest), lines)
@@ -0,0 +1,122 @@
+import ast
+import os
+import sys
+
+import numpy as np
+
+from writers_and_readers import txt_reader
+from metrics import stage, count
+
+
+"""
+This module implements the format of the files with measured values (see corpus_processing.stats_output_path()).
+A file is a NumPy .npz archive of plain (never pickled) columns:
+    pairs: names of the pairs of books ('book1 – book2')
+    measures: names of the measures, in the order of the columns
+    <measure>: one float64 column per measure
+    author1, author2: names of the authors' folders
+So loading the training set is a few array reads instead of parsing Python literals.
+Legacy .txt files (str() of the stats dictionary) are still readable and can be converted with migrate_values().
+"""
+
+
+MEASURES = ('jaccard_ngram', 'jaccard_vocab', 'tanimoto_ngram_counter')
+FEATURE_TABLE_EXT = '.npz'
+
+
+def save_feature_table(stats: dict, filepath: str, author1: str = '', author2: str = '') -> None:
+    """
+    :param stats: dictionary of the form {'book1 – book2': {name of the measure: value}}
+    :param filepath: path to the output .npz file
+    :param author1: name of the first author's folder
+    :param author2: name of the second author's folder
+    :return: None
+    """
+    measures = list(next(iter(stats.values()))) if stats else list(MEASURES)
+    columns = {measure: np.array([values[measure] for values in stats.values()], dtype=np.float64)
+               for measure in measures}
+
+    # the file appears only when it is completely written and flushed to the disk
+    # (the temporary file does not look like a feature file, so an interrupted write is never loaded)
+    tmp_path = f'{filepath}.tmp'
+    with stage('write', filepath), open(tmp_path, 'wb') as f:
+        np.savez(f,
+                 pairs=np.array(list(stats), dtype=str),
+                 measures=np.array(measures, dtype=str),
+                 author1=np.array(author1, dtype=str),
+                 author2=np.array(author2, dtype=str),
+                 **columns)
+        f.flush()
+        os.fsync(f.fileno())
+        count('write', bytes=f.tell())
+    os.replace(tmp_path, filepath)
+
+
+def load_feature_columns(filepath: str) -> tuple:
+    """
+    :param filepath: path to the .npz (or legacy .txt) file with measured values
+    :return: (list of names of the pairs, list of names of the measures, pairs × measures float64 array)
+    """
+    if filepath.endswith('.txt'):
+        stats = ast.literal_eval(txt_reader(filepath))
+        measures = list(next(iter(stats.values()))) if stats else list(MEASURES)
+        features = np.array([[values[measure] for measure in measures] for values in stats.values()],
+                            dtype=np.float64).reshape(len(stats), len(measures))
+        return list(stats), measures, features
+
+    with np.load(filepath, allow_pickle=False) as table:
+        measures = table['measures'].tolist()
+        features = np.column_stack([table[measure] for measure in measures]) if measures \
+            else np.empty((len(table['pairs']), 0))
+        return table['pairs'].tolist(), measures, features
+
+
+def load_feature_table(filepath: str) -> dict:
+    """
+    :param filepath: path to the .npz (or legacy .txt) file with measured values
+    :return: dictionary of the form {'book1 – book2': {name of the measure: value}}
+    """
+    pairs, measures, features = load_feature_columns(filepath)
+    return {pair: dict(zip(measures, row)) for pair, row in zip(pairs, features.tolist())}
+
+
+def is_feature_file(filename: str) -> bool:
+    return not filename.startswith('.') and filename.endswith((FEATURE_TABLE_EXT, '.txt'))
+
+
+def migrate_values(values_path: str, remove_legacy: bool = True) -> int:
+    """
+    Converts all the legacy .txt files with measured values in the folder (subfolders are walked as well) to .npz.
+
+    :param values_path: path to the folder with values (e.g. 'values' or 'values_lemmatised')
+    :param remove_legacy: whether the .txt files are removed after the conversion
+    :return: number of converted files
+    """
+    converted = 0
+    for root, _, files in os.walk(values_path):
+        for file in sorted(files):
+            if file.startswith('.') or not file.endswith('.txt'):
+                continue
+
+            txt_path = os.path.join(root, file)
+            stem = file[:-len('.txt')]
+            authors = stem.split('–')
+            author1, author2 = authors if len(authors) == 2 else (stem, '')
+
+            stats = load_feature_table(txt_path)
+            save_feature_table(stats, os.path.join(root, stem + FEATURE_TABLE_EXT), author1, author2)
+            if load_feature_table(os.path.join(root, stem + FEATURE_TABLE_EXT)) != stats:
+                raise ValueError(f'{txt_path} has not been converted losslessly')
+
+            if remove_legacy:
+                os.remove(txt_path)
+            converted += 1
+
+    print(f'[migrate_values] /// {converted} file(s) converted in {values_path}')
+    return converted
+
+
+if __name__ == '__main__':
+    # python feature_table.py values values_lemmatised
+    for folder in sys.argv[1:]:
+        migrate_values(folder)
@@ -1,62 +1,212 @@
 import os
-from ml import predict, best_params_xgboost
-from corpus_processing import text_lemmatisation
-from writers_and_readers import txt_linesreader
-from n_grams import n_grams_main
-from statistical_methods import jaccard, tanimoto
 
+import numpy as np
 
-def extract_features(text1, text2, n=3, lemmatise=False):
-    if lemmatise:
-        text1 = text_lemmatisation(text1)
-        text2 = text_lemmatisation(text2)
-
-    ngram_counter_1, vocab_1, ngram_1 = n_grams_main(text1, n)
-    ngram_counter_2, vocab_2, ngram_2 = n_grams_main(text2, n)
-
-    return [
-        jaccard(ngram_1, ngram_2),
-        jaccard(vocab_1, vocab_2),
-        tanimoto(ngram_counter_1, ngram_counter_2)
-    ]
+from ml import model_predict, SAME_AUTHOR
+from model_registry import get_model
+from corpus_processing import text_lemmatisation, pair_similarity, ENGINES, ENGINE_FORMS
+from writers_and_readers import txt_linesreader, fb2reader, epub_reader
+from profiles import book_profile
+from n_grams import ScratchVocabulary
+from feature_store import set_store
+from minhash import LSHIndex, NUM_PERM
+from similarity_matrix import query_similarities
+from feature_table import MEASURES
+from metrics import recording, stage, count
 
 
-def load_training_data(stats_path):
-    auth1_auth1, auth1_auth2 = [], []
+def lemmatised_lines(lines, name='the book'):
+    """
+    Lemmatises the text of the book (see text_lemmatisation()) given as a list of its lines or as a string.
 
-    for root, _, files in os.walk(stats_path):
-        for file in files:
-            if file.startswith('.'):
-                continue
-            full_path = os.path.join(root, file)
-            stats = eval(txt_linesreader(str(full_path))[0])
-            book_values = [list(item.values()) for item in stats.values()]
+    :return: list of a single line, the lemmatised text
+    """
+    text = ''.join(lines)
+    lemmatised = text_lemmatisation(text)
+    if text.strip() and not lemmatised.strip():
+        raise ValueError(f'The lemmatised text of {name} is empty')
+    return [lemmatised]
 
-            if 'auth1–auth1' in root:
-                auth1_auth1.extend(book_values)
-            elif 'auth1–auth2' in root:
-                auth1_auth2.extend(book_values)
 
-    return auth1_auth1, auth1_auth2
+def extract_features(text1, text2, n=3, lemmatise=False, engine='python', cache=True):
+    # cache=False: the texts are one-off (e.g. sent to the service), their profiles are not kept
+    if engine not in ENGINES:
+        raise ValueError(f'Unknown engine {engine!r}, expected one of {ENGINES}')
 
+    if lemmatise:
+        text1 = lemmatised_lines(text1)
+        text2 = lemmatised_lines(text2)
 
-def compare_authors(file1_path, file2_path, stats_path, n=3, lemmatise=False):
-    book1 = txt_linesreader(file1_path)
-    book2 = txt_linesreader(file2_path)
+    form = ENGINE_FORMS[engine]
+    scratch = None if cache else ScratchVocabulary()
+    profile1, profile2 = book_profile(text1, n, form, scratch), book_profile(text2, n, form, scratch)
+    with stage('score'):
+        similarity = pair_similarity(profile1, profile2)
 
-    test_features = [extract_features(book1, book2, n=n, lemmatise=lemmatise)]
+    return [
+        similarity['jaccard_ngram'],
+        similarity['jaccard_vocab'],
+        similarity['tanimoto_ngram_counter']
+    ]
 
-    if lemmatise is True:
-        stats_path += 'values_lemmatised/'
-    elif lemmatise is False:
-        stats_path += 'values/'
-    stats_path += f'N={n}/'
 
-    auth1_data, auth2_data = load_training_data(stats_path)
-    print(best_params_xgboost(auth1_data, auth2_data, test_features))
-    # result = predict(auth1_data, auth2_data, test_features)
-    # print("0 // same author" if result == [0] else "1 // different author")
-    # return result
+def read_book_lines(file_path):
+    # .txt books are compared line by line (as in compare_authors()), other formats are read as a single line
+    if file_path.endswith('.fb2'):
+        return [fb2reader(file_path)]
+    if file_path.endswith('.epub'):
+        return [epub_reader(file_path)]
+    return txt_linesreader(file_path)
+
+
+def library_books(library_path):
+    for root, _, files in os.walk(library_path):
+        for file in sorted(files):
+            if not file.startswith('.') and file.endswith(('.txt', '.fb2', '.epub')):
+                yield os.path.join(root, file)
+
+
+def find_candidate_books(file_path, library_path, n=3, bands=64):
+    """
+    Approximate mode: finds the books of the library that share enough vocabulary with the book
+    (see minhash.LSHIndex) without measuring the book against every book of the library,
+    and estimates the features for the candidates only.
+
+    :param file_path: path to the book
+    :param library_path: path to the folder with reference books (subfolders are walked as well)
+    :param n: parameter for N-grams
+    :param bands: number of LSH bands; more bands find less similar books
+    :return: dictionary of the form {path to the candidate book: estimated features}
+    """
+    index = LSHIndex(NUM_PERM, bands)
+    library = {}
+    for book_path in library_books(library_path):
+        if os.path.abspath(book_path) == os.path.abspath(file_path):
+            continue
+        library[book_path] = book_profile(read_book_lines(book_path), n, 'minhash')
+        index.add(book_path, library[book_path].vocab_signature)
+
+    query = book_profile(read_book_lines(file_path), n, 'minhash')
+    candidates = {}
+    for book_path in sorted(index.query(query.vocab_signature)):
+        similarity = pair_similarity(query, library[book_path])
+        candidates[book_path] = [similarity['jaccard_ngram'],
+                                 similarity['jaccard_vocab'],
+                                 similarity['tanimoto_ngram_counter']]
+    return candidates
+
+
+def compare_authors(file1_path, file2_path, stats_path, n=3, lemmatise=False, feature_store=True, engine='python',
+                    metrics_path=None, profile=None):
+    # profiles of the books compared before are loaded from the store instead of being recomputed
+    set_store(os.path.join(stats_path, 'feature_store') if feature_store else None)
+
+    # metrics_path: JSON report of the time and memory spent on every stage (see metrics.py), profile: 'cprofile' or
+    # 'tracemalloc' to add the top functions or allocations to it; nothing is recorded by default
+    with recording('compare_authors', metrics_path, profile):
+        books = []
+        for file_path in (file1_path, file2_path):
+            with stage('read', file_path):
+                books.append(txt_linesreader(file_path))
+                count('read', bytes=os.path.getsize(file_path))
+        book1, book2 = books
+
+        # engine='minhash' is the approximate mode
+        test_features = [extract_features(book1, book2, n=n, lemmatise=lemmatise, engine=engine)]
+
+        # the model is trained only once per training set (see model_registry.py)
+        with stage('classify'):
+            scaler, model = get_model(stats_path, n, lemmatise)
+            result = model_predict(scaler, model, test_features)
+    print("0 // same author" if result == [SAME_AUTHOR] else "1 // different author")
+    return result
+
+
+# (path to the book, n, lemmatise) -> (mtime and size of the book, its compact profile)
+_library_profiles = {}
+
+
+def book_author(book_path, library_path):
+    # books are kept in the folders of their authors (as in literature/)
+    relative_path = os.path.relpath(book_path, library_path)
+    if os.sep in relative_path:
+        return relative_path.split(os.sep)[0]
+    return os.path.basename(os.path.normpath(library_path))
+
+
+def library_profile(book_path, n=3, lemmatise=False, cache=True):
+    """
+    Compact profile of the book of the library; unchanged books are neither read nor profiled again.
+    With cache=False the book is profiled as a one-off text and its profile is not kept (see profiles.book_profile()).
+    """
+    stat = os.stat(book_path)
+    key = (os.path.abspath(book_path), n, lemmatise)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _library_profiles.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    lines = read_book_lines(book_path)
+    if lemmatise:
+        lines = lemmatised_lines(lines, book_path)
+    if not cache:
+        return book_profile(lines, n, 'compact', ScratchVocabulary())
+    profile = book_profile(lines, n, 'compact')
+    _library_profiles[key] = (stamp, profile)
+    return profile
+
+
+def compare_library(file_path, library_path, stats_path, n=3, lemmatise=False, feature_store=True):
+    """
+    Batch version of compare_authors(): which authors of the library could have written the book.
+    The book is profiled once, measured against all the books of the library in a single vectorised pass
+    (see similarity_matrix.query_similarities()) and all the pairs are classified with a single predict call.
+
+    :param file_path: path to the book
+    :param library_path: path to the folder with reference books organised in authors' folders
+    :param stats_path: path to the directory with the folders of values (the classifier is trained on them)
+    :param n: parameter for N-grams
+    :param lemmatise: True/False depending on whether lemmatisation is needed or not
+    :param feature_store: whether profiles are kept in the feature store of stats_path
+    :return: list of dictionaries of the form
+        {'author': name of the author's folder,
+         'probability': the highest probability of the same authorship among the author's books,
+         'same_author_books': number of the author's books classified as written by the same author,
+         'books': [(path to the book, probability, features), ...] from the most to the least probable}
+        sorted from the most to the least probable author
+    """
+    set_store(os.path.join(stats_path, 'feature_store') if feature_store else None)
+
+    book_paths = [book_path for book_path in library_books(library_path)
+                  if os.path.abspath(book_path) != os.path.abspath(file_path)]
+    if not book_paths:
+        return []
+
+    # only the profiles of the library are kept, the book is profiled as a one-off text
+    query = library_profile(file_path, n, lemmatise, cache=False)
+    similarity = query_similarities(query, [library_profile(book_path, n, lemmatise) for book_path in book_paths])
+    features = np.column_stack([similarity[measure] for measure in MEASURES])
+
+    scaler, model = get_model(stats_path, n, lemmatise)
+    predictions = model_predict(scaler, model, features)
+    same_author_column = list(model.classes_).index(SAME_AUTHOR)
+    probabilities = model.predict_proba(scaler.transform(features))[:, same_author_column]
+
+    authors = {}
+    for book_path, prediction, probability, book_features in zip(book_paths, predictions, probabilities.tolist(),
+                                                                 features.tolist()):
+        author = authors.setdefault(book_author(book_path, library_path),
+                                    {'probability': 0.0, 'same_author_books': 0, 'books': []})
+        author['probability'] = max(author['probability'], probability)
+        author['same_author_books'] += prediction == SAME_AUTHOR
+        author['books'].append((book_path, probability, book_features))
+
+    ranking = []
+    for name, author in authors.items():
+        author['books'].sort(key=lambda book: book[1], reverse=True)
+        ranking.append({'author': name, **author})
+    ranking.sort(key=lambda author: (author['probability'], author['same_author_books']), reverse=True)
+    return ranking
 
 
 if __name__ == "__main__":
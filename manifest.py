@@ -0,0 +1,99 @@
+import json
+import os
+
+from metrics import stage, count
+
+
+"""
+This module implements the manifest of measured values, so that the corpus can be updated incrementally:
+adding, changing or removing a book measures only the pairs of books it takes part in.
+There is one manifest per configuration (values[_lemmatised]/N=<N>/manifest.json), it keeps
+    books: {author's folder: {name of the book: [size, mtime, digest of its text]}}
+        so that unchanged books are not even read to find out their digests; unreadable books are not recorded,
+        so they are read again on the next run (the error may have been a temporary one)
+    outputs: {name of the output file: {author's folder: {name of the book: digest of its text}}}
+        i.e. the versions of the books the values in the output file were measured on
+    exact: {name of the output file: True} for the output files measured with an exact engine
+        (see corpus_processing.EXACT_ENGINES); the values of the output files recorded without it may be
+        the estimates of the 'minhash' engine (it used to be accepted), so they are measured anew
+Values of the output files that are not in the manifest (e.g. measured before the manifest appeared) are trusted.
+"""
+
+
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+def manifest_path(base_path: str, N: int, lemmatised: bool) -> str:
+    values_folder = 'values_lemmatised' if lemmatised else 'values'
+    return os.path.join(base_path, values_folder, f'N={N}', MANIFEST_FILENAME)
+
+
+def load_manifest(filepath: str) -> dict:
+    """
+    :param filepath: path to the manifest
+    :return: the manifest; an empty one if there is no manifest (or it is of another version)
+    """
+    manifest = {'version': MANIFEST_VERSION, 'books': {}, 'outputs': {}, 'exact': {}}
+    if os.path.exists(filepath):
+        with open(filepath, encoding='utf-8') as f:
+            stored = json.load(f)
+        if stored.get('version') == MANIFEST_VERSION:
+            manifest.update(stored)
+    return manifest
+
+
+def save_manifest(filepath: str, manifest: dict) -> None:
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp_path = f'{filepath}.{os.getpid()}.tmp'
+    with stage('write', filepath), open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+        count('write', bytes=f.tell())
+    os.replace(tmp_path, filepath)
+
+
+def recorded_book(manifest: dict, folder: str, name: str, stat: os.stat_result):
+    """
+    :return: [size, mtime, digest] of the book recorded in the manifest if the file has not changed since
+    (and has been read), else None
+    """
+    entry = manifest['books'].get(folder, {}).get(name)
+    if entry is not None and entry[2] is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+        return entry
+    return None
+
+
+def valid_values(manifest: dict, output_name: str, stored: dict, pairs: list, books: dict) -> dict:
+    """
+    Picks the stored values that are still valid: the pair is still to be measured, neither of its books
+    has changed since the values were measured and they were measured exactly.
+
+    :param manifest: the manifest
+    :param output_name: name of the output file
+    :param stored: values stored in the output file {'book1 – book2': {name of the measure: value}}
+    :param pairs: list of (folder1, name of the first book, folder2, name of the second book) to be measured
+    :param books: current digests of the books {author's folder: {name of the book: digest}}
+    :return: the valid part of stored
+    """
+    record = manifest['outputs'].get(output_name)
+    if record is not None and not manifest['exact'].get(output_name):
+        return {}
+    valid = {}
+    for folder1, text1, folder2, text2 in pairs:
+        key = f'{text1} – {text2}'
+        if key not in stored:
+            continue
+        if record is not None and (record.get(folder1, {}).get(text1) != books[folder1][text1]
+                                   or record.get(folder2, {}).get(text2) != books[folder2][text2]):
+            continue
+        valid[key] = stored[key]
+    return valid
+
+
+def record_output(manifest: dict, output_name: str, books: dict) -> None:
+    """
+    Records the versions of the books the values of the output file are measured on (always exactly,
+    see corpus_processing.check_exact_engine()).
+    """
+    manifest['outputs'][output_name] = {folder: dict(folder_books) for folder, folder_books in books.items()}
+    manifest['exact'][output_name] = True
@@ -0,0 +1,403 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+"""
+This module records where the time of a run goes: wall time, CPU time, bytes, tokens and peak RSS
+per stage of the pipeline and per book or pair of books, reported as JSON at the end of the run
+(see corpus_processing.main_processing() and main.compare_authors(), parameters metrics_path and profile).
+    Stages (STAGES):
+        read: reading the books (and the normalised texts kept in the feature store); bytes are the sizes of the books
+        clean: cleaning and lowercasing the texts
+        lemmatise: splitting the texts into words and lemmatising them; tokens are the words
+        ngram: profiling the books; tokens are the words of the tokenized sentences
+        score: measuring the pairs of books
+        write: writing the output files, manifests, checkpoints and the feature store; bytes are the sizes written
+        classify: training (or loading) the model and classifying the pairs
+Stage times are exclusive: a stage entered within another one (e.g. reading the pieces of a book that is being
+cleaned) pauses it, so the times of the stages add up to the time of the run (see 'unattributed_wall_time').
+Worker processes record their own metrics and send them back with the results of their tasks (see take_metrics()),
+so in parallel runs the times of the stages are the sums over all the processes (and the unattributed time
+of the main process is mostly the time it waits for the workers).
+Only the thread that has started the recording is recorded. Nothing is recorded (and the hooks cost next to
+nothing) unless a recording is started (see recording()).
+The optional profile hook adds the top functions of cProfile or the top allocations of tracemalloc to the report.
+"""
+
+
+STAGES = ('read', 'clean', 'lemmatise', 'ngram', 'score', 'write', 'classify')
+PROFILERS = ('cprofile', 'tracemalloc')
+# per stage, the slowest items are kept (books, pairs of books, output files)
+ITEMS_LIMIT = 1000
+PROFILE_TOP = 25
+
+# stage totals: [calls, wall time, CPU time, bytes, tokens, peak RSS]
+CALLS, WALL, CPU, BYTES, TOKENS, RSS = range(6)
+
+_recorder = None
+_NO_STAGE = nullcontext()
+
+
+def peak_rss():
+    """
+    :return: peak resident set size of the process in bytes; None if the platform does not report it
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class MetricsRecorder:
+    """
+    Metrics of one run: stage totals and per item (book, pair of books, file) totals.
+
+    :param name: name of the run, e.g. the name of the function recorded
+    :param profile: one of PROFILERS or None
+    """
+
+    def __init__(self, name: str = 'worker', profile: str = None):
+        if profile is not None and profile not in PROFILERS:
+            raise ValueError(f'Unknown profiler {profile!r}, expected one of {PROFILERS}')
+        self.name = name
+        self.profile = profile
+        self.thread = threading.get_ident()
+        self.stages = {}
+        self.items = {}
+        self.workers_peak_rss = None
+        self._stack = []
+        self._attributed = 0.0
+        self._started = None
+        self._profiler = None
+        self._report_profile = None
+        self._wall = self._cpu = 0.0
+
+    def start(self) -> None:
+        self._started = time.strftime('%Y-%m-%dT%H:%M:%S')
+        if self.profile == 'cprofile':
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == 'tracemalloc':
+            import tracemalloc
+            self._profiler = not tracemalloc.is_tracing()
+            if self._profiler:
+                tracemalloc.start()
+        self._wall, self._cpu = time.perf_counter(), time.process_time()
+
+    def stop(self) -> None:
+        self._wall, self._cpu = time.perf_counter() - self._wall, time.process_time() - self._cpu
+        while self._stack:
+            self.exit()
+        if self.profile == 'cprofile':
+            self._profiler.disable()
+            self._report_profile = _cprofile_top(self._profiler)
+        elif self.profile == 'tracemalloc':
+            import tracemalloc
+            self._report_profile = _tracemalloc_top()
+            if self._profiler:
+                tracemalloc.stop()
+
+    def enter(self, stage: str, item=None) -> None:
+        wall, cpu = time.perf_counter(), time.process_time()
+        if self._stack:
+            parent = self._stack[-1]
+            self._charge(parent, wall, cpu)
+            # a stage nested in the same stage without an item of its own belongs to the item of the enclosing one
+            if item is None and parent[0] == stage:
+                item = parent[1]
+        self._stack.append([stage, item, wall, cpu])
+
+    def exit(self) -> None:
+        wall, cpu = time.perf_counter(), time.process_time()
+        frame = self._stack.pop()
+        self._charge(frame, wall, cpu)
+        totals = self._totals(frame[0])
+        totals[CALLS] += 1
+        rss = peak_rss()
+        if rss is not None and (totals[RSS] is None or rss > totals[RSS]):
+            totals[RSS] = rss
+        if self._stack:
+            self._stack[-1][2:] = wall, cpu
+
+    def count(self, stage: str, bytes: int = 0, tokens: int = 0, item=None) -> None:
+        if item is None and self._stack and self._stack[-1][0] == stage:
+            item = self._stack[-1][1]
+        totals = self._totals(stage)
+        totals[BYTES] += bytes
+        totals[TOKENS] += tokens
+        if item is not None:
+            values = self._item(stage, item)
+            values[2] += bytes
+            values[3] += tokens
+
+    def _charge(self, frame: list, wall: float, cpu: float) -> None:
+        stage, item, wall_start, cpu_start = frame
+        totals = self._totals(stage)
+        totals[WALL] += wall - wall_start
+        totals[CPU] += cpu - cpu_start
+        self._attributed += wall - wall_start
+        if item is not None:
+            values = self._item(stage, item)
+            values[0] += wall - wall_start
+            values[1] += cpu - cpu_start
+        frame[2:] = wall, cpu
+
+    def _totals(self, stage: str) -> list:
+        totals = self.stages.get(stage)
+        if totals is None:
+            totals = self.stages[stage] = [0, 0.0, 0.0, 0, 0, None]
+        return totals
+
+    def _item(self, stage: str, item) -> list:
+        # [wall time, CPU time, bytes, tokens]
+        items = self.items.setdefault(stage, {})
+        values = items.get(item)
+        if values is None:
+            if len(items) >= 2 * ITEMS_LIMIT:
+                slowest = sorted(items.items(), key=lambda entry: entry[1][0], reverse=True)[:ITEMS_LIMIT]
+                items.clear()
+                items.update(slowest)
+            values = items[item] = [0.0, 0.0, 0, 0]
+        return values
+
+    def take(self) -> dict:
+        """
+        :return: stage and item totals recorded since the last call (see merge()); they are reset
+        """
+        snapshot = {'stages': self.stages, 'items': self.items, 'peak_rss': peak_rss()}
+        self.stages, self.items = {}, {}
+        return snapshot
+
+    def merge(self, snapshot: dict) -> None:
+        """
+        Adds the totals recorded by another process (the output of take()) to the ones of this recorder.
+        """
+        for stage, other in snapshot['stages'].items():
+            totals = self._totals(stage)
+            for idx in (CALLS, WALL, CPU, BYTES, TOKENS):
+                totals[idx] += other[idx]
+            if other[RSS] is not None and (totals[RSS] is None or other[RSS] > totals[RSS]):
+                totals[RSS] = other[RSS]
+        for stage, items in snapshot['items'].items():
+            for item, other in items.items():
+                values = self._item(stage, item)
+                for idx in range(4):
+                    values[idx] += other[idx]
+        rss = snapshot['peak_rss']
+        if rss is not None and (self.workers_peak_rss is None or rss > self.workers_peak_rss):
+            self.workers_peak_rss = rss
+
+    def report(self) -> dict:
+        """
+        :return: JSON-serialisable report of the run
+        """
+        stages = {}
+        for stage in sorted(self.stages, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES)):
+            calls, wall, cpu, size, tokens, rss = self.stages[stage]
+            stages[stage] = {'calls': calls, 'wall_time': wall, 'cpu_time': cpu, 'bytes': size, 'tokens': tokens,
+                             'bytes_per_second': size / wall if wall else None,
+                             'tokens_per_second': tokens / wall if wall else None,
+                             'peak_rss': rss}
+        items = {stage: [{'item': item, 'wall_time': wall, 'cpu_time': cpu, 'bytes': size, 'tokens': tokens}
+                         for item, (wall, cpu, size, tokens) in sorted(stage_items.items(),
+                                                                       key=lambda entry: entry[1][0],
+                                                                       reverse=True)[:ITEMS_LIMIT]]
+                 for stage, stage_items in self.items.items()}
+        report = {'name': self.name, 'started': self._started, 'wall_time': self._wall, 'cpu_time': self._cpu,
+                  'unattributed_wall_time': max(0.0, self._wall - self._attributed),
+                  'peak_rss': peak_rss(), 'workers_peak_rss': self.workers_peak_rss,
+                  'stages': stages, 'items': items}
+        if self.profile is not None:
+            report['profile'] = {'profiler': self.profile, 'top': self._report_profile}
+        return report
+
+    def summary(self) -> str:
+        lines = [f'[{self.name}] /// {self._wall:.2f} s wall, {self._cpu:.2f} s CPU, '
+                 f'peak RSS {_megabytes(peak_rss())}']
+        for stage, values in self.report()['stages'].items():
+            lines.append(f'[{self.name}] /// {stage}: {values["wall_time"]:.2f} s wall, '
+                         f'{values["cpu_time"]:.2f} s CPU, {values["calls"]} call(s), '
+                         f'{values["bytes"] / 1e6:.2f} MB, {values["tokens"]} token(s)')
+        return '\n'.join(lines)
+
+
+def _megabytes(size) -> str:
+    return 'n/a' if size is None else f'{size / 2 ** 20:.0f} MB'
+
+
+def _cprofile_top(profiler) -> list:
+    import pstats
+    stats = pstats.Stats(profiler).sort_stats('cumulative')
+    top = []
+    for function in stats.fcn_list[:PROFILE_TOP]:
+        _, calls, total_time, cumulative_time, _ = stats.stats[function]
+        filename, line, name = function
+        top.append({'function': f'{filename}:{line}({name})', 'calls': calls,
+                    'total_time': total_time, 'cumulative_time': cumulative_time})
+    return top
+
+
+def _tracemalloc_top() -> dict:
+    import tracemalloc
+    _, traced_peak = tracemalloc.get_traced_memory()
+    statistics = tracemalloc.take_snapshot().statistics('lineno')[:PROFILE_TOP]
+    return {'traced_peak': traced_peak,
+            'allocations': [{'location': str(statistic.traceback), 'size': statistic.size, 'count': statistic.count}
+                            for statistic in statistics]}
+
+
+def set_metrics(recorder: MetricsRecorder = None) -> None:
+    """
+    Sets the recorder the hooks of the pipeline record into; None stops recording.
+
+    :param recorder: MetricsRecorder or None
+    :return: None
+    """
+    global _recorder
+    _recorder = recorder
+
+
+def get_metrics():
+    recorder = _recorder
+    if recorder is None or recorder.thread != threading.get_ident():
+        return None
+    return recorder
+
+
+@contextmanager
+def recording(name: str, report_path: str = None, profile: str = None):
+    """
+    Records the metrics of the code run within the context; nothing is recorded if neither report_path
+    nor profile is given. The report is written as JSON to report_path (even if the run fails)
+    and a summary is printed.
+
+    :param name: name of the run
+    :param report_path: path to the JSON report
+    :param profile: one of PROFILERS or None
+    :return: context manager giving the MetricsRecorder (or None)
+    """
+    if report_path is None and profile is None:
+        yield None
+        return
+
+    previous = _recorder
+    recorder = MetricsRecorder(name, profile)
+    set_metrics(recorder)
+    recorder.start()
+    try:
+        yield recorder
+    finally:
+        recorder.stop()
+        set_metrics(previous)
+        print(recorder.summary())
+        if report_path is not None:
+            save_report(recorder.report(), report_path)
+
+
+def save_report(report: dict, filepath: str) -> None:
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{filepath}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, filepath)
+
+
+class _Stage:
+    __slots__ = ('recorder', 'name', 'item')
+
+    def __init__(self, recorder: MetricsRecorder, name: str, item):
+        self.recorder = recorder
+        self.name = name
+        self.item = item
+
+    def __enter__(self):
+        self.recorder.enter(self.name, self.item)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.recorder.exit()
+
+
+def stage(name: str, item=None):
+    """
+    :param name: name of the stage (see STAGES)
+    :param item: the book, pair of books or file the stage is run for
+    :return: context manager timing the code run within it as the stage
+    """
+    recorder = get_metrics()
+    if recorder is None:
+        return _NO_STAGE
+    return _Stage(recorder, name, item)
+
+
+def timed(name: str, iterable, item=None):
+    """
+    :return: the iterable, which items are produced within the stage (for the stages that stream)
+    """
+    recorder = get_metrics()
+    if recorder is None:
+        return iterable
+    return _timed(recorder, name, iterable, item)
+
+
+def _timed(recorder: MetricsRecorder, name: str, iterable, item):
+    iterator = iter(iterable)
+    while True:
+        recorder.enter(name, item)
+        try:
+            value = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            recorder.exit()
+        yield value
+
+
+def count(stage: str, bytes: int = 0, tokens: int = 0, item=None) -> None:
+    """
+    Adds bytes and tokens to the stage (and to the item of the stage being run if the item is not given).
+    """
+    recorder = get_metrics()
+    if recorder is not None:
+        recorder.count(stage, bytes, tokens, item)
+
+
+def is_recording() -> bool:
+    return get_metrics() is not None
+
+
+def start_worker_metrics(enabled: bool) -> None:
+    """
+    Starts (or stops) recording in a worker process; see take_metrics().
+    """
+    set_metrics(MetricsRecorder() if enabled else None)
+
+
+def take_metrics():
+    """
+    :return: metrics recorded in the worker process since the last call (to be merged with merge_metrics())
+    or None if nothing is recorded
+    """
+    recorder = get_metrics()
+    return None if recorder is None else recorder.take()
+
+
+def merge_metrics(snapshot) -> None:
+    """
+    Adds the metrics sent back by a worker process (the output of take_metrics()) to the ones being recorded.
+    """
+    recorder = get_metrics()
+    if recorder is not None and snapshot is not None:
+        recorder.merge(snapshot)
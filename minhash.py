@@ -0,0 +1,165 @@
+from typing import NamedTuple
+import math
+
+import numpy as np
+
+from n_grams import mix64
+
+
+"""
+This module implements approximate similarity measuring for large corpora.
+    Included:
+        MinHash signatures of n-gram sets and vocabularies (estimate Jaccard coefficients)
+        weighted MinHash signatures of n-gram counters (estimate Tanimoto coefficients, ICWS by S. Ioffe)
+        LSH index that finds candidate similar books without comparing to every book
+Every estimate is a share of equal signature positions, so its standard error is at most 1 / (2 * sqrt(num_perm)).
+"""
+
+
+NUM_PERM = 128
+
+_MAX_HASH = np.iinfo(np.uint64).max
+_CHUNK_SIZE = 4096
+
+
+class MinHashProfile(NamedTuple):
+    ngram_signature: np.ndarray
+    vocab_signature: np.ndarray
+    weighted_signature: np.ndarray
+
+
+def _seeds(num_perm: int, salt: int) -> np.ndarray:
+    return mix64(np.arange(num_perm, dtype=np.uint64) + np.uint64(salt * num_perm + 1))
+
+
+def _uniform(hashes: np.ndarray) -> np.ndarray:
+    # 53 high bits of the hash as a float in (0, 1)
+    return ((hashes >> np.uint64(11)).astype(np.float64) + 0.5) / float(1 << 53)
+
+
+def minhash_signature(keys: np.ndarray, num_perm: int = NUM_PERM) -> np.ndarray:
+    """
+    :param keys: unique uint64 keys of the set (see n_grams.CompactProfile)
+    :param num_perm: number of hash functions
+    :return: uint64 array of minimal hashes
+    """
+    seeds = _seeds(num_perm, 0)
+    signature = np.full(num_perm, _MAX_HASH, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for start in range(0, len(keys), _CHUNK_SIZE):
+            chunk = keys[start: start + _CHUNK_SIZE].astype(np.uint64)
+            hashes = mix64(chunk[:, None] ^ seeds[None, :])
+            np.minimum(signature, hashes.min(axis=0), out=signature)
+    return signature
+
+
+def weighted_minhash_signature(keys: np.ndarray, counts: np.ndarray, num_perm: int = NUM_PERM) -> np.ndarray:
+    """
+    Improved consistent weighted sampling: the probability that two signatures agree in a position
+    equals sum(min(x, y)) / sum(max(x, y)) of the weights, i.e. the Tanimoto coefficient.
+
+    :param keys: unique uint64 keys of the weighted set
+    :param counts: weights of the keys
+    :param num_perm: number of hash functions
+    :return: uint64 array of hashes of the sampled (key, level) elements
+    """
+    seeds = [_seeds(num_perm, salt) for salt in range(1, 6)]
+    signature = np.full(num_perm, _MAX_HASH, dtype=np.uint64)
+    best = np.full(num_perm, np.inf)
+    with np.errstate(over='ignore'):
+        for start in range(0, len(keys), _CHUNK_SIZE):
+            chunk = keys[start: start + _CHUNK_SIZE].astype(np.uint64)[:, None]
+            log_weights = np.log(counts[start: start + _CHUNK_SIZE].astype(np.float64))[:, None]
+            u1, u2, u3, u4, beta = (_uniform(mix64(chunk ^ seed[None, :])) for seed in seeds)
+
+            r = -np.log(u1 * u2)
+            c = -np.log(u3 * u4)
+            t = np.floor(log_weights / r + beta)
+            a = np.log(c) - r * (t - beta) - r
+
+            rows = a.argmin(axis=0)
+            columns = np.arange(num_perm)
+            chunk_best = a[rows, columns]
+            better = chunk_best < best
+            best[better] = chunk_best[better]
+            sampled = chunk[rows, 0] ^ mix64(t[rows, columns].astype(np.int64).astype(np.uint64))
+            signature[better] = mix64(sampled)[better]
+    return signature
+
+
+def minhash_profile(profile, num_perm: int = NUM_PERM) -> MinHashProfile:
+    """
+    :param profile: n_grams.CompactProfile
+    :param num_perm: number of hash functions
+    :return: MinHashProfile
+    """
+    return MinHashProfile(minhash_signature(profile.ngram_keys, num_perm),
+                          minhash_signature(profile.vocab_ids.astype(np.uint64), num_perm),
+                          weighted_minhash_signature(profile.ngram_keys, profile.ngram_counts, num_perm))
+
+
+def estimate_similarity(signature1: np.ndarray, signature2: np.ndarray) -> float:
+    """
+    Estimates Jaccard (or Tanimoto for weighted signatures) coefficient as a share of equal positions.
+    """
+    # signatures of empty sets consist of maximal hashes only and are similar to nothing
+    if (signature1 == _MAX_HASH).all() or (signature2 == _MAX_HASH).all():
+        return 0.0
+    return float(np.mean(signature1 == signature2))
+
+
+def approximate_similarity(profile1: MinHashProfile, profile2: MinHashProfile) -> dict:
+    """
+    The approximate version of corpus_processing.pair_similarity().
+
+    :param profile1: MinHashProfile
+    :param profile2: MinHashProfile
+    :return: dict with estimated similarity parameters
+    """
+    return {'jaccard_ngram': estimate_similarity(profile1.ngram_signature, profile2.ngram_signature),
+            'jaccard_vocab': estimate_similarity(profile1.vocab_signature, profile2.vocab_signature),
+            'tanimoto_ngram_counter': estimate_similarity(profile1.weighted_signature, profile2.weighted_signature)}
+
+
+def error_bound(num_perm: int = NUM_PERM) -> float:
+    """
+    :return: the maximal standard error of an estimate made with num_perm hash functions
+    """
+    return 1 / (2 * math.sqrt(num_perm))
+
+
+class LSHIndex:
+    """
+    Locality-sensitive hashing index of MinHash signatures: signatures are split into bands,
+    books that share at least one band are candidates. With b bands of r rows, a pair with similarity s
+    becomes a candidate with probability 1 - (1 - s^r)^b.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = 32):
+        if num_perm % bands:
+            raise ValueError(f'num_perm ({num_perm}) must be divisible by bands ({bands})')
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.buckets = [{} for _ in range(bands)]
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows: (band + 1) * self.rows].tobytes()
+
+    def add(self, name, signature: np.ndarray) -> None:
+        for band, key in self._band_keys(signature):
+            self.buckets[band].setdefault(key, set()).add(name)
+
+    def remove(self, name, signature: np.ndarray) -> None:
+        for band, key in self._band_keys(signature):
+            self.buckets[band].get(key, set()).discard(name)
+
+    def query(self, signature: np.ndarray) -> set:
+        """
+        :param signature: MinHash signature of the query book
+        :return: set of names of the candidate books
+        """
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self.buckets[band].get(key, ()))
+        return candidates
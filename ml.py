@@ -1,85 +1,169 @@
 import os
-import pandas as pd
 import random
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import classification_report, accuracy_score
-from xgboost import XGBClassifier
-from sklearn.utils.class_weight import compute_sample_weight
 
-from progress_monitor import progress_bar
-from writers_and_readers import txt_reader
+import numpy as np
+
+from feature_table import load_feature_columns, is_feature_file
 
 
 """
-Choosing parameters (N for ngrams, normalized or not)
+This module trains the classifier that tells whether two books are written by the same author.
+A sample is the feature vector of a pair of books: [jaccard_ngram, jaccard_vocab, tanimoto_ngram_counter].
+Fitted models are kept and reused by model_registry.py.
+scikit-learn and XGBoost are imported only when a model is trained, so that importing the module stays cheap.
 """
 
-# parameters
-N = 3
-normalized = True
-
-if normalized:
-    directory = f"values_normalised/N={N}"
-else: 
-    directory = f"values/N={N}"
-values = []
-labels = []
-auth_types = ["auth1_auth1", "auth1_auth2"]
-for auth_type in auth_types:
-    for path, _, files in os.walk(directory):
-        for file in files:
-            lit_dict = eval(txt_reader(os.path.join(path, file)))
-            vals = [[list(value.values())[0], list(value.values())[1], list(value.values())[2]] for value in lit_dict.values()]
-            values.extend(vals)
-            if auth_type == "auth1_auth1":
-                labels.append(1)
-            else: 
-                labels.append(0)
-
-combined = list(zip(values, labels))
-shuffled = random.shuffle(combined)
-values_shuffled, labels_shuffled = zip(*combined)
-
-values_shuffled = list(values_shuffled)
-labels_shuffled = list(labels_shuffled)
 
-"""
-Training the classificator
-"""
+SAME_AUTHOR = 0
+DIFFERENT_AUTHORS = 1
+
+XGBOOST_PARAMS = {
+    'random_state': 42,
+    'n_jobs': -1,
+    'objective': "binary:logistic",
+    'eval_metric': "aucpr",
+    'n_estimators': 300,
+    'learning_rate': 0.01,
+    'max_depth': 8,
+    'subsample': 0.8,
+    'colsample_bytree': 1.0,
+    'tree_method': "hist",
+}
+
+
+def load_training_data(stats_path):
+    """
+    :param stats_path: path to the folder with values of one configuration (e.g. 'values/N=3/')
+    :return: (feature vectors of the same author pairs, feature vectors of the different authors pairs)
+    """
+    auth1_auth1, auth1_auth2 = [], []
+
+    for root, _, files in os.walk(stats_path):
+        for file in sorted(files):
+            if not is_feature_file(file):
+                continue
+            _, _, features = load_feature_columns(os.path.join(root, file))
+            book_values = features.tolist()
+
+            if 'auth1–auth1' in root:
+                auth1_auth1.extend(book_values)
+            elif 'auth1–auth2' in root:
+                auth1_auth2.extend(book_values)
+
+    return auth1_auth1, auth1_auth2
+
+
+def training_set(auth1_data, auth2_data) -> tuple:
+    """
+    :return: (samples array, labels array); same author pairs are labelled SAME_AUTHOR, the rest DIFFERENT_AUTHORS
+    """
+    values = np.array(list(auth1_data) + list(auth2_data), dtype=np.float64).reshape(-1, 3)
+    labels = np.array([SAME_AUTHOR] * len(auth1_data) + [DIFFERENT_AUTHORS] * len(auth2_data))
+    return values, labels
+
+
+def fit_model(values, labels, params: dict = None) -> tuple:
+    """
+    Fits the scaler and the classifier on the samples (classes are balanced with sample weights).
+
+    :param values: samples array (see training_set())
+    :param labels: labels array
+    :param params: parameters of XGBClassifier; XGBOOST_PARAMS by default
+    :return: (fitted StandardScaler, fitted XGBClassifier)
+    """
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.utils.class_weight import compute_sample_weight
+    from xgboost import XGBClassifier
+
+    scaler = StandardScaler()
+    values = scaler.fit_transform(values)
+
+    model = XGBClassifier(**(XGBOOST_PARAMS if params is None else params))
+    model.fit(values, labels, sample_weight=compute_sample_weight(class_weight='balanced', y=labels))
+    return scaler, model
+
+
+def train_model(auth1_data, auth2_data) -> tuple:
+    """
+    Fits the scaler and the classifier on all the given pairs (see fit_model()).
+
+    :param auth1_data: feature vectors of the same author pairs
+    :param auth2_data: feature vectors of the different authors pairs
+    :return: (fitted StandardScaler, fitted XGBClassifier)
+    """
+    return fit_model(*training_set(auth1_data, auth2_data))
+
+
+def model_predict(scaler, model, test_features) -> list:
+    """
+    :param scaler: fitted StandardScaler
+    :param model: fitted XGBClassifier
+    :param test_features: list of feature vectors
+    :return: list of labels (SAME_AUTHOR or DIFFERENT_AUTHORS)
+    """
+    return model.predict(scaler.transform(np.array(test_features, dtype=np.float64))).tolist()
+
+
+def predict(auth1_data, auth2_data, test_features) -> list:
+    """
+    Trains a model and applies it at once (see model_registry.get_model() to train a model only once).
+    """
+    scaler, model = train_model(auth1_data, auth2_data)
+    return model_predict(scaler, model, test_features)
+
+
+if __name__ == '__main__':
+    """
+    A single split of one configuration; see evaluation.py for cross-validation of all the configurations
+    Choosing parameters (N for ngrams, normalized or not)
+    """
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.metrics import classification_report, accuracy_score
+    from xgboost import XGBClassifier
+    from sklearn.utils.class_weight import compute_sample_weight
+
+    # parameters
+    N = 3
+    normalized = True
+
+    if normalized:
+        directory = f"values_normalised/N={N}"
+    else:
+        directory = f"values/N={N}"
+
+    auth1_data, auth2_data = load_training_data(directory)
+    values, labels = training_set(auth1_data, auth2_data)
+
+    combined = list(zip(values.tolist(), labels.tolist()))
+    random.shuffle(combined)
+    values_shuffled, labels_shuffled = zip(*combined)
+
+    values_shuffled = list(values_shuffled)
+    labels_shuffled = list(labels_shuffled)
+
+    """
+    Training the classificator
+    """
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        values_shuffled, labels_shuffled, test_size=0.3, random_state=42, stratify=labels_shuffled
+    )
+
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(X_train)
+    X_test = scaler.transform(X_test)
+
+    sample_weights = compute_sample_weight(class_weight='balanced', y=y_train)
+
+    model = XGBClassifier(**XGBOOST_PARAMS)
+
+    print("\nОбучаем модель...")
+    model.fit(X_train, y_train, sample_weight=sample_weights)
+
+    y_pred = model.predict(X_test)
+    print("\n=== Отчёт по классификации ===")
+    print(classification_report(y_test, y_pred, digits=3))
 
-count_class_0 = labels_shuffled.count(0)
-count_class_1 = labels_shuffled.count(1)
-
-X_train, X_test, y_train, y_test = train_test_split(
-    values_shuffled, labels_shuffled, test_size=0.3, random_state=42, stratify=labels_shuffled
-)
-
-scaler = StandardScaler()
-X_train = scaler.fit_transform(X_train)
-X_test = scaler.transform(X_test)
-
-sample_weights = compute_sample_weight(class_weight='balanced', y = y_train)
-
-model = XGBClassifier(
-    random_state=42,
-    n_jobs=-1,
-    objective="binary:logistic",
-    eval_metric="aucpr",
-    n_estimators=300,
-    learning_rate=0.01,
-    max_depth=8,
-    subsample=0.8,
-    colsample_bytree=1.0,
-    tree_method="hist"
-)
-
-print("\nОбучаем модель...")
-model.fit(X_train, y_train, sample_weight=sample_weights)
-
-y_pred = model.predict(X_test)
-print("\n=== Отчёт по классификации ===")
-print(classification_report(y_test, y_pred, digits=3))
-
-accuracy = accuracy_score(y_test, y_pred)
-print(f"\nТочность модели: {accuracy:.3f}")
+    accuracy = accuracy_score(y_test, y_pred)
+    print(f"\nТочность модели: {accuracy:.3f}")
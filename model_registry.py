@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from ml import load_training_data, train_model, XGBOOST_PARAMS
+from feature_table import is_feature_file
+from feature_store import file_digest
+
+
+"""
+This module keeps fitted classifiers, so that a model is trained once per training set and reused
+by every comparison (in this process and in other ones).
+Models are keyed by (N, lemmatised, fingerprint of the training data); a fingerprint covers the contents of
+the files with values and the training parameters, so a model is retrained only when one of them changes.
+On disk a model is a folder <stats_path>/models/<configuration>-<fingerprint>/ with
+    scaler.json: parameters of the fitted StandardScaler
+    model.json: the fitted XGBClassifier in the XGBoost JSON format
+"""
+
+
+MODELS_FOLDER = 'models'
+MODEL_FORMAT_VERSION = 1
+
+_models = {}
+# (path to the values, state of the files) -> fingerprint, so unchanged files are not digested again
+_fingerprints = {}
+
+
+def values_path(stats_path: str, N: int, lemmatised: bool) -> str:
+    """
+    :param stats_path: path to the directory with the folders of values
+    :param N: parameter for N-grams
+    :param lemmatised: True/False depending on whether the values are measured on lemmatised texts
+    :return: path to the folder with values of the configuration
+    """
+    return os.path.join(stats_path, 'values_lemmatised' if lemmatised else 'values', f'N={N}')
+
+
+def training_data_fingerprint(path: str) -> str:
+    """
+    :param path: path to the folder with values of one configuration
+    :return: hex digest of the contents of the files with values and of the training parameters
+    """
+    files = sorted(os.path.join(root, file) for root, _, names in os.walk(path) for file in names
+                   if is_feature_file(file))
+    state = tuple((file, os.stat(file).st_size, os.stat(file).st_mtime_ns) for file in files)
+    key = (os.path.abspath(path), state)
+    if key not in _fingerprints:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f'{MODEL_FORMAT_VERSION}\x00{sorted(XGBOOST_PARAMS.items())}\x00'.encode())
+        for file in files:
+            digest.update(f'{os.path.relpath(file, path)}\x00{file_digest(file)}\x00'.encode())
+        _fingerprints[key] = digest.hexdigest()
+    return _fingerprints[key]
+
+
+def save_model(folder: str, scaler: 'StandardScaler', model: 'XGBClassifier') -> None:
+    """
+    Writes the model into the folder; the folder appears only when the model is completely written.
+    """
+    tmp_folder = f'{folder}.{os.getpid()}.tmp'
+    os.makedirs(tmp_folder, exist_ok=True)
+    with open(os.path.join(tmp_folder, 'scaler.json'), 'w', encoding='utf-8') as f:
+        json.dump({'mean': scaler.mean_.tolist(),
+                   'scale': scaler.scale_.tolist(),
+                   'var': scaler.var_.tolist(),
+                   'n_samples_seen': int(scaler.n_samples_seen_)}, f)
+    model.save_model(os.path.join(tmp_folder, 'model.json'))
+
+    try:
+        os.rename(tmp_folder, folder)
+    except OSError:
+        # another process has saved the same model in the meantime
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+
+
+def load_model(folder: str) -> tuple:
+    """
+    :param folder: folder of the model written by save_model()
+    :return: (fitted StandardScaler, fitted XGBClassifier)
+    """
+    from sklearn.preprocessing import StandardScaler
+    from xgboost import XGBClassifier
+
+    with open(os.path.join(folder, 'scaler.json'), encoding='utf-8') as f:
+        parameters = json.load(f)
+    scaler = StandardScaler()
+    scaler.mean_ = np.array(parameters['mean'])
+    scaler.scale_ = np.array(parameters['scale'])
+    scaler.var_ = np.array(parameters['var'])
+    scaler.n_samples_seen_ = parameters['n_samples_seen']
+    scaler.n_features_in_ = len(scaler.mean_)
+
+    model = XGBClassifier()
+    model.load_model(os.path.join(folder, 'model.json'))
+    return scaler, model
+
+
+def get_model(stats_path: str, N: int, lemmatised: bool) -> tuple:
+    """
+    Returns the model trained on the values of the configuration: from memory, from disk or trained anew
+    (and saved, while the models trained on the outdated values are removed).
+
+    :param stats_path: path to the directory with the folders of values
+    :param N: parameter for N-grams
+    :param lemmatised: True/False depending on whether the values are measured on lemmatised texts
+    :return: (fitted StandardScaler, fitted XGBClassifier)
+    """
+    path = values_path(stats_path, N, lemmatised)
+    fingerprint = training_data_fingerprint(path)
+    key = (os.path.abspath(path), fingerprint)
+    if key in _models:
+        return _models[key]
+
+    configuration = f'N={N}-{"lemmatised" if lemmatised else "raw"}'
+    models_folder = os.path.join(stats_path, MODELS_FOLDER)
+    folder = os.path.join(models_folder, f'{configuration}-{fingerprint}')
+    if os.path.isdir(folder):
+        _models[key] = load_model(folder)
+        return _models[key]
+
+    auth1_data, auth2_data = load_training_data(path)
+    if not auth1_data or not auth2_data:
+        raise ValueError(f'There are no values of both classes in {path} to train a model on')
+    print(f'[get_model] /// Training a model on {len(auth1_data) + len(auth2_data)} pairs ({configuration})')
+    scaler, model = train_model(auth1_data, auth2_data)
+
+    os.makedirs(models_folder, exist_ok=True)
+    save_model(folder, scaler, model)
+    for name in os.listdir(models_folder):
+        stale_folder = os.path.join(models_folder, name)
+        if name.startswith(f'{configuration}-') and stale_folder != folder and not name.endswith('.tmp'):
+            shutil.rmtree(stale_folder, ignore_errors=True)
+
+    _models[key] = scaler, model
+    return _models[key]
@@ -1,8 +1,13 @@
-import nltk
 import string
 from collections import Counter
+from array import array
+from typing import NamedTuple
 import math
+import threading
+import numpy as np
 from string_cleaner import punctuation_cleaning
+from tokenisation import get_tokenizer
+from metrics import count
 
 
 def reader(file, encoding='utf-8'):
@@ -18,21 +23,30 @@ def prepare_train_test_data(input_texts):
     return train_data, test_data
 
 
-# transforming the input texts into sentences of "<s> ... </s>" form
-def make_sentence_list(texts, N):
-    N_1 = N - 1
-    result_sentences = []
+# transforming the input texts into tokenized sentences (without the "<s> ... </s>" padding, it depends on N)
+def iter_tokenized_sentences(texts):
+    tokenizer = get_tokenizer()
     for text in texts:
-        sentences = nltk.tokenize.sent_tokenize(text)
+        sentences = tokenizer.sentences(text)
         for sentence in sentences:
-            sentence = str('<s> ' * N_1 + punctuation_cleaning(sentence) + ' </s>')
-            sentence = sentence.lower().split()
+            tokens = punctuation_cleaning(sentence).lower().split()
+            count('ngram', tokens=len(tokens))
+            yield tokens
+
+
+# transforming the tokenized sentence into "<s> ... </s>" form
+def pad_sentence(tokens, N):
+    return ['<s>'] * (N - 1) + tokens + ['</s>']
 
-            if len(sentence) == 0:
-                continue
 
-            result_sentences.append(sentence)
-    return result_sentences
+# transforming the input texts into sentences of "<s> ... </s>" form
+def iter_sentences(texts, N):
+    for tokens in iter_tokenized_sentences(texts):
+        yield pad_sentence(tokens, N)
+
+
+def make_sentence_list(texts, N):
+    return list(iter_sentences(texts, N))
 
 
 # transforming the input sentence into n_grams
@@ -73,9 +87,217 @@ def get_sentence_probability(sentence, ngram_counter, n_1gram_counter, vocab):
     return sentence_probability
 
 
-def n_grams_main(data, N):
+def n_grams_main(data, N, compact=False, vocab=None):
+    if compact:
+        # the compact form never materialises n-grams as tuples of strings
+        return get_compact_profile(iter_sentences(data, N), N, vocab)
+
     sentences = make_sentence_list(data, N)
     ngram_counter, n_1gram_counter, vocab = get_ngram_dict(sentences, N)
     n_gram = set([item for i in sentences for item in get_n_grams_for_sentence(i, N)])
 
     return [ngram_counter, vocab, n_gram]
+
+
+# counting n_grams of one order only (n_grams_main() does not use the n_1gram counter)
+def get_ngram_profile(sentences, N):
+    vocab = set()
+    ngram_counter = Counter()
+
+    for sentence in sentences:
+        vocab.update(sentence)
+        ngram_counter.update(zip(*(sentence[i:] for i in range(N))))
+
+    vocab.add('<unk>')
+    return [ngram_counter, vocab, set(ngram_counter)]
+
+
+def n_grams_orders(data, orders, compact=False) -> dict:
+    """
+    n_grams_main() for several N at once: the texts are tokenized once and the n-grams of every order
+    are counted over the same sentences (only the "<s> ... </s>" padding differs between the orders,
+    so the n-grams of N - 1 are not a part of the ones of N and each order is counted on its own).
+
+    :param data: book text or list of its lines
+    :param orders: iterable of N
+    :param compact: whether the profiles are in the compact form
+    :return: dictionary {N: the output of n_grams_main(data, N, compact)}
+    """
+    orders = list(orders)
+    if not orders:
+        return {}
+
+    sentences = list(iter_tokenized_sentences(data))
+    profiles = {}
+    for N in orders:
+        padded = (pad_sentence(tokens, N) for tokens in sentences)
+        profiles[N] = get_compact_profile(padded, N) if compact else get_ngram_profile(padded, N)
+    return profiles
+
+
+"""
+Code section with the compact representation of n-grams.
+    Words are interned to int32 ids, n-grams are encoded as 64-bit keys:
+        N <= 2: ids are packed into the key, so the keys are exact
+        N > 2: ids are hashed into the key (splitmix64), so two distinct n-grams may share a key: the expected
+            number of such pairs among K distinct n-grams is about K^2 / 2^65 (3e-4 for 10^8 n-grams), and a shared key
+            makes the values measured over the keys differ from the ones measured over the n-grams themselves
+    A compact profile stores sorted unique keys with their counts and sorted vocabulary ids.
+    Profiles are comparable only if they were encoded with the same Vocabulary.
+"""
+
+
+class Vocabulary:
+    """
+    Maps words to int32 ids (and back). New words may be added from several threads at once.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.words = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.words)
+
+    def word_id(self, word: str) -> int:
+        word_id = self.ids.get(word)
+        if word_id is None:
+            with self._lock:
+                word_id = self.ids.get(word)
+                if word_id is None:
+                    word_id = len(self.words)
+                    self.words.append(word)
+                    self.ids[word] = word_id
+        return word_id
+
+    def encode(self, words) -> np.ndarray:
+        return np.fromiter((self.word_id(word) for word in words), dtype=np.int32)
+
+    def decode(self, ids) -> list:
+        return [self.words[i] for i in ids]
+
+
+# the vocabulary shared by all the compact profiles of the process
+vocabulary = Vocabulary()
+
+
+class ScratchVocabulary:
+    """
+    Vocabulary of a single profile that must not grow the shared one (e.g. of a text sent to the service):
+    words of the shared vocabulary keep their ids, new words get ids counted down from the largest int32,
+    so the profile is comparable with the profiles of the shared vocabulary and is dropped along with its words.
+    """
+
+    def __init__(self, base: Vocabulary = None):
+        self.base = vocabulary if base is None else base
+        self.ids = {}
+
+    def word_id(self, word: str) -> int:
+        word_id = self.base.ids.get(word)
+        if word_id is None:
+            word_id = self.ids.get(word)
+            if word_id is None:
+                word_id = self.ids[word] = np.iinfo(np.int32).max - len(self.ids)
+        return word_id
+
+    def encode(self, words) -> np.ndarray:
+        return np.fromiter((self.word_id(word) for word in words), dtype=np.int32)
+
+
+class CompactProfile(NamedTuple):
+    ngram_keys: np.ndarray
+    ngram_counts: np.ndarray
+    vocab_ids: np.ndarray
+
+
+_SEED = np.uint64(0x9E3779B97F4A7C15)
+
+
+def mix64(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer, a bijection of uint64
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def encode_n_grams(ids: np.ndarray, N: int) -> np.ndarray:
+    """
+    Encodes all the n-grams of the id sequence as 64-bit keys; the keys of N > 2 are hashes (see above).
+
+    :param ids: word ids of a sentence (or of several sentences, see get_compact_profile())
+    :param N: parameter for N-grams
+    :return: uint64 array of length len(ids) - N + 1
+    """
+    n = len(ids) - N + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64)
+
+    ids = ids.astype(np.uint64)
+    with np.errstate(over='ignore'):
+        if N <= 2:
+            keys = np.zeros(n, dtype=np.uint64)
+            for j in range(N):
+                keys = (keys << np.uint64(32)) | ids[j: j + n]
+        else:
+            keys = np.full(n, _SEED, dtype=np.uint64)
+            for j in range(N):
+                keys = mix64(keys ^ ids[j: j + n])
+    return keys
+
+
+def get_compact_profile(sentences, N, vocab=None) -> CompactProfile:
+    """
+    Counts n-grams of the sentences in the compact form.
+    Sentences are consumed one by one, only their word ids are kept in memory.
+
+    :param sentences: iterable of tokenized sentences
+    :param N: parameter for N-grams
+    :param vocab: Vocabulary to encode the words with; the shared one by default
+    :return: CompactProfile
+    """
+    if vocab is None:
+        vocab = vocabulary
+
+    ids = array('i')
+    sentence_ends = array('q')
+    for sentence in sentences:
+        ids.extend(vocab.word_id(word) for word in sentence)
+        sentence_ends.append(len(ids))
+
+    ids = np.frombuffer(ids, dtype=np.int32) if len(ids) else np.empty(0, dtype=np.int32)
+    sentence_ends = np.frombuffer(sentence_ends, dtype=np.int64) if len(sentence_ends) else np.empty(0, dtype=np.int64)
+
+    # n-grams are encoded over the whole id stream at once, then the ones crossing sentence borders are dropped
+    keys = encode_n_grams(ids, N)
+    if len(keys):
+        sentence_lengths = np.diff(sentence_ends, prepend=0)
+        ends = np.repeat(sentence_ends, sentence_lengths)[:len(keys)]
+        keys = keys[ends - np.arange(len(keys)) >= N]
+
+    ngram_keys, ngram_counts = np.unique(keys, return_counts=True)
+    vocab_ids = np.union1d(ids, np.array([vocab.word_id('<unk>')], dtype=np.int32))
+
+    return CompactProfile(ngram_keys, ngram_counts.astype(np.int64), vocab_ids.astype(np.int32))
+
+
+def to_compact_profile(profile, N, vocab=None) -> CompactProfile:
+    """
+    Converts the output of n_grams_main() i.e. [ngram counter, vocabulary, ngram set] to the compact form.
+    """
+    if vocab is None:
+        vocab = vocabulary
+
+    ngram_counter, words, _ = profile
+    if ngram_counter:
+        ids = vocab.encode(word for ngram in ngram_counter for word in ngram)
+        keys = encode_n_grams(ids, N)[::N]
+        order = np.argsort(keys)
+        ngram_keys = keys[order]
+        ngram_counts = np.fromiter(ngram_counter.values(), dtype=np.int64, count=len(ngram_counter))[order]
+    else:
+        ngram_keys = np.empty(0, dtype=np.uint64)
+        ngram_counts = np.empty(0, dtype=np.int64)
+    vocab_ids = np.unique(vocab.encode(words))
+
+    return CompactProfile(ngram_keys, ngram_counts, vocab_ids)
@@ -0,0 +1,71 @@
+import itertools
+
+
+"""
+This module enumerates the pairs of books (or authors) to be compared without any bookkeeping of the pairs seen.
+The pairs of two lists of names are all (name1, name2) of their product where name1 != name2,
+every unordered pair taken only once, in the order of the product:
+    the same list twice: the pairs are itertools.combinations() of the list
+    lists without common names: the pairs are itertools.product() of the lists
+    other lists: the pairs of the product are filtered with a set of the pairs seen (rare, e.g. equally named books)
+The number of the pairs is known without enumerating them (except for the filtered ones).
+"""
+
+
+class PairSchedule:
+    """
+    :param names1: names of the first list (e.g. books of the first author)
+    :param names2: names of the second list
+    """
+
+    def __init__(self, names1, names2):
+        self.names1 = list(names1)
+        self.names2 = list(names2)
+        self._pairs = None
+
+        if self.names1 == self.names2:
+            self.kind = 'combinations'
+            n = len(self.names1)
+            self._length = n * (n - 1) // 2
+        elif not set(self.names1).intersection(self.names2):
+            self.kind = 'product'
+            self._length = len(self.names1) * len(self.names2)
+        else:
+            self.kind = 'filtered'
+            self._pairs = []
+            seen = set()
+            for name1 in self.names1:
+                for name2 in self.names2:
+                    if name1 == name2 or (name2, name1) in seen:
+                        continue
+                    seen.add((name1, name2))
+                    self._pairs.append((name1, name2))
+            self._length = len(self._pairs)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self):
+        """
+        :return: iterator of (name1, name2)
+        """
+        if self.kind == 'combinations':
+            return itertools.combinations(self.names1, 2)
+        if self.kind == 'product':
+            return itertools.product(self.names1, self.names2)
+        return iter(self._pairs)
+
+
+def unordered_pairs(names1, names2):
+    """
+    :return: generator of the pairs of the names (see PairSchedule)
+    """
+    return iter(PairSchedule(names1, names2))
+
+
+def chunked(items: list, chunk_size: int):
+    """
+    Yields consecutive slices of the list of at most chunk_size items.
+    """
+    for start in range(0, len(items), chunk_size):
+        yield items[start: start + chunk_size]
@@ -0,0 +1,194 @@
+import hashlib
+
+from n_grams import n_grams_main, n_grams_orders, to_compact_profile, ScratchVocabulary
+from feature_store import get_store, load_profile, save_profile, has_profile
+from minhash import minhash_profile
+from tokenisation import get_tokenizer, DEFAULT_TOKENIZER
+from metrics import stage
+
+
+"""
+This module keeps n-gram profiles of the books, so that each book is processed only once per configuration.
+A profile comes in one of PROFILE_FORMS:
+    'counter': the output of n_grams_main() i.e. [ngram counter, vocabulary, ngram set]
+    'compact': n_grams.CompactProfile
+    'minhash': minhash.MinHashProfile (for approximate measuring)
+If the feature store is set (see feature_store.set_store()), profiles are also persisted between runs.
+If a sweep of N is set (see set_sweep()), a book profiled with one of them is profiled with all of them at once.
+"""
+
+
+PROFILE_FORMS = ('counter', 'compact', 'minhash')
+
+_profiles = {}
+_sweep = ()
+
+
+def text_digest(data) -> str:
+    """
+    Computes a content digest of the data passed to n_grams_main().
+    Texts (str) and lists of lines are digested differently, because n_grams_main() processes them differently.
+    So are the texts tokenized with other tokenizers than the default one (see tokenisation.py).
+
+    :param data: book text or list of its lines
+    :return: hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    tokenizer = get_tokenizer().name
+    if tokenizer != DEFAULT_TOKENIZER:
+        digest.update(f'tokenizer={tokenizer}\x00'.encode('utf-8'))
+    if isinstance(data, str):
+        digest.update(b'str\x00')
+        digest.update(data.encode('utf-8', 'surrogatepass'))
+    else:
+        digest.update(b'lines\x00')
+        for line in data:
+            digest.update(line.encode('utf-8', 'surrogatepass'))
+            digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def book_profile(data, N: int, form: str = 'counter', scratch: ScratchVocabulary = None):
+    """
+    Returns n-gram profile of the book, computing it only if it has not been computed before.
+    Profiles are keyed by the content of the book, so lemmatised and non-lemmatised versions
+    of the same book (as well as books with equal names in different folders) never collide.
+
+    :param data: book text or list of its lines
+    :param N: parameter for N-grams; in this project (N = 2; N = 3; N = 4) are conventionally used
+    :param form: one of PROFILE_FORMS
+    :param scratch: for one-off texts (e.g. the ones sent to the service): the profile is neither kept in memory
+        nor in the feature store and the words new to the shared vocabulary are encoded with scratch
+        (profiles measured against each other have to share it)
+    :return: [ngram counter, vocabulary, ngram set], n_grams.CompactProfile or minhash.MinHashProfile
+    """
+    digest = text_digest(data)
+    key = (digest, N, form)
+    profile = _profiles.get(key)
+    if profile is not None:
+        return profile
+
+    with stage('ngram'):
+        if form == 'minhash':
+            profile = minhash_profile(book_profile(data, N, 'compact', scratch))
+        elif form not in PROFILE_FORMS:
+            raise ValueError(f'Unknown profile form {form!r}, expected one of {PROFILE_FORMS}')
+        elif scratch is not None:
+            profile = n_grams_main(data, N, compact=form == 'compact', vocab=scratch)
+        elif N in _sweep:
+            _profile_sweep(data, digest, N, form)
+            return _profiles[key]
+        elif get_store() is not None:
+            # the store keeps profiles in the vocabulary-independent form only
+            store_path = get_store()
+            profile = load_profile(store_path, digest, N)
+            if profile is None:
+                profile = n_grams_main(data, N)
+                save_profile(store_path, digest, N, profile)
+            if form == 'compact':
+                profile = to_compact_profile(profile, N)
+        else:
+            profile = n_grams_main(data, N, compact=form == 'compact')
+
+    if scratch is None:
+        _profiles[key] = profile
+    return profile
+
+
+def _profile_sweep(data, digest: str, N: int, form: str) -> None:
+    """
+    Profiles the book with N and with the rest of the N of the sweep which profiles are not known yet;
+    the text is tokenized only once for all of them (see n_grams.n_grams_orders()).
+    """
+    store_path = get_store()
+    if store_path is None:
+        orders = [order for order in _sweep if (digest, order, form) not in _profiles]
+        for order, profile in n_grams_orders(data, orders, compact=form == 'compact').items():
+            _profiles[digest, order, form] = profile
+        return
+
+    # the store keeps profiles in the vocabulary-independent form only
+    profile = load_profile(store_path, digest, N)
+    if profile is not None:
+        _profiles[digest, N, form] = to_compact_profile(profile, N) if form == 'compact' else profile
+        return
+    orders = [order for order in _sweep if (digest, order, form) not in _profiles
+              and (order == N or not has_profile(store_path, digest, order))]
+    for order, profile in n_grams_orders(data, orders).items():
+        save_profile(store_path, digest, order, profile)
+        _profiles[digest, order, form] = to_compact_profile(profile, order) if form == 'compact' else profile
+
+
+def set_sweep(orders=()) -> None:
+    """
+    Sets the N that books are profiled with together, e.g. when the configurations of all the N
+    are processed one after another (see corpus_processing.main_processing()); none by default.
+
+    :param orders: iterable of N
+    :return: None
+    """
+    global _sweep
+    _sweep = tuple(orders)
+
+
+def profile_by_digest(digest: str, N: int, form: str = 'counter'):
+    """
+    Returns the profile of the book that has been profiled before (in this process or in the feature store)
+    by the digest of its text, so the text itself is not needed (e.g. in worker processes).
+
+    :param digest: digest of the book text (see text_digest())
+    :param N: parameter for N-grams
+    :param form: one of PROFILE_FORMS
+    :return: profile of the book
+    """
+    key = (digest, N, form)
+    profile = _profiles.get(key)
+    if profile is not None:
+        return profile
+
+    if form == 'counter':
+        store_path = get_store()
+        if store_path is not None:
+            profile = load_profile(store_path, digest, N)
+        if profile is None:
+            raise LookupError(f'The book {digest} has not been profiled with N={N}')
+    elif form == 'compact':
+        profile = to_compact_profile(profile_by_digest(digest, N), N)
+    elif form == 'minhash':
+        profile = minhash_profile(profile_by_digest(digest, N, 'compact'))
+    else:
+        raise ValueError(f'Unknown profile form {form!r}, expected one of {PROFILE_FORMS}')
+
+    _profiles[key] = profile
+    return profile
+
+
+def corpus_profiles(litcorpus: dict, N: int, form: str = 'counter') -> dict:
+    """
+    Applies book_profile() to every book of the corpus.
+
+    :param litcorpus: the output dict of text_fetcher()
+    :param N: parameter for N-grams; in this project (N = 2; N = 3; N = 4) are conventionally used
+    :param form: one of PROFILE_FORMS
+    :return: dictionary of the form {name of the book: profile}
+    """
+    profiles = {}
+    for name, text in litcorpus.items():
+        with stage('ngram', name):
+            profiles[name] = book_profile(text, N, form)
+    return profiles
+
+
+def clear_profiles(orders=None) -> None:
+    """
+    Drops the profiles kept in memory (e.g. when switching to another configuration).
+
+    :param orders: iterable of N which profiles are dropped; all of them by default
+    :return: None
+    """
+    if orders is None:
+        _profiles.clear()
+        return
+    orders = set(orders)
+    for key in [key for key in _profiles if key[1] in orders]:
+        del _profiles[key]
@@ -1,13 +1,191 @@
+import multiprocessing
 import sys
+import threading
+import time
+
+
+"""
+This module reports the progress of long-running loops (see Progress).
+    Output:
+        a terminal (TTY): a bar with the throughput and ETA, redrawn at most every REFRESH_INTERVAL seconds
+        anything else (logs of batch jobs): a line every LOG_INTERVAL seconds and a line at the end
+Work done in worker processes is counted in shared memory: the main process creates the counter
+(start_shared_progress()) and hands it to the workers (set_progress_counter() in their initializer),
+workers count their work with report_progress() and only the main process prints, so the output is never garbled.
+Progress is thread-safe, so threads can update the same one.
+"""
+
+
+BAR_LENGTH = 50  # progress bar length (in symbols)
+REFRESH_INTERVAL = 0.1
+LOG_INTERVAL = 30.0
+
+# counter of the work done in the worker processes (see start_shared_progress())
+_counter = None
+# work counted by report_progress() but not yet added to the shared counter
+_pending = 0
+_pushed_at = 0.0
+
+
+def _duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f'{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+class Progress:
+    """
+    Progress of a loop: update() it as the work is done (or count the work in the worker processes,
+    see report_progress()) and close() it at the end; use it as a context manager.
+
+    :param total: amount of work
+    :param label: name of the loop in the log lines (e.g. the name of the function)
+    :param shared: whether the work counted in the worker processes is counted as well (see start_shared_progress())
+    :param stream: where the progress is printed; sys.stdout by default
+    """
+
+    def __init__(self, total: int, label: str = 'progress', shared: bool = False, stream=None):
+        self.total = total
+        self.label = label
+        self.stream = stream or sys.stdout
+        isatty = getattr(self.stream, 'isatty', None)
+        self.tty = bool(isatty and isatty())
+        self.interval = REFRESH_INTERVAL if self.tty else LOG_INTERVAL
+        self._counter = _counter if shared else None
+        self._counter_start = self._counter.value if self._counter is not None else 0
+        self._done = 0
+        self._lock = threading.Lock()
+        self._started = self._drawn_at = time.monotonic()
+        self._closed = threading.Event()
+        self._ticker = None
+        if self._counter is not None and total:
+            # the work of the workers is not reported to this process, so the progress is redrawn on its own
+            self._ticker = threading.Thread(target=self._tick, daemon=True)
+            self._ticker.start()
+
+    @property
+    def shared(self) -> bool:
+        return self._counter is not None
+
+    @property
+    def done(self) -> int:
+        if self._counter is None:
+            return self._done
+        return self._done + self._counter.value - self._counter_start
+
+    def update(self, amount: int = 1) -> None:
+        with self._lock:
+            self._done += amount
+            now = time.monotonic()
+            # the last state is drawn by close()
+            if now - self._drawn_at >= self.interval and self.done < self.total:
+                self._draw(now)
+
+    def _tick(self) -> None:
+        while not self._closed.wait(self.interval):
+            with self._lock:
+                self._draw(time.monotonic())
+
+    def _draw(self, now: float, final: bool = False) -> None:
+        self._drawn_at = now
+        done = min(self.done, self.total)
+        if not self.total or (final and not self.tty and done == 0):
+            return
+        fraction = done / self.total
+        elapsed = now - self._started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        if done >= self.total:
+            timing = f'{rate:.1f}/s, {_duration(elapsed)}'
+        else:
+            timing = f'{rate:.1f}/s, ETA {_duration((self.total - done) / rate) if rate else "?"}'
+
+        if self.tty:
+            filled_length = int(BAR_LENGTH * fraction)
+            bar = '█' * filled_length + '-' * (BAR_LENGTH - filled_length)
+            self.stream.write(f'\r|{bar}| {int(100 * fraction)}% ({done}/{self.total}) {timing}\033[K')
+            if final:
+                self.stream.write('\n')  # Newstring at the end
+        else:
+            self.stream.write(f'[{self.label}] /// {int(100 * fraction)}% ({done}/{self.total}), {timing}\n')
+        self.stream.flush()
+
+    def close(self) -> None:
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._ticker is not None:
+            self._ticker.join()
+        with self._lock:
+            self._draw(time.monotonic(), final=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def start_shared_progress():
+    """
+    Creates the counter of the work done in the worker processes (pass it to set_progress_counter() in them);
+    Progress(..., shared=True) counts it from now on.
+
+    :return: the shared counter
+    """
+    global _counter
+    _counter = multiprocessing.Value('q', 0)
+    return _counter
+
+
+def stop_shared_progress() -> None:
+    global _counter
+    _counter = None
+
+
+def set_progress_counter(counter) -> None:
+    """
+    Sets the counter report_progress() adds to (in the initializer of a worker process).
+    """
+    global _counter, _pending
+    _counter = counter
+    _pending = 0
+
+
+def report_progress(amount: int = 1) -> None:
+    """
+    Counts work done in a worker process. The shared counter is updated at most every REFRESH_INTERVAL seconds;
+    call flush_progress() at the end of the task.
+    """
+    global _pending
+    if _counter is None:
+        return
+    _pending += amount
+    if time.monotonic() - _pushed_at >= REFRESH_INTERVAL:
+        flush_progress()
+
+
+def flush_progress() -> None:
+    global _pending, _pushed_at
+    if _counter is None or not _pending:
+        return
+    with _counter.get_lock():
+        _counter.value += _pending
+    _pending = 0
+    _pushed_at = time.monotonic()
+
+
+_bar = None
 
 
 def progress_bar(total, current):
-    bar_length = 50  # progress bar length (in symbols)
-    fraction = current / total
-    filled_length = int(bar_length * fraction)
-    bar = '█' * filled_length + '-' * (bar_length - filled_length)
-    percent = int(100 * fraction)
-    sys.stdout.write(f'\r|{bar}| {percent}% ({current}/{total})')
-    sys.stdout.flush()
-    if current == total:
-        print()  # Newstring at the end
+    """
+    Progress of a loop that counts from 1 to total (a Progress is created for the loop).
+    """
+    global _bar
+    if _bar is None or _bar.total != total or current <= _bar.done:
+        if _bar is not None:
+            _bar.close()
+        _bar = Progress(total)
+    _bar.update(current - _bar.done)
+    if current >= total:
+        _bar.close()
+        _bar = None
@@ -0,0 +1,268 @@
+import argparse
+import io
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from main import extract_features, compare_library, library_books, library_profile, read_book_lines
+from ml import SAME_AUTHOR
+from model_registry import get_model
+from feature_store import set_store
+
+
+"""
+This module implements a long-running similarity service: the morphological analyser, trained models
+and profiles of the reference books stay in memory between requests, so a request costs only the processing
+of its own texts.
+    Endpoints (JSON in, JSON out):
+        GET /health
+        POST /compare {"text1" or "path1", "text2" or "path2", "n", "lemmatise"} -> features and prediction
+        POST /library {"path", "n", "lemmatise"} -> ranking of the authors of the library (see main.compare_library())
+Requests are handled by a bounded pool of worker threads; requests that do not fit into the queue are rejected
+with 503. Predictions of concurrent /compare requests are batched into a single model call.
+
+Usage:
+    python service.py --stats-path path/to/project/root/ --library path/to/library/ --port 8765
+"""
+
+
+class Overloaded(Exception):
+    pass
+
+
+class PredictionBatcher:
+    """
+    Collects feature vectors of concurrent requests and classifies them with one predict call per configuration:
+    a batch is closed when it has max_batch vectors or max_delay seconds have passed since its first vector.
+    """
+
+    def __init__(self, stats_path: str, max_batch: int = 64, max_delay: float = 0.005):
+        self.stats_path = stats_path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='prediction-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, features: list, n: int, lemmatise: bool) -> Future:
+        """
+        :return: future of (prediction, probability of the same authorship)
+        """
+        future = Future()
+        self._queue.put((features, n, lemmatise, future))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            configurations = {}
+            for item in batch:
+                configurations.setdefault((item[1], item[2]), []).append(item)
+            for (n, lemmatise), items in configurations.items():
+                try:
+                    scaler, model = get_model(self.stats_path, n, lemmatise)
+                    features = scaler.transform(np.array([item[0] for item in items], dtype=np.float64))
+                    predictions = model.predict(features).tolist()
+                    probabilities = model.predict_proba(features)[:, list(model.classes_).index(SAME_AUTHOR)]
+                except Exception as error:
+                    for item in items:
+                        item[3].set_exception(error)
+                    continue
+                for item, prediction, probability in zip(items, predictions, probabilities.tolist()):
+                    item[3].set_result((prediction, probability))
+
+
+class SimilarityService:
+    """
+    :param stats_path: path to the directory with the folders of values (models are trained on them)
+    :param library_path: path to the reference library for /library requests (its profiles are loaded at start)
+    :param workers: number of worker threads
+    :param max_pending: number of requests that may wait for a worker; the rest are rejected
+    :param n: parameter for N-grams the library is warmed up with
+    :param lemmatise: whether the library is warmed up with lemmatised profiles
+    :param feature_store: whether profiles are kept in the feature store of stats_path
+    """
+
+    def __init__(self, stats_path: str, library_path: str = None, workers: int = 4, max_pending: int = 64,
+                 n: int = 3, lemmatise: bool = False, feature_store: bool = True):
+        self.stats_path = stats_path
+        self.library_path = library_path
+        self.feature_store = feature_store
+        set_store(os.path.join(stats_path, 'feature_store') if feature_store else None)
+
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='similarity-worker')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self.batcher = PredictionBatcher(stats_path)
+
+        get_model(stats_path, n, lemmatise)
+        if library_path is not None:
+            books_amount = sum(1 for book_path in library_books(library_path)
+                               if library_profile(book_path, n, lemmatise) is not None)
+            print(f'[SimilarityService] /// {books_amount} library books are loaded')
+
+    def submit(self, function, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise Overloaded('Too many pending requests')
+        future = self.executor.submit(function, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    @staticmethod
+    def _book_lines(request: dict, key: str) -> list:
+        # texts are split into lines the same way as .txt books are read (see writers_and_readers.txt_linesreader())
+        if f'text{key}' in request:
+            return list(io.StringIO(request[f'text{key}'].replace('\r\n', '\n').replace('\r', '\n')))
+        if f'path{key}' in request:
+            return read_book_lines(request[f'path{key}'])
+        raise ValueError(f'Either text{key} or path{key} is required')
+
+    def compare(self, request: dict) -> dict:
+        n = int(request.get('n', 3))
+        lemmatise = bool(request.get('lemmatise', False))
+        # the texts of the requests are not kept, so the memory of the service is bounded by its library
+        features = extract_features(self._book_lines(request, '1'), self._book_lines(request, '2'),
+                                    n=n, lemmatise=lemmatise, cache=False)
+        prediction, probability = self.batcher.submit(features, n, lemmatise).result()
+        return {'features': features, 'prediction': prediction, 'same_author': prediction == SAME_AUTHOR,
+                'probability': probability}
+
+    def library(self, request: dict) -> dict:
+        library_path = request.get('library', self.library_path)
+        if library_path is None:
+            raise ValueError('The service has no library; pass "library" with the request')
+        ranking = compare_library(request['path'], library_path, self.stats_path, n=int(request.get('n', 3)),
+                                  lemmatise=bool(request.get('lemmatise', False)), feature_store=self.feature_store)
+        return {'ranking': ranking}
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    service = None
+    routes = {'/compare': 'compare', '/library': 'library'}
+
+    def _reply(self, status: int, body: dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._reply(200, {'status': 'ok'})
+        else:
+            self._reply(404, {'error': f'Unknown endpoint {self.path}'})
+
+    def do_POST(self):
+        if self.path not in self.routes:
+            self._reply(404, {'error': f'Unknown endpoint {self.path}'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            future = self.service.submit(getattr(self.service, self.routes[self.path]), request)
+            self._reply(200, future.result())
+        except Overloaded as error:
+            self._reply(503, {'error': str(error)})
+        except (ValueError, KeyError, OSError) as error:
+            self._reply(400, {'error': f'{type(error).__name__}: {error}'})
+        except Exception as error:
+            self._reply(500, {'error': f'{type(error).__name__}: {error}'})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    # the default backlog of 5 connections makes bursts of clients wait for TCP retransmissions
+    request_queue_size = 128
+
+
+def make_server(service: SimilarityService, host: str = '127.0.0.1', port: int = 8765) -> ThreadingHTTPServer:
+    """
+    :return: HTTP server of the service (call serve_forever() to run it; port 0 picks a free port)
+    """
+    handler = type('RequestHandler', (_RequestHandler,), {'service': service})
+    server = _Server((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+class ServiceClient:
+    """
+    Client of the similarity service.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, timeout: float = 600):
+        self.url = f'http://{host}:{port}'
+        self.timeout = timeout
+
+    def _request(self, path: str, body: dict = None) -> dict:
+        data = None if body is None else json.dumps(body, ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(self.url + path, data=data,
+                                         headers={'Content-Type': 'application/json; charset=utf-8'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def health(self) -> dict:
+        return self._request('/health')
+
+    def compare(self, book1: str = None, book2: str = None, text1: str = None, text2: str = None,
+                n: int = 3, lemmatise: bool = False) -> dict:
+        """
+        Books are given either as paths (book1, book2) or as texts (text1, text2).
+        """
+        body = {'n': n, 'lemmatise': lemmatise}
+        body.update({'path1': book1} if text1 is None else {'text1': text1})
+        body.update({'path2': book2} if text2 is None else {'text2': text2})
+        return self._request('/compare', body)
+
+    def library(self, book: str, library: str = None, n: int = 3, lemmatise: bool = False) -> dict:
+        body = {'path': book, 'n': n, 'lemmatise': lemmatise}
+        if library is not None:
+            body['library'] = library
+        return self._request('/library', body)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='LitSim similarity service')
+    parser.add_argument('--stats-path', required=True)
+    parser.add_argument('--library')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-pending', type=int, default=64)
+    parser.add_argument('--n', type=int, default=3)
+    parser.add_argument('--lemmatise', action='store_true')
+    args = parser.parse_args()
+
+    similarity_service = SimilarityService(args.stats_path, args.library, workers=args.workers,
+                                           max_pending=args.max_pending, n=args.n, lemmatise=args.lemmatise)
+    http_server = make_server(similarity_service, args.host, args.port)
+    print(f'[service] /// Listening on http://{args.host}:{args.port}')
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        similarity_service.shutdown()
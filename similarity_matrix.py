@@ -0,0 +1,173 @@
+import numpy as np
+
+
+"""
+This module measures similarity of all the pairs of books at once.
+A corpus of compact profiles (see n_grams.CompactProfile) is turned into sparse document × n-gram matrices (CSR),
+pairwise values are then computed with sparse matrix products. All values are exactly the same as the ones
+of statistical_methods.jaccard_sorted() and statistical_methods.tanimoto_sorted(), i.e. the same as the ones
+of jaccard() and tanimoto() unless hashed n-gram keys collide (possible for N > 2 only, see n_grams.py).
+scipy is imported on the first use, so that importing the module (e.g. for query_similarities()) stays cheap.
+"""
+
+
+def profile_matrices(profiles: list) -> tuple:
+    """
+    :param profiles: list of n_grams.CompactProfile encoded with the same vocabulary
+    :return: (document × n-gram counts matrix, document × vocabulary binary matrix)
+    """
+    return (_keys_matrix([p.ngram_keys for p in profiles], [p.ngram_counts for p in profiles]),
+            _keys_matrix([p.vocab_ids for p in profiles], None))
+
+
+def _keys_matrix(keys: list, counts) -> 'sparse.csr_matrix':
+    from scipy import sparse
+
+    lengths = [len(k) for k in keys]
+    indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    all_keys = np.concatenate(keys) if keys else np.empty(0, dtype=np.uint64)
+    columns, indices = np.unique(all_keys, return_inverse=True)
+    if counts is None:
+        data = np.ones(len(all_keys), dtype=np.int64)
+    else:
+        data = np.concatenate(counts).astype(np.int64) if counts else np.empty(0, dtype=np.int64)
+    # keys of every profile are sorted, so the column indices of every row are sorted as well
+    return sparse.csr_matrix((data, indices.ravel(), indptr), shape=(len(keys), len(columns)))
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    result = np.zeros(numerator.shape, dtype=np.float64)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result
+
+
+def jaccard_matrix(matrix: 'sparse.csr_matrix') -> np.ndarray:
+    """
+    Pairwise Jaccard coefficients of the rows of the matrix (only the non-zero pattern matters).
+    """
+    binary = matrix.copy()
+    binary.data = np.ones_like(binary.data)
+    intersection = (binary @ binary.T).toarray()
+    sizes = binary.getnnz(axis=1).astype(np.int64)
+    union = sizes[:, None] + sizes[None, :] - intersection
+    return _ratio(intersection, union)
+
+
+def tanimoto_matrix(matrix: 'sparse.csr_matrix') -> np.ndarray:
+    """
+    Pairwise Tanimoto coefficients of the rows of the counts matrix.
+    The sum of minimums is decomposed by count levels v_1 < v_2 < ... :
+        min(x, y) = sum over l of (v_l - v_(l-1)) * [x >= v_l] * [y >= v_l]
+    so it becomes a sum of binary matrix products; high levels hold few n-grams, so their products are cheap.
+    """
+    from scipy import sparse
+
+    n = matrix.shape[0]
+    sum_min = np.zeros((n, n), dtype=np.int64)
+
+    # entries that are still >= the current level; every level drops the entries equal to the previous one
+    rows = np.repeat(np.arange(n), np.diff(matrix.indptr))
+    columns = matrix.indices
+    values = matrix.data
+    previous_level = 0
+    for level in np.unique(values):
+        alive = values >= level
+        rows, columns, values = rows[alive], columns[alive], values[alive]
+        binary = sparse.csr_matrix((np.ones(len(values), dtype=np.int64), (rows, columns)), shape=matrix.shape)
+        sum_min += int(level - previous_level) * (binary @ binary.T).toarray()
+        previous_level = level
+
+    row_sums = np.asarray(matrix.sum(axis=1), dtype=np.int64).ravel()
+    sum_max = row_sums[:, None] + row_sums[None, :] - sum_min
+    return _ratio(sum_min, sum_max)
+
+
+def similarity_matrices(profiles: list) -> dict:
+    """
+    :param profiles: list of n_grams.CompactProfile encoded with the same vocabulary
+    :return: dictionary of the form {name of the measure: documents × documents matrix}
+    """
+    ngram_matrix, vocab_matrix = profile_matrices(profiles)
+    return {'jaccard_ngram': jaccard_matrix(ngram_matrix),
+            'jaccard_vocab': jaccard_matrix(vocab_matrix),
+            'tanimoto_ngram_counter': tanimoto_matrix(ngram_matrix)}
+
+
+def pairs_stats(matrices: dict, pairs) -> dict:
+    """
+    Emits the values of the pairs in the same form as corpus_processing.similarity_measurer().
+
+    :param matrices: the output of similarity_matrices()
+    :param pairs: iterable of (name of the first book, its row, name of the second book, its row)
+    :return: dictionary of the form {'book1 – book2': {name of the measure: value}}
+    """
+    stats_dict = {}
+    for name1, i, name2, j in pairs:
+        stats_dict[f'{name1} – {name2}'] = {measure: float(matrix[i, j]) for measure, matrix in matrices.items()}
+    return stats_dict
+
+
+_FILTER_BITS = 22
+
+
+def _query_matches(query_keys: np.ndarray, keys: list) -> tuple:
+    """
+    Looks up every key of every profile in the (sorted, unique) keys of the query at once.
+    Most keys are rejected by a bitmap of the query keys, only the rest are binary searched.
+
+    :return: (index of every matched key among the concatenated keys of the profiles,
+              index of its profile, its position in the query keys)
+    """
+    ends = np.cumsum([len(k) for k in keys], dtype=np.int64)
+    all_keys = np.concatenate(keys).astype(np.uint64) if keys else np.empty(0, dtype=np.uint64)
+    if len(query_keys) == 0 or len(all_keys) == 0:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, empty
+
+    mask = np.uint64((1 << _FILTER_BITS) - 1)
+    shift = np.uint64(32)
+    query_keys64 = query_keys.astype(np.uint64)
+    bitmap = np.zeros(1 << _FILTER_BITS, dtype=bool)
+    bitmap[(query_keys64 ^ (query_keys64 >> shift)) & mask] = True
+    candidates = np.flatnonzero(bitmap[(all_keys ^ (all_keys >> shift)) & mask])
+
+    positions = np.searchsorted(query_keys64, all_keys[candidates])
+    positions[positions == len(query_keys)] = 0
+    found = query_keys64[positions] == all_keys[candidates]
+    matched = candidates[found]
+    return matched, np.searchsorted(ends, matched, side='right'), positions[found]
+
+
+def query_similarities(query, profiles: list) -> dict:
+    """
+    Measures similarity of one profile to every profile of the list in a single vectorised pass
+    over the keys of all the profiles (the pairs of the profiles of the list are not measured).
+    All values are the same as the ones of similarity_matrices() (see the module docstring on N > 2).
+
+    :param query: n_grams.CompactProfile
+    :param profiles: list of n_grams.CompactProfile encoded with the same vocabulary as the query
+    :return: dictionary of the form {name of the measure: array of values in the order of the profiles}
+    """
+    n = len(profiles)
+
+    matched, rows, positions = _query_matches(query.ngram_keys, [p.ngram_keys for p in profiles])
+    sizes = np.array([len(p.ngram_keys) for p in profiles], dtype=np.int64)
+    intersection = np.bincount(rows, minlength=n).astype(np.int64)
+    jaccard_ngram = _ratio(intersection, len(query.ngram_keys) + sizes - intersection)
+
+    counts = np.concatenate([p.ngram_counts for p in profiles]).astype(np.int64) if profiles \
+        else np.empty(0, dtype=np.int64)
+    minimums = np.minimum(counts[matched], query.ngram_counts.astype(np.int64)[positions])
+    # float64 sums of integer counts are exact (far below 2^53)
+    sum_min = np.bincount(rows, weights=minimums, minlength=n).astype(np.int64)
+    row_sums = np.array([int(p.ngram_counts.sum()) for p in profiles], dtype=np.int64)
+    tanimoto_ngram_counter = _ratio(sum_min, int(query.ngram_counts.sum()) + row_sums - sum_min)
+
+    _, rows, _ = _query_matches(query.vocab_ids, [p.vocab_ids for p in profiles])
+    sizes = np.array([len(p.vocab_ids) for p in profiles], dtype=np.int64)
+    intersection = np.bincount(rows, minlength=n).astype(np.int64)
+    jaccard_vocab = _ratio(intersection, len(query.vocab_ids) + sizes - intersection)
+
+    return {'jaccard_ngram': jaccard_ngram,
+            'jaccard_vocab': jaccard_vocab,
+            'tanimoto_ngram_counter': tanimoto_ngram_counter}
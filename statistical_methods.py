@@ -1,4 +1,4 @@
-from scipy import stats
+import numpy as np
 
 
 """
@@ -24,12 +24,53 @@ def jaccard(a: set, b: set) -> float:
     return len(intersection) / len(union) if union else 0.0
 
 
+def _matches(a_keys: np.ndarray, b_keys: np.ndarray):
+    # merge-style lookup of the (sorted, unique) keys a in the (sorted, unique) keys b
+    if len(a_keys) > len(b_keys):
+        b_idx, a_idx = _matches(b_keys, a_keys)
+        return a_idx, b_idx
+    if len(a_keys) == 0 or len(b_keys) == 0:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty
+    b_idx = np.searchsorted(b_keys, a_keys)
+    b_idx[b_idx == len(b_keys)] = 0
+    found = b_keys[b_idx] == a_keys
+    return np.flatnonzero(found), b_idx[found]
+
+
+def jaccard_sorted(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Measures Jaccard coefficient for the sets given as sorted arrays of unique keys (see n_grams.CompactProfile).
+    Gives the same value as jaccard() without building intersection and union sets
+    (for N > 2 only if no two distinct n-grams share a hashed key, see n_grams.encode_n_grams()).
+    """
+    intersection = len(_matches(a, b)[0])
+    union = len(a) + len(b) - intersection
+    return intersection / union if union else 0.0
+
+
+def tanimoto_sorted(a_keys: np.ndarray, a_counts: np.ndarray, b_keys: np.ndarray, b_counts: np.ndarray) -> float:
+    """
+    Measures Tanimoto coefficient for the weighted sets given as sorted arrays of unique keys and their counts.
+    Gives the same value as tanimoto() (barring collisions of the hashed keys of N > 2, as for jaccard_sorted()):
+    sum of maximums is derived from the sum of minimums, because min(x, y) + max(x, y) = x + y,
+    so the union of keys is never built.
+    """
+    a_idx, b_idx = _matches(a_keys, b_keys)
+    sum_min = int(np.minimum(a_counts[a_idx], b_counts[b_idx]).sum())
+    sum_max = int(a_counts.sum()) + int(b_counts.sum()) - sum_min
+    return sum_min / sum_max if sum_max != 0 else 0.0
+
+
 def ttest_independent(list_1, list_2):
+    from scipy import stats
     t_stat, p_value = stats.ttest_ind(list_1, list_2, nan_policy='omit')
     return t_stat, p_value
 
 
 def ttest_related(list_1, list_2):
+    from scipy import stats
+
     if len(list_1) >= len(list_2):
         bigger_list = list_1
         smaller_list = list_2
@@ -11,31 +11,58 @@ def complex_cleaner(sentence) -> str:
     return str(sentence)
 
 
-def punctuation_cleaning(sentence: str) -> str:
-    cleaned = []
+def stream_cleaner(pieces):
+    """
+    Applies complex_cleaner() piece by piece. If the pieces are separated by whitespace,
+    ' '.join() of the yielded pieces is exactly complex_cleaner() of the whole text.
+    """
+    for piece in pieces:
+        # pieces that consist of whitespace and punctuation only disappear in the whole text as well
+        piece = punctuation_cleaning(piece)
+        if piece:
+            yield roman_numerals_cleaner(arabic_numerals_cleaner(piece))
+
 
-    for char in sentence:
-        if char.isspace():
-            cleaned.append(' ')
+class _CleaningTable(dict):
+    """
+    Translation table of punctuation_cleaning(): whitespace and zero-width characters become spaces,
+    punctuation and symbols (P* and S* Unicode categories) are dropped, the rest is kept.
+    The table is filled lazily, so only the characters that actually occur in the texts are ever categorised.
+    """
+
+    def __missing__(self, code: int):
+        char = chr(code)
+        if char.isspace() or char in ZERO_WIDTH_CHARS:
+            value = ' '
         elif unicodedata.category(char).startswith(('P', 'S')):
-            continue
-        elif char in {'\u200b', '\ufeff'}:
-            cleaned.append(' ')
+            value = None
         else:
-            cleaned.append(char)
+            value = char
+        self[code] = value
+        return value
+
 
-    return ' '.join(''.join(cleaned).split())
+ZERO_WIDTH_CHARS = {'\u200b', '\ufeff'}
+
+CLEANING_TABLE = _CleaningTable()
+DIGITS_PATTERN = re.compile(f'[{string.digits}]+')
+# only matches standalone patterns; the lookahead lets the regex skip the positions where only an empty match
+# (which changes nothing) is possible
+ROMAN_PATTERN = re.compile(r'(?=[MDCLXVI])\bM{0,4}(?:CM|CD|D?C{0,3})(?:XC|XL|L?X{0,3})(?:IX|IV|V?I{0,3})\b',
+                           flags=re.IGNORECASE)
+
+
+def punctuation_cleaning(sentence: str) -> str:
+    return ' '.join(sentence.translate(CLEANING_TABLE).split())
 
 
 def arabic_numerals_cleaner(sentence):
-    sentence = sentence.translate(str.maketrans("", "", string.digits))
+    sentence = DIGITS_PATTERN.sub('', sentence)
 
     return sentence
 
 
 def roman_numerals_cleaner(text):
-    # only matches standalone patterns
-    roman_pattern = r'\bM{0,4}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})\b'
-    cleaned_text = re.sub(roman_pattern, '', text, flags=re.IGNORECASE)
+    cleaned_text = ROMAN_PATTERN.sub('', text)
 
     return cleaned_text
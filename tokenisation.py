@@ -0,0 +1,120 @@
+import re
+import threading
+
+
+"""
+This module implements the tokenizers that split texts into sentences and sentences into words
+(see corpus_processing.lemmatised_sentences() and n_grams.iter_tokenized_sentences()).
+A tokenizer is one of TOKENIZERS:
+    'punkt': NLTK Punkt sentences and Treebank words, exactly as nltk.tokenize.sent_tokenize() and word_tokenize();
+        the models are loaded once per process and language
+    'regex': regular expressions for Russian prose: sentences end with . ! ? … (and closing quotes or brackets)
+        followed by a capital letter, a digit, an opening quote or a dash; initials and common abbreviations
+        do not end sentences; words are runs of word characters (with inner hyphens and apostrophes),
+        punctuation marks are separate tokens. Several times faster than 'punkt', the sentences and words
+        are not always the same (see benchmarks/bench_tokenisation.py)
+The tokenizer of the process is set with set_tokenizer(); texts processed with different tokenizers have
+different digests (see profiles.text_digest()), so their profiles and measured values never mix.
+"""
+
+
+DEFAULT_TOKENIZER = 'punkt'
+
+
+class PunktTokenizer:
+    name = 'punkt'
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+        self._treebank = None
+
+    def _model(self, language: str):
+        model = self._models.get(language)
+        if model is None:
+            with self._lock:
+                model = self._models.get(language)
+                if model is None:
+                    from nltk.tokenize import PunktTokenizer as PunktModel, NLTKWordTokenizer
+                    model = PunktModel(language)
+                    self._treebank = NLTKWordTokenizer()
+                    self._models[language] = model
+        return model
+
+    def sentences(self, text: str, language: str = 'english') -> list:
+        return self._model(language).tokenize(text)
+
+    def words(self, sentence: str, language: str = 'english') -> list:
+        # nltk.tokenize.word_tokenize() splits the text into sentences first
+        return [token for part in self.sentences(sentence, language) for token in self._treebank.tokenize(part)]
+
+
+ABBREVIATIONS = frozenset((
+    'т', 'е', 'д', 'п', 'пр', 'др', 'г', 'гг', 'в', 'вв', 'ул', 'им', 'см', 'ср', 'стр', 'с', 'рис', 'табл',
+    'тыс', 'млн', 'млрд', 'руб', 'коп', 'проф', 'акад', 'доц', 'св', 'ст', 'кн', 'гр', 'г-н', 'г-жа', 'н', 'э',
+    'напр', 'etc', 'mr', 'mrs', 'dr', 'st', 'vs',
+))
+
+
+class RegexTokenizer:
+    name = 'regex'
+
+    # a sentence end candidate: the terminal punctuation with the closing quotes and brackets after it
+    SENTENCE_END = re.compile(r'[.!?…]+[»"”\')\]]*(?=\s+[«"“„(\[—–-]*\s*[A-ZА-ЯЁ0-9])')
+    LAST_WORD = re.compile(r'([\w-]+)$')
+    WORD = re.compile(r"\w+(?:[-'’]\w+)*|[^\w\s]+")
+
+    def sentences(self, text: str, language: str = 'english') -> list:
+        sentences = []
+        start = 0
+        for match in self.SENTENCE_END.finditer(text):
+            if match.group().startswith('.') and not match.group().startswith('..'):
+                last_word = self.LAST_WORD.search(text, max(start, match.start() - 16), match.start())
+                # initials ("А. С. Пушкин") and abbreviations ("т. е.", "г. Москва") do not end sentences
+                if last_word is not None and (len(last_word.group()) == 1 and last_word.group().isupper()
+                                              or last_word.group().lower() in ABBREVIATIONS):
+                    continue
+            sentence = text[start:match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        sentence = text[start:].strip()
+        if sentence:
+            sentences.append(sentence)
+        return sentences
+
+    def words(self, sentence: str, language: str = 'english') -> list:
+        return self.WORD.findall(sentence)
+
+
+TOKENIZERS = {'punkt': PunktTokenizer, 'regex': RegexTokenizer}
+
+_tokenizers = {}
+_tokenizer_name = DEFAULT_TOKENIZER
+
+
+def set_tokenizer(name: str = DEFAULT_TOKENIZER) -> None:
+    """
+    Sets the tokenizer of the process.
+
+    :param name: one of TOKENIZERS
+    :return: None
+    """
+    global _tokenizer_name
+    if name not in TOKENIZERS:
+        raise ValueError(f'Unknown tokenizer {name!r}, expected one of {tuple(TOKENIZERS)}')
+    _tokenizer_name = name
+
+
+def get_tokenizer(name: str = None):
+    """
+    :param name: one of TOKENIZERS; the one set with set_tokenizer() by default
+    :return: the tokenizer (one instance per process, so the models are loaded only once)
+    """
+    name = _tokenizer_name if name is None else name
+    tokenizer = _tokenizers.get(name)
+    if tokenizer is None:
+        if name not in TOKENIZERS:
+            raise ValueError(f'Unknown tokenizer {name!r}, expected one of {tuple(TOKENIZERS)}')
+        tokenizer = _tokenizers.setdefault(name, TOKENIZERS[name]())
+    return tokenizer
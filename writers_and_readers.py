@@ -1,81 +1,226 @@
-from lxml import etree
-from ebooklib import epub
-import ebooklib
-from bs4 import BeautifulSoup
+import codecs
+import io
+import os
 
 
 NSMAP = {'fictionbook': 'http://www.gribuser.ru/xml/fictionbook/2.0'}
 
 
-def detect_encoding(file_path: str):
-    encoding = "utf-8"
+"""
+Code section with encoding detection.
+    Only a bounded prefix of a file is sniffed (see SNIFF_SIZE), and the result is cached per file path and mtime,
+    so every book is decoded exactly once.
+"""
+
+
+SNIFF_SIZE = 1 << 16
+
+_BOMS = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+
+_encodings = {}
+
+
+def sniff_encoding(sample: bytes, complete: bool = True) -> str:
+    """
+    Guesses the encoding of the text by its sample: BOM, then UTF-8, then UTF-16 without BOM, then cp1251.
+
+    :param sample: first bytes of the text
+    :param complete: whether the sample is the whole text (otherwise it may end in the middle of a character)
+    :return: name of the encoding
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+
     try:
-        l = open(file_path, 'r', encoding='utf-8').read()
-        if l.startswith("\ufeff"):
-            encoding = "utf-8-sig"
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=complete)
+        return 'utf-8'
     except UnicodeDecodeError:
+        pass
+
+    # UTF-16 texts without BOM are full of zero bytes (Latin letters, digits, punctuation and spaces),
+    # cp1251 texts have none
+    if sample.count(b'\x00') * 4 >= len(sample):
+        zeros_at_odd = sample[1::2].count(b'\x00')
+        return 'utf-16-le' if zeros_at_odd * 2 >= sample.count(b'\x00') else 'utf-16-be'
+    return 'cp1251'
+
+
+def detect_encoding(file_path: str) -> str:
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    encoding = _encodings.get(key)
+    if encoding is None:
+        with open(file_path, 'rb') as f:
+            sample = f.read(SNIFF_SIZE)
+        encoding = sniff_encoding(sample, complete=stat.st_size <= SNIFF_SIZE)
+        _encodings[key] = encoding
+    return encoding
+
+
+def _fix_encoding(file_path: str, data: bytes) -> str:
+    """
+    Is used when the sniffed encoding turns out to be wrong past the sniffed prefix:
+    detects the encoding by the whole contents and remembers it.
+    """
+    encoding = sniff_encoding(data)
+    for candidate in (encoding, 'utf-16', 'cp1251'):
         try:
-            open(file_path, 'r', encoding="utf-16").read()
-            encoding = "utf-16"
+            data.decode(candidate)
         except UnicodeError:
-            encoding = "cp1251"
+            continue
+        encoding = candidate
+        break
+    stat = os.stat(file_path)
+    _encodings[(os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)] = encoding
     return encoding
 
 
+def read_text(file_path: str) -> str:
+    """
+    Reads and decodes the whole file with a single read (line endings are translated as in text mode).
+    """
+    encoding = detect_encoding(file_path)
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    try:
+        text = data.decode(encoding)
+    except UnicodeDecodeError:
+        text = data.decode(_fix_encoding(file_path, data))
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
 """
 Code section with readers.
     Included:
         .fb2
         .txt
         .epub
+    Every format has a generator of paragraphs (or chapters), so that a book could be read
+    without keeping its whole raw text in memory, and a reader that returns the whole text.
+    Only lemmatisation is streamed end to end (see corpus_processing.lemmatise_file()); the normalised text
+    the books are profiled on is still put together as a whole (see corpus_processing.book_normalisation()).
+    Parsers of .fb2 and .epub (lxml, ebooklib, bs4) are imported when the first book of the format is read.
 """
 
 
-def fb2reader(fb2_filepath: str) -> str:
-    tree = etree.parse(fb2_filepath)
-    t_root = tree.getroot()
+def fb2_paragraphs(fb2_filepath: str):
+    """
+    Yields stripped text nodes of the paragraphs of the book bodies (in the document order).
+    Paragraphs are dropped from the parsed tree as soon as they are yielded.
+    """
+    from lxml import etree
 
-    bodies = t_root.xpath('//fictionbook:body', namespaces=NSMAP)
+    body_tag = f'{{{NSMAP["fictionbook"]}}}body'
+    p_tag = f'{{{NSMAP["fictionbook"]}}}p'
 
-    book = ''
-    for body in bodies:
-        paragraphs = body.xpath('.//fictionbook:p/text()', namespaces=NSMAP)
-        for p in paragraphs:
-            book += (p.strip()) + ' '
-    return book
+    bodies_depth = 0
+    for event, element in etree.iterparse(fb2_filepath, events=('start', 'end'), tag=(body_tag, p_tag)):
+        if element.tag == body_tag:
+            bodies_depth += 1 if event == 'start' else -1
+            continue
+        if event != 'end' or bodies_depth == 0:
+            continue
 
+        # the same text nodes as the xpath 'p/text()' gives: the text of p and the tails of its children
+        if element.text is not None:
+            yield element.text.strip()
+        for child in element:
+            if child.tail is not None:
+                yield child.tail.strip()
 
-def txt_linesreader(txt_filepath: str) -> list:
+        element.clear(keep_tail=True)
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def fb2reader(fb2_filepath: str) -> str:
+    return ''.join(p + ' ' for p in fb2_paragraphs(fb2_filepath))
+
+
+def txt_paragraphs(txt_filepath: str):
+    """
+    Yields lines of the file (with line endings).
+    If the file turns out not to be in the sniffed encoding past the sniffed prefix, UnicodeDecodeError is raised
+    and the right encoding is remembered, so the next reading succeeds.
+    """
     encoding = detect_encoding(txt_filepath)
     with open(txt_filepath, 'r', encoding=encoding) as f:
-        return f.readlines()
+        try:
+            yield from f
+        except UnicodeDecodeError:
+            f.buffer.seek(0)
+            _fix_encoding(txt_filepath, f.buffer.read())
+            raise
+
+
+def txt_linesreader(txt_filepath: str) -> list:
+    return list(io.StringIO(read_text(txt_filepath)))
 
 
 def txt_reader(txt_filepath: str) -> str:
-    encoding = detect_encoding(txt_filepath)
-    with open(txt_filepath, 'r', encoding=encoding) as f:
-        return f.read()
+    return read_text(txt_filepath)
 
 
-def epub_reader(epub_filepath: str) -> str:
-    try:
-        encoding = detect_encoding(epub_filepath)
+def epub_paragraphs(epub_filepath: str):
+    """
+    Yields texts of the chapters of the book.
+    """
+    import ebooklib
+    from ebooklib import epub
+    from bs4 import BeautifulSoup
 
-        book = epub.read_epub(epub_filepath)
-        chapters = book.get_items_of_type(ebooklib.ITEM_DOCUMENT)
-        full_text = ''
+    book = epub.read_epub(epub_filepath)
+    chapters = book.get_items_of_type(ebooklib.ITEM_DOCUMENT)
 
-        for chapter in chapters:
-            content = chapter.get_content().decode(encoding)
-            soup = BeautifulSoup(content, 'html.parser')
-            chapter_text = soup.get_text().strip()
-            full_text += chapter_text + ' '
+    for chapter in chapters:
+        # the .epub itself is a zip archive, so the encoding is detected per chapter
+        content = chapter.get_content()
+        content = content.decode(sniff_encoding(content))
+        soup = BeautifulSoup(content, 'html.parser')
+        yield soup.get_text().strip()
+
+
+def epub_reader(epub_filepath: str) -> str:
+    from ebooklib import epub
 
-        return full_text
+    try:
+        return ''.join(chapter_text + ' ' for chapter_text in epub_paragraphs(epub_filepath))
     except epub.EpubException:
         return '0'
 
 
+def book_pieces(filepath: str):
+    """
+    Yields the text of the book piece by piece (paragraphs, lines or chapters depending on the format).
+    Joined together, the pieces give exactly the text that the reader of the format returns,
+    and every piece but the last one ends with whitespace.
+
+    :param filepath: path to the .fb2, .txt or .epub book
+    :return: generator of strings
+    """
+    if filepath.endswith('.fb2'):
+        for p in fb2_paragraphs(filepath):
+            yield p + ' '
+    elif filepath.endswith('.epub'):
+        from ebooklib import epub
+
+        try:
+            chapters = epub_paragraphs(filepath)
+            first_chapter = next(chapters, None)
+        except epub.EpubException:
+            yield '0'
+            return
+        if first_chapter is not None:
+            yield first_chapter + ' '
+        for chapter_text in chapters:
+            yield chapter_text + ' '
+    elif filepath.endswith('.txt'):
+        yield from txt_paragraphs(filepath)
+    else:
+        raise ValueError(f'Unsupported book format: {filepath}')
+
+
 """
 Code section with writers.
     Included:
@@ -83,6 +228,25 @@ Code section with writers.
 """
 
 
+def txt_stream_writer(pieces, filepath, encoding='utf-8'):
+    """
+    Writes the pieces of text one by one; the file appears only when all of them are written.
+    """
+    if not filepath.endswith('.txt'):
+        filepath += '.txt'
+
+    tmp_path = f'{filepath}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding=encoding) as f:
+            for piece in pieces:
+                f.write(piece)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, filepath)
+
+
 def txt_writer(data, filepath, encoding='utf-8'):
     if type(data) is not str:
         data = str(data)